@@ -0,0 +1,190 @@
+import json
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable
+from app.config import settings, logger
+from app.metrics import metrics
+from app.schemas.schema_quiz import QuizRead
+
+# redis est optionnel : seulement nécessaire avec QUIZ_CACHE_BACKEND=redis
+try:
+    import redis
+except ImportError: # pragma: no cover
+    redis = None
+
+MEMORY_CACHE_MAX_ENTRIES = 10000
+# Réponses récentes gardées dans l'entrée : un quiz lu en base avant une réponse et mis en cache après ne la réintroduit pas
+ANSWERED_LIMIT = 200
+
+quiz_cache_requests = metrics.counter("quiz_cache_requests_total", "Remaining quiz lookups, by outcome (hit or miss)")
+
+class CacheBackend(ABC):
+    """Key-value store of JSON strings with expiry."""
+
+    @abstractmethod
+    def get(self, key: str) -> str | None:
+        ...
+
+    @abstractmethod
+    def update(self, key: str, func: Callable[[str | None], str | None], ttl: int) -> None:
+        """Atomically replaces the value by func(value). None deletes the key."""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+class MemoryCacheBackend(CacheBackend):
+    """Per-process cache, least recently used entries out first."""
+    def __init__(self, max_entries: int = MEMORY_CACHE_MAX_ENTRIES, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = Lock()
+
+    def _get(self, key: str) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires <= self.clock():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            return self._get(key)
+
+    def update(self, key: str, func: Callable[[str | None], str | None], ttl: int) -> None:
+        with self._lock:
+            value = func(self._get(key))
+            if value is None:
+                self._entries.pop(key, None)
+                return
+            self._entries[key] = (self.clock() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+class RedisCacheBackend(CacheBackend):
+    """Shared between API processes and nodes."""
+    def __init__(self, url: str):
+        if redis is None:
+            raise RuntimeError("QUIZ_CACHE_BACKEND=redis requires the 'redis' package")
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+
+    def get(self, key: str) -> str | None:
+        return self.client.get(key)
+
+    def update(self, key: str, func: Callable[[str | None], str | None], ttl: int) -> None:
+        # Transaction optimiste : recommencée si la clé a changé entre la lecture et l'écriture
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    value = func(pipe.get(key))
+                    pipe.multi()
+                    if value is None:
+                        pipe.delete(key)
+                    else:
+                        pipe.set(key, value, ex=ttl)
+                    pipe.execute()
+                    return
+                except redis.WatchError:
+                    continue
+
+    def delete(self, key: str) -> None:
+        self.client.delete(key)
+
+def create_cache_backend() -> CacheBackend | None:
+    if settings.quiz_cache_backend == "none":
+        return None
+    if settings.quiz_cache_backend == "memory":
+        return MemoryCacheBackend()
+    if settings.quiz_cache_backend == "redis":
+        return RedisCacheBackend(settings.redis_url)
+    raise ValueError(f"Unknown quiz cache backend: {settings.quiz_cache_backend}")
+
+class QuizCache:
+    """Remaining questions of each patient's current quiz, as returned by GET /api/quiz/{n}.
+
+    Answers remove their question from the entry instead of invalidating it.
+    """
+    def __init__(self, backend: CacheBackend | None, ttl: int):
+        self.backend = backend
+        # Les URLs d'images signées dans l'entrée doivent rester valables jusqu'à sa dernière lecture
+        self.ttl = max(1, min(ttl, settings.media_url_ttl_seconds // 2))
+
+    @staticmethod
+    def key(patient_id: int) -> str:
+        return f"quiz:remaining:{patient_id}"
+
+    def _safe_update(self, patient_id: int, func: Callable[[dict], dict | None]) -> None:
+        def update(value: str | None) -> str | None:
+            entry = func(json.loads(value) if value else {"quiz": None, "base_url": None, "answered": []})
+            return json.dumps(entry) if entry is not None else None
+        try:
+            self.backend.update(self.key(patient_id), update, self.ttl)
+        except Exception as e:
+            # Le cache ne doit jamais faire échouer une requête : l'entrée est abandonnée
+            logger.warning(f"Quiz cache update failed for patient {patient_id}: {e}")
+            self.invalidate(patient_id)
+
+    def get(self, patient_id: int, base_url: str) -> QuizRead | None:
+        if self.backend is None:
+            return None
+        try:
+            value = self.backend.get(self.key(patient_id))
+        except Exception as e:
+            logger.warning(f"Quiz cache read failed for patient {patient_id}: {e}")
+            value = None
+        entry = json.loads(value) if value else None
+        # URLs signées pour une autre adresse de l'API : à reconstruire
+        if not entry or not entry["quiz"] or entry["base_url"] != base_url:
+            quiz_cache_requests.inc(outcome="miss")
+            return None
+        quiz_cache_requests.inc(outcome="hit")
+        return QuizRead.model_validate(entry["quiz"])
+
+    def put(self, patient_id: int, quiz: QuizRead, base_url: str) -> None:
+        if self.backend is None:
+            return
+        quiz_data = quiz.model_dump(mode="json")
+
+        def put(entry: dict) -> dict:
+            answered = {question_id for quiz_id, question_id in entry["answered"] if quiz_id == quiz.id}
+            quiz_data["questions"] = [question for question in quiz_data["questions"] if question["id"] not in answered]
+            return {**entry, "quiz": quiz_data if quiz_data["questions"] else None, "base_url": base_url}
+        self._safe_update(patient_id, put)
+
+    def remove_answered(self, patient_id: int, quiz_id: int, question_ids: list[int]) -> None:
+        if self.backend is None or not question_ids:
+            return
+
+        def remove(entry: dict) -> dict:
+            answered = entry["answered"] + [[quiz_id, question_id] for question_id in question_ids]
+            quiz_data = entry["quiz"]
+            if quiz_data and quiz_data["id"] == quiz_id:
+                quiz_data["questions"] = [question for question in quiz_data["questions"] if question["id"] not in question_ids]
+                if not quiz_data["questions"]:
+                    # Quiz terminé : le prochain GET active le quiz suivant
+                    quiz_data = None
+            return {**entry, "quiz": quiz_data, "answered": answered[-ANSWERED_LIMIT:]}
+        self._safe_update(patient_id, remove)
+
+    def invalidate(self, patient_id: int | None) -> None:
+        if self.backend is None or patient_id is None:
+            return
+        try:
+            self.backend.delete(self.key(patient_id))
+        except Exception as e:
+            logger.warning(f"Quiz cache invalidation failed for patient {patient_id}: {e}")
+
+quiz_cache = QuizCache(create_cache_backend(), settings.quiz_cache_ttl_seconds)
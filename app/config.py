@@ -2,6 +2,7 @@ import logging
 from passlib.context import CryptContext
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing import Mapping, Optional
+from datetime import timedelta
 
 class Settings(BaseSettings):
     database_driver: str
@@ -18,6 +19,46 @@ class Settings(BaseSettings):
 
     llm_enabled: bool = False
     llm_host: str = "localhost"
+    llm_questions_per_cluster: int = 1
+    llm_slow_call_seconds: float = 10.0
+    llm_cold_load_seconds: float = 1.0
+    llm_clues_keep_alive: str = "24h"
+    llm_questions_keep_alive: str = "24h"
+    llm_embedding_keep_alive: str = "24h"
+    llm_keep_warm_interval: float = 600
+
+    embedding_dimensions: int = 768
+    embedding_compact: bool = False
+    embedding_rerank_candidates: int = 40
+
+    raw_data_clustering: str = "incremental"
+    raw_data_sweep_interval: float = 300
+    llm_max_concurrent_generations: int = 2
+
+    import_workers: int = 2
+
+    upload_max_image_bytes: int = 10 * 1024 * 1024
+    upload_max_raw_data_bytes: int = 50 * 1024 * 1024
+    image_variant_cache_bytes: int = 256 * 1024 * 1024
+    media_cache_max_age: int = 86400
+    media_url_secret: Optional[str] = None
+    media_url_ttl_seconds: int = 86400
+    media_url_bucket_seconds: int = 3600
+    media_gc_interval: float = 3600
+    media_reconcile_interval: float = 86400
+    grading_fuzzy_threshold: Optional[float] = None
+    quiz_cache_backend: str = "memory"
+    quiz_cache_ttl_seconds: int = 3600
+    redis_url: Optional[str] = None
+    storage_backend: str = "local"
+    storage_redirect: bool = False
+    s3_bucket: Optional[str] = None
+    s3_prefix: str = ""
+    s3_endpoint_url: Optional[str] = None
+    s3_region: Optional[str] = None
+    s3_access_key_id: Optional[str] = None
+    s3_secret_access_key: Optional[str] = None
+    metrics_token: Optional[str] = None
 
     model_config = SettingsConfigDict(env_file='.env', extra='ignore')
 
@@ -30,6 +71,9 @@ pwd_context = CryptContext(schemes=[settings.password_algorithm], deprecated="au
 
 json_schema_dir = "json_schema"
 
+# Answers accepted in one POST /api/quiz/{quiz_id}/answers
+quiz_answers_max_batch = 200
+
 # LLM Config
 
 llm_parameters = {
@@ -40,6 +84,22 @@ llm_parameters = {
     "num_ctx": 4096
 }
 
+# Tokens kept free in the context window for the generated clues
+llm_clues_output_tokens = 512
+llm_clues_neighbours = 5
+
+# Raw data clustering: a question is generated from `raw_data_cluster_size` raw data close to each other
+raw_data_cluster_size = 3
+raw_data_cluster_l2_threshold = 0.8
+raw_data_cluster_neighbours = 10
+# A claim not released after this delay (crashed worker) is ignored
+raw_data_claim_ttl = timedelta(hours=1)
+
+# File imports: extracted text is split into raw data of `import_chunk_characters`, embedded `import_embedding_batch_size` at a time
+import_chunk_characters = 1500
+import_chunk_overlap = 200
+import_embedding_batch_size = 16
+
 llm_template = """{{ if .System }}<|im_start|>system
 {{ .System }}<|im_end|>
 {{ end }}{{ if .Prompt }}<|im_start|>user
@@ -80,13 +140,16 @@ class LLMSettings(BaseSettings):
     host: str = 'localhost'
     model_name: str
     is_custom: bool = False
+    is_embedding: bool = False
     from_: Optional[str] = None
     parameters: Optional[Mapping[str, float]] = None
     template: Optional[str] = None
     system: Optional[str] = None
+    keep_alive: Optional[str] = None
+    keep_warm_interval: Optional[float] = None
 
-clues_model_settings = LLMSettings(host=settings.llm_host, model_name="mistral-indices", is_custom=True, from_="mistral:latest", parameters=llm_parameters, template=llm_template, system=llm_clues_system)
+clues_model_settings = LLMSettings(host=settings.llm_host, model_name="mistral-indices", is_custom=True, from_="mistral:latest", parameters=llm_parameters, template=llm_template, system=llm_clues_system, keep_alive=settings.llm_clues_keep_alive, keep_warm_interval=settings.llm_keep_warm_interval)
 
-questions_model_settings = LLMSettings(host=settings.llm_host, model_name="mistral-questions", is_custom=True, from_="mistral:latest", parameters=llm_parameters, template=llm_template, system=llm_questions_system)
+questions_model_settings = LLMSettings(host=settings.llm_host, model_name="mistral-questions", is_custom=True, from_="mistral:latest", parameters=llm_parameters, template=llm_template, system=llm_questions_system, keep_alive=settings.llm_questions_keep_alive, keep_warm_interval=settings.llm_keep_warm_interval)
 
-embedding_model_settings = LLMSettings(host=settings.llm_host, model_name="nomic-embed-text")
\ No newline at end of file
+embedding_model_settings = LLMSettings(host=settings.llm_host, model_name="nomic-embed-text", is_embedding=True, keep_alive=settings.llm_embedding_keep_alive, keep_warm_interval=settings.llm_keep_warm_interval)
\ No newline at end of file
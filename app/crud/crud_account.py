@@ -1,7 +1,8 @@
 from sqlmodel import Session, select
 from fastapi import HTTPException
-from app.models.model_tables import Account, Patient, Manager
-import os
+from app.models.model_tables import Account, Patient, Manager, Question, RawData, ImportJob
+from app.crud.crud_media import release_media
+from app.leitner import leitner_policies
 
 def create_account(session: Session, account: Account) -> Account:
     account = Account(**account.model_dump())
@@ -34,11 +35,30 @@ def update_account(session: Session, current_account: Account, account: Account)
         return current_account
     return None # pragma: no cover (security measure)
 
+def update_leitner_delays(session: Session, current_account: Account, delays: list[int] | None) -> Account:
+    try:
+        # Validée contre la politique chargée : pas plus de boîtes que LeitnerParameters
+        leitner_policies.default.with_delays(delays)
+    except (ValueError, OverflowError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    current_account.leitner_delays = delays
+    session.add(current_account)
+    session.commit()
+    session.refresh(current_account)
+    return current_account
+
+def get_account_media_references(session: Session, account_id: int) -> list[tuple[str | None, str | None]]:
+    """(sha256, path) of every media file referenced by the account, once per reference."""
+    references = session.exec(select(Manager.pp_sha256, Manager.pp_path).where(Manager.account_id == account_id, Manager.pp_path.is_not(None))).all()
+    references += session.exec(select(Question.image_sha256, Question.image_path).where(Question.account_id == account_id, Question.image_path.is_not(None))).all()
+    # Les chunks d'un import partagent la référence de leur ImportJob
+    references += session.exec(select(RawData.file_sha256, RawData.file_path).where(RawData.account_id == account_id, RawData.file_path.is_not(None), RawData.import_job_id.is_(None))).all()
+    references += session.exec(select(ImportJob.file_sha256, ImportJob.file_path).where(ImportJob.account_id == account_id, ImportJob.file_path.is_not(None))).all()
+    return [tuple(reference) for reference in references]
+
 def delete_account(session: Session, current_account: Account) -> bool:
-    managers = session.exec(select(Manager).where(Manager.account_id == current_account.id, Manager.pp_path.is_not(None))).all()
-    for m in managers:
-        if os.path.exists(m.pp_path):
-            os.remove(m.pp_path)
+    # Les fichiers partagés avec d'autres comptes restent : seules les références de ce compte sont libérées
+    release_media(session, get_account_media_references(session, current_account.id))
     if current_account.patient_id:
         patient = session.get(Patient, current_account.patient_id)
         if patient:
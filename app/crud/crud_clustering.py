@@ -0,0 +1,211 @@
+from sqlmodel import Session, select, update, delete, func, and_, or_
+import numpy as np
+from app.models.model_tables import RawData, RawDataCluster, Account
+from app.crud.crud_embeddings import get_nearest_ids
+from app.config import logger, raw_data_cluster_size, raw_data_cluster_l2_threshold, raw_data_cluster_neighbours, raw_data_claim_ttl
+
+def raw_data_available():
+    """Raw data that is neither used for a question nor claimed by a running generation."""
+    return and_(
+        RawData.used_for_question_generation.is_(None),
+        or_(RawData.claimed_at.is_(None), RawData.claimed_at < func.now() - raw_data_claim_ttl),
+    )
+
+def refresh_cluster_sizes(session: Session, cluster_ids) -> None:
+    """Recomputes the size of the clusters: their members neither used nor claimed. Committed by the caller."""
+    # UPDATE RawDataCluster c SET size = (SELECT COUNT(*) FROM RawData r WHERE r.cluster_id = c.id
+    #     AND r.used_for_question_generation IS NULL AND r.claimed_at IS NULL) WHERE c.id IN (...)
+    cluster_ids = {cluster_id for cluster_id in cluster_ids if cluster_id is not None}
+    if not cluster_ids:
+        return
+    members = select(func.count(RawData.id)).where(
+        RawData.cluster_id == RawDataCluster.id,
+        RawData.used_for_question_generation.is_(None),
+        RawData.claimed_at.is_(None),
+    ).correlate(RawDataCluster).scalar_subquery()
+    session.exec(update(RawDataCluster).where(RawDataCluster.id.in_(cluster_ids)).values(size=members))
+
+def _cluster_ids_of(session: Session, raw_data_ids: list[int]) -> set[int]:
+    return set(session.exec(select(RawData.cluster_id).where(RawData.id.in_(raw_data_ids), RawData.cluster_id.is_not(None))).all())
+
+def claim_raw_data(session: Session, raw_data_ids: list[int]) -> bool:
+    """Atomically claims every raw data of a cluster, or none of them if another worker got one first."""
+    result = session.exec(
+        update(RawData).where(RawData.id.in_(raw_data_ids), raw_data_available()).values(claimed_at=func.now())
+    )
+    if result.rowcount != len(raw_data_ids):
+        session.rollback()
+        return False
+    refresh_cluster_sizes(session, _cluster_ids_of(session, raw_data_ids))
+    session.commit()
+    return True
+
+def release_raw_data(session: Session, raw_data_ids: list[int]) -> None:
+    session.rollback()  # la génération a pu échouer au milieu d'une transaction
+    session.exec(update(RawData).where(RawData.id.in_(raw_data_ids), RawData.used_for_question_generation.is_(None)).values(claimed_at=None))
+    refresh_cluster_sizes(session, _cluster_ids_of(session, raw_data_ids))
+    session.commit()
+
+def release_expired_claims(session: Session, account_id: int) -> int:
+    """Releases the claims of generations that never finished (worker stopped), so that their clusters count them again."""
+    cluster_ids = session.exec(
+        update(RawData).where(
+            RawData.account_id == account_id,
+            RawData.used_for_question_generation.is_(None),
+            RawData.claimed_at < func.now() - raw_data_claim_ttl,
+        ).values(claimed_at=None).returning(RawData.cluster_id)
+    ).scalars().all()
+    refresh_cluster_sizes(session, cluster_ids)
+    session.commit()
+    return len(cluster_ids)
+
+# Clustering incrémental : chaque nouvel embedding est rattaché à un cluster ouvert
+# à partir de ses plus proches voisins (index vectoriel), au lieu de recomparer toutes les paires.
+
+def assign_raw_data_to_cluster(session: Session, raw_data: RawData, l2_threshold: float = raw_data_cluster_l2_threshold, neighbours: int = raw_data_cluster_neighbours) -> int:
+    nearest = get_nearest_ids(
+        session, RawData, raw_data.embedding,
+        RawData.account_id == raw_data.account_id,
+        RawData.id != raw_data.id,
+        raw_data_available(),
+        limit=neighbours,
+    )
+    return link_raw_data_to_cluster(session, raw_data, nearest, l2_threshold)
+
+def link_raw_data_to_cluster(session: Session, raw_data: RawData, nearest: list[tuple[int, float]], l2_threshold: float = raw_data_cluster_l2_threshold) -> int:
+    """Single linkage: the raw data, its close neighbours and every open cluster they belong to end up in one cluster.
+
+    `nearest` is (id, l2 distance) of the nearest available raw data, closest first.
+    """
+    close_ids = [raw_data_id for raw_data_id, distance in nearest if distance <= l2_threshold]
+
+    cluster_of = dict(session.exec(select(RawData.id, RawData.cluster_id).where(RawData.id.in_(close_ids))).all()) if close_ids else {}
+    neighbour_cluster_ids = {cluster_id for cluster_id in cluster_of.values() if cluster_id is not None}
+    open_cluster_ids = set(session.exec(
+        select(RawDataCluster.id).where(RawDataCluster.id.in_(neighbour_cluster_ids), RawDataCluster.used.is_(False))
+    ).all()) if neighbour_cluster_ids else set()
+
+    # Cluster ouvert du voisin le plus proche qui en a un, les autres clusters ouverts touchés y sont fusionnés
+    linked = list(dict.fromkeys(cluster_of[raw_data_id] for raw_data_id in close_ids if cluster_of.get(raw_data_id) in open_cluster_ids))
+    if linked:
+        cluster_id, merged = linked[0], linked[1:]
+        if merged:
+            session.exec(update(RawData).where(RawData.cluster_id.in_(merged)).values(cluster_id=cluster_id))
+            session.exec(delete(RawDataCluster).where(RawDataCluster.id.in_(merged)))
+            logger.debug(f"Clusters {merged} merged into cluster {cluster_id}")
+    else:
+        cluster = RawDataCluster(account_id=raw_data.account_id)
+        session.add(cluster)
+        session.flush()
+        cluster_id = cluster.id
+
+    # Les voisins proches sans cluster le rejoignent aussi
+    members = [raw_data_id for raw_data_id in close_ids if cluster_of.get(raw_data_id) is None]
+    raw_data.cluster_id = cluster_id
+    session.add(raw_data)
+    if members:
+        session.exec(update(RawData).where(RawData.id.in_(members)).values(cluster_id=cluster_id))
+    session.flush()
+    refresh_cluster_sizes(session, [cluster_id])
+    session.commit()
+    logger.debug(f"Raw data {raw_data.id} linked to cluster {cluster_id} with {len(members)} new neighbour(s)")
+    return cluster_id
+
+def get_ready_raw_data_clusters(session: Session, current_account: Account, limit: int = raw_data_cluster_size, max_clusters: int | None = None) -> list[list[RawData]]:
+    # SELECT c.id FROM RawDataCluster c JOIN RawData r ON r.cluster_id = c.id AND <r disponible>
+    # WHERE c.account_id = :account_id AND NOT c.used AND c.size >= :limit
+    # GROUP BY c.id HAVING COUNT(r.id) >= :limit ORDER BY c.id LIMIT :max_clusters
+    # size (index partiel) écarte d'abord les petits clusters, le HAVING compte les membres réellement disponibles
+    # avant le LIMIT : un cluster entièrement réservé ne prend pas la place d'un cluster prêt
+    query = select(RawDataCluster.id).join(
+        RawData, and_(RawData.cluster_id == RawDataCluster.id, raw_data_available())
+    ).where(
+        RawDataCluster.account_id == current_account.id,
+        RawDataCluster.used.is_(False),
+        RawDataCluster.size >= limit,
+    ).group_by(RawDataCluster.id).having(func.count(RawData.id) >= limit).order_by(RawDataCluster.id)
+    if max_clusters is not None:
+        query = query.limit(max_clusters)
+    cluster_ids = session.exec(query).all()
+    if not cluster_ids:
+        return []
+
+    members = session.exec(
+        select(RawData).where(RawData.cluster_id.in_(cluster_ids), raw_data_available()).order_by(RawData.id)
+    ).all()
+    clusters = {cluster_id: [] for cluster_id in cluster_ids}
+    for raw_data in members:
+        clusters[raw_data.cluster_id].append(raw_data)
+    # Un membre a pu être réservé entre les deux requêtes
+    return [cluster for cluster in clusters.values() if len(cluster) >= limit]
+
+def mark_raw_data_clusters_used(session: Session, cluster: list[RawData]) -> None:
+    cluster_ids = {raw_data.cluster_id for raw_data in cluster if raw_data.cluster_id is not None}
+    if cluster_ids:
+        session.exec(update(RawDataCluster).where(RawDataCluster.id.in_(cluster_ids)).values(used=True))
+        session.flush()
+        refresh_cluster_sizes(session, cluster_ids)
+
+# Moteur NumPy : pour quelques milliers de raw data, la matrice des distances calculée en mémoire
+# par blocs est bien plus rapide que la jointure de toutes les paires dans PostgreSQL.
+
+def _as_array(embedding) -> np.ndarray:
+    return embedding.to_numpy() if hasattr(embedding, "to_numpy") else np.asarray(embedding)
+
+def find_disjoint_clusters(embeddings: np.ndarray, limit: int = raw_data_cluster_size, l2_threshold: float = raw_data_cluster_l2_threshold, block_size: int = 1024, max_clusters: int | None = None) -> list[list[int]]:
+    """Returns disjoint clusters of row indices: a pivot and its `limit - 1` nearest rows within `l2_threshold`.
+
+    Pivots with the most neighbours are taken first, as in the SQL query.
+    """
+    n = len(embeddings)
+    if n < limit:
+        return []
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    squared_norms = np.einsum("ij,ij->i", embeddings, embeddings)
+    squared_threshold = l2_threshold ** 2
+    neighbours = []
+    for start in range(0, n, block_size):
+        block = embeddings[start:start + block_size]
+        squared_distances = squared_norms[start:start + block_size, None] + squared_norms[None, :] - 2 * block @ embeddings.T
+        np.fill_diagonal(squared_distances[:, start:start + block_size], np.inf)
+        for row in squared_distances:
+            close = np.flatnonzero(row <= squared_threshold)
+            neighbours.append(close[np.argsort(row[close], kind="stable")])
+
+    counts = np.array([len(close) for close in neighbours])
+    assigned = np.zeros(n, dtype=bool)
+    clusters = []
+    for pivot in np.argsort(-counts, kind="stable"):
+        if counts[pivot] < limit - 1:
+            break
+        if assigned[pivot]:
+            continue
+        available = neighbours[pivot][~assigned[neighbours[pivot]]][:limit - 1]
+        if len(available) < limit - 1:
+            continue
+        members = [int(pivot), *map(int, available)]
+        assigned[members] = True
+        clusters.append(members)
+        if max_clusters is not None and len(clusters) >= max_clusters:
+            break
+    return clusters
+
+def get_raw_data_clusters_numpy(session: Session, current_account: Account, limit: int = raw_data_cluster_size, l2_threshold: float = raw_data_cluster_l2_threshold, max_clusters: int | None = None) -> list[list[RawData]]:
+    rows = session.exec(
+        select(RawData.id, RawData.embedding).where(
+            RawData.account_id == current_account.id,
+            raw_data_available(),
+            RawData.embedding.is_not(None),
+        ).order_by(RawData.id)
+    ).all()
+    if len(rows) < limit:
+        return []
+    ids = [raw_data_id for raw_data_id, _ in rows]
+    embeddings = np.stack([_as_array(embedding) for _, embedding in rows])
+    index_clusters = find_disjoint_clusters(embeddings, limit, l2_threshold, max_clusters=max_clusters)
+    if not index_clusters:
+        return []
+
+    member_ids = [ids[i] for members in index_clusters for i in members]
+    raw_data_by_id = {raw_data.id: raw_data for raw_data in session.exec(select(RawData).where(RawData.id.in_(member_ids))).all()}
+    return [[raw_data_by_id[ids[i]] for i in members] for members in index_clusters]
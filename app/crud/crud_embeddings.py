@@ -0,0 +1,48 @@
+from sqlmodel import Session, select
+from sqlalchemy.orm import defer
+from app.config import settings
+
+def binary_quantize(embedding) -> str:
+    # Un bit par dimension : 1 si la composante est positive
+    return "".join("1" if value > 0 else "0" for value in embedding)
+
+def set_embedding(instance, embedding) -> None:
+    instance.embedding = embedding
+    if settings.embedding_compact:
+        instance.embedding_binary = binary_quantize(embedding)
+
+def defer_embeddings(model) -> list:
+    """Loader options that keep the embedding columns out of an ORM fetch."""
+    options = [defer(model.embedding)]
+    if settings.embedding_compact:
+        options.append(defer(model.embedding_binary))
+    return options
+
+def get_nearest_ids(session: Session, model, embedding, *conditions, limit: int = 5) -> list[tuple[int, float]]:
+    """Returns (id, l2 distance) of the nearest rows of `model`, nearest first.
+
+    With compact embeddings, candidates are first selected by hamming distance on the
+    binary column (HNSW index), then re-ranked by exact distance on the halfvec column.
+    """
+    if not settings.embedding_compact:
+        distance = model.embedding.l2_distance(embedding)
+        return session.exec(
+            select(model.id, distance)
+            .where(*conditions, model.embedding.is_not(None))
+            .order_by(distance)
+            .limit(limit)
+        ).all()
+
+    candidates = (
+        select(model.id, model.embedding)
+        .where(*conditions, model.embedding_binary.is_not(None))
+        .order_by(model.embedding_binary.hamming_distance(binary_quantize(embedding)))
+        .limit(max(limit, settings.embedding_rerank_candidates))
+        .subquery()
+    )
+    distance = candidates.c.embedding.l2_distance(embedding)
+    return session.exec(
+        select(candidates.c.id, distance)
+        .order_by(distance)
+        .limit(limit)
+    ).all()
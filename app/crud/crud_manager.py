@@ -2,6 +2,8 @@ from sqlmodel import Session, select, func
 from fastapi import HTTPException, UploadFile
 from app.models.model_tables import Account, Manager
 from app.schemas.schema_pagination import PaginationMeta
+from app.crud.crud_media import store_upload_async, release_media
+from app.config import settings
 from typing import Optional
 import os
 import math
@@ -57,21 +59,26 @@ def delete_manager(session: Session, current_manager: Manager) -> bool:
     current_manager = session.get(Manager, current_manager.id)
     if not current_manager:
         raise HTTPException(status_code=404, detail="Manager not found") # pragma: no cover (security measure)
-    if current_manager.pp_path and os.path.exists(current_manager.pp_path):
-        os.remove(current_manager.pp_path)
+    release_media(session, [(current_manager.pp_sha256, current_manager.pp_path)])
     session.delete(current_manager)
     session.commit()
 
     return True
 
-def save_manager_profile_picture(session: Session, current_manager: Manager, file: UploadFile, ext: str) -> str:
-    MEDIA_ROOT = "media/pp"
-    os.makedirs(MEDIA_ROOT, exist_ok=True)
-    filename = f"manager_{current_manager.id}{ext}"
-    file_path = os.path.join(MEDIA_ROOT, filename)
-    with open(file_path, "wb") as f:
-        f.write(file.file.read())
-    current_manager.pp_path = file_path
+def read_manager_picture_info(session: Session, manager_id: int, account_id: int):
+    row = session.exec(select(Manager.account_id, Manager.pp_path, Manager.pp_sha256).where(Manager.id == manager_id)).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Manager not found")
+    if row.account_id != account_id:
+        raise HTTPException(status_code=403, detail="Not authorized to perform this action")
+    return row
+
+async def save_manager_profile_picture(session: Session, current_manager: Manager, file: UploadFile, ext: str) -> str:
+    blob = await store_upload_async(session, file, ext, settings.upload_max_image_bytes)
+    # L'ancienne photo n'est libérée qu'une fois la nouvelle stockée
+    release_media(session, [(current_manager.pp_sha256, current_manager.pp_path)])
+    current_manager.pp_path = blob.path
+    current_manager.pp_sha256 = blob.sha256
     session.add(current_manager)
     session.commit()
-    return file_path
+    return blob.path
@@ -0,0 +1,196 @@
+import os
+import time
+from collections import Counter
+from datetime import timedelta
+from typing import Iterable
+from fastapi import UploadFile
+from sqlmodel import Session, select
+from sqlalchemy import text, union_all
+from sqlalchemy.dialects.postgresql import insert
+from starlette.concurrency import run_in_threadpool
+from app.models.model_tables import MediaBlob, MediaDeletion, Manager, Question, RawData, ImportJob
+from app.uploads import save_upload
+from app.storage import MEDIA_ROOT, StoredObject, storage, storage_key, scratch_path
+from app.config import logger
+
+BLOB_ROOT = "media/blobs"
+# Un blob sans référence est gardé un moment : un envoi du même contenu en cours peut encore le reprendre
+BLOB_GRACE_PERIOD = timedelta(hours=1)
+# Répertoires rapprochés des références en base (les variantes d'images ont leur propre cache)
+RECONCILED_PREFIXES = ("blobs/", "pp/", "question_images/", "raw_data/", "tmp/")
+GC_BATCH_SIZE = 500
+
+def blob_path(sha256: str, ext: str) -> str:
+    # Deux niveaux de répertoires pour ne pas avoir des dizaines de milliers de fichiers dans un seul
+    return os.path.join(BLOB_ROOT, sha256[:2], sha256[2:4], f"{sha256}{ext.lower()}")
+
+def is_blob_path(path: str | None) -> bool:
+    return bool(path) and os.path.normpath(path).startswith(os.path.normpath(BLOB_ROOT) + os.sep)
+
+def acquire_blob(session: Session, sha256: str, size: int, path: str) -> MediaBlob:
+    """Adds a reference to a blob, creating its row if needed. Committed by the caller with the referencing row."""
+    statement = insert(MediaBlob).values(sha256=sha256, size=size, path=path, refcount=1)
+    statement = statement.on_conflict_do_update(
+        index_elements=[MediaBlob.sha256],
+        set_={"refcount": MediaBlob.refcount + 1, "updated_at": text("TIMEZONE('Europe/Paris', NOW())")},
+    ).returning(MediaBlob.id)
+    blob_id = session.execute(statement).scalar_one()
+    return session.get(MediaBlob, blob_id, populate_existing=True)
+
+def store_upload(session: Session, file: UploadFile, ext: str, max_bytes: int) -> MediaBlob:
+    """Stores an upload once per distinct content and returns its blob, with one more reference."""
+    saved = save_upload(file, scratch_path(ext), max_bytes)
+    try:
+        blob = acquire_blob(session, saved.sha256, saved.size, blob_path(saved.sha256, ext))
+        # Toujours réécrit (contenu identique) : la ligne est verrouillée jusqu'au commit, une purge ne peut pas
+        # supprimer l'objet après cette écriture
+        storage.put_file(storage_key(blob.path), saved.path)
+    finally:
+        if os.path.exists(saved.path):
+            os.remove(saved.path)
+    return blob
+
+async def store_upload_async(session: Session, file: UploadFile, ext: str, max_bytes: int) -> MediaBlob:
+    return await run_in_threadpool(store_upload, session, file, ext, max_bytes)
+
+def release_media(session: Session, references: list[tuple[str | None, str | None]]) -> None:
+    """Drops one reference per (sha256, path) pair. Committed by the caller with the deletion.
+
+    Files stored before the blob store are not shared: their removal is queued for the garbage collector.
+    """
+    counts = Counter(sha256 for sha256, path in references if sha256 and is_blob_path(path))
+    for sha256, count in counts.items():
+        session.execute(
+            text("UPDATE mediablob SET refcount = GREATEST(refcount - :count, 0), updated_at = TIMEZONE('Europe/Paris', NOW()) WHERE sha256 = :sha256"),
+            {"sha256": sha256, "count": count},
+        )
+    session.add_all(MediaDeletion(path=path) for sha256, path in references if path and not is_blob_path(path))
+
+def delete_media_file(path: str) -> int:
+    """Removes a media file from the storage, returns its size (0 when it was already gone)."""
+    try:
+        key = storage_key(path)
+    except ValueError:
+        logger.warning(f"Not removing '{path}': outside of the media storage")
+        return 0
+    stored = storage.stat(key)
+    if stored is None:
+        return 0
+    storage.delete(key)
+    return stored.size
+
+def purge_unreferenced_blobs(session: Session, grace_period: timedelta = BLOB_GRACE_PERIOD) -> int:
+    """Deletes the blobs nobody references any more, rows then files. Returns the number of bytes freed."""
+    # Une référence prise entre-temps verrouille la ligne : le DELETE attend puis la réévalue.
+    # Les fichiers sont supprimés avant le commit, tant que les lignes supprimées sont verrouillées.
+    rows = session.execute(
+        text("DELETE FROM mediablob WHERE refcount <= 0 AND updated_at < TIMEZONE('Europe/Paris', NOW()) - :grace_period RETURNING path, size"),
+        {"grace_period": grace_period},
+    ).all()
+    freed = sum(delete_media_file(path) for path, size in rows)
+    session.commit()
+    if rows:
+        logger.info(f"{len(rows)} unreferenced media blob(s) removed, {freed} bytes freed")
+    return freed
+
+def referenced_media_paths(session: Session, paths: Iterable[str]) -> set[str]:
+    """Those of `paths` still referenced by a row, blobs included."""
+    paths = list(paths)
+    if not paths:
+        return set()
+    statement = union_all(
+        select(MediaBlob.path).where(MediaBlob.path.in_(paths)),
+        select(Manager.pp_path).where(Manager.pp_path.in_(paths)),
+        select(Question.image_path).where(Question.image_path.in_(paths)),
+        select(RawData.file_path).where(RawData.file_path.in_(paths)),
+        select(ImportJob.file_path).where(ImportJob.file_path.in_(paths)),
+    )
+    return set(session.execute(statement).scalars().all())
+
+def process_media_deletions(session: Session, batch_size: int = GC_BATCH_SIZE) -> int:
+    """Removes the queued files, in batches. Returns the number of bytes freed."""
+    freed = 0
+    while True:
+        # SKIP LOCKED : plusieurs workers peuvent vider la file en parallèle
+        deletions = session.exec(select(MediaDeletion).order_by(MediaDeletion.id).limit(batch_size).with_for_update(skip_locked=True)).all()
+        if not deletions:
+            return freed
+        # Un chemin repris entre-temps (même fichier réutilisé) n'est pas supprimé
+        referenced = referenced_media_paths(session, {deletion.path for deletion in deletions})
+        for deletion in deletions:
+            if deletion.path not in referenced:
+                freed += delete_media_file(deletion.path)
+            session.delete(deletion)
+        session.commit()
+
+def recount_blob_references(session: Session, grace_period: timedelta = BLOB_GRACE_PERIOD, batch_size: int = GC_BATCH_SIZE) -> int:
+    """Sets each blob refcount to the number of rows pointing at it. Returns the number of blobs corrected.
+
+    Blobs touched during the grace period are skipped: an upload may hold a reference not yet committed.
+    """
+    corrected = 0
+    after_id = 0
+    while True:
+        rows = session.execute(text("""
+            WITH batch AS (
+                SELECT id, sha256, path FROM mediablob
+                WHERE id > :after_id AND updated_at < TIMEZONE('Europe/Paris', NOW()) - :grace_period
+                ORDER BY id LIMIT :batch_size
+            ), counts AS (
+                SELECT batch.id,
+                    (SELECT COUNT(*) FROM manager WHERE pp_sha256 = batch.sha256 AND pp_path = batch.path)
+                    + (SELECT COUNT(*) FROM question WHERE image_sha256 = batch.sha256 AND image_path = batch.path)
+                    + (SELECT COUNT(*) FROM rawdata WHERE file_sha256 = batch.sha256 AND file_path = batch.path AND import_job_id IS NULL)
+                    + (SELECT COUNT(*) FROM importjob WHERE file_sha256 = batch.sha256 AND file_path = batch.path) AS refcount
+                FROM batch
+            ), corrected AS (
+                UPDATE mediablob SET refcount = counts.refcount
+                FROM counts
+                WHERE mediablob.id = counts.id AND mediablob.refcount <> counts.refcount
+                    AND mediablob.updated_at < TIMEZONE('Europe/Paris', NOW()) - :grace_period
+                RETURNING mediablob.id
+            )
+            SELECT (SELECT MAX(id) FROM batch), (SELECT COUNT(*) FROM corrected)
+        """), {"after_id": after_id, "grace_period": grace_period, "batch_size": batch_size}).one()
+        session.commit()
+        if rows[0] is None:
+            return corrected
+        after_id, corrected = rows[0], corrected + rows[1]
+
+def _remove_orphans(session: Session, objects: list[StoredObject], cutoff: float) -> int:
+    paths = {f"{MEDIA_ROOT}/{stored.key}": stored for stored in objects}
+    referenced = referenced_media_paths(session, paths)
+    freed = 0
+    for path, stored in paths.items():
+        if path in referenced:
+            continue
+        # Réécrit depuis le listage : probablement un envoi dont la ligne n'est pas encore commitée
+        current = storage.stat(stored.key)
+        if current is None or current.modified >= cutoff:
+            continue
+        storage.delete(stored.key)
+        freed += current.size
+    return freed
+
+def reconcile_media_storage(session: Session, grace_period: timedelta = BLOB_GRACE_PERIOD, batch_size: int = GC_BATCH_SIZE) -> int:
+    """Removes stored files no row references any more and fixes blob refcounts. Returns the number of bytes freed.
+
+    Files newer than the grace period are kept: their row may not be committed yet.
+    """
+    cutoff = time.time() - grace_period.total_seconds()
+    freed = 0
+    for prefix in RECONCILED_PREFIXES:
+        batch = []
+        for stored in storage.list(prefix):
+            if stored.modified >= cutoff:
+                continue
+            batch.append(stored)
+            if len(batch) >= batch_size:
+                freed += _remove_orphans(session, batch, cutoff)
+                batch = []
+        if batch:
+            freed += _remove_orphans(session, batch, cutoff)
+    corrected = recount_blob_references(session, grace_period, batch_size)
+    if freed or corrected:
+        logger.info(f"Media reconciliation: {freed} bytes of orphan files removed, {corrected} blob refcount(s) corrected")
+    return freed
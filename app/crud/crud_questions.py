@@ -1,32 +1,45 @@
 from sqlmodel import Session, select, func
 from fastapi import HTTPException, BackgroundTasks, Depends
-from app.models.model_tables import Question, Account, Manager, RawData
-from app.llm import LLMModel
-from app.config import logger, settings
+from app.models.model_tables import Question, Account, Manager, RawData, ImportJob
+from app.llm import LLMModel, estimate_tokens
+from app.config import logger, settings, llm_parameters, llm_clues_system, llm_clues_output_tokens, llm_clues_neighbours, raw_data_cluster_size, raw_data_cluster_l2_threshold, raw_data_claim_ttl
 from sqlalchemy import text
 from app.schemas.schema_pagination import PaginationMeta
-from app.schemas.schema_question import QuestionRead, get_random_typed_question_create, MatchElementsExercise
-from app.dependencies import get_image_url, get_questions_llm
+from app.schemas.schema_question import QuestionRead, QuestionCreate, QuestionBatchGenerate, get_random_typed_question_create, get_batch_question_prompt, MatchElementsExercise
+from app.dependencies import get_image_url, get_questions_llm, exercise_checker
+from app.metrics import metrics
+from app.cache import quiz_cache
+from app.crud.crud_embeddings import set_embedding, get_nearest_ids, defer_embeddings
+from app.crud.crud_clustering import assign_raw_data_to_cluster, get_ready_raw_data_clusters, get_raw_data_clusters_numpy, mark_raw_data_clusters_used, claim_raw_data, release_raw_data
 from typing import Optional
 import math
 from typing_extensions import Annotated
+import json
+import time
+
+questions_generated = metrics.counter("questions_generated_total", "Questions generated from raw data clusters, by mode")
+question_generation_seconds = metrics.counter("question_generation_seconds_total", "Seconds spent waiting for the question generation model, by mode")
 
 def _question_to_read(question: Question, base_url: str) -> QuestionRead:
     return QuestionRead(**question.model_dump(), image_url=get_image_url(base_url, question))
 
 async def calculate_embedding_in_background(question: Question, session: Session, embedding_model: LLMModel):
     question = session.get(Question, question.id)
-    question.embedding = await embedding_model.embed(str(question.exercise))
+    set_embedding(question, await embedding_model.embed(str(question.exercise)))
+    # Les voisins sont calculés une seule fois ici pour éviter un parcours vectoriel à chaque demande d'indices
+    question.neighbour_ids = get_nearest_question_ids(session, question)
     session.add(question)
     session.commit()
     logger.debug(f"Embedding calculated in background for question ID {question.id}")
 
 async def calculate_raw_data_embedding_in_background(raw_data: RawData, account_id: int, session: Session, embedding_model: LLMModel, background_tasks: BackgroundTasks):
     raw_data = session.get(RawData, raw_data.id)
-    raw_data.embedding = await embedding_model.embed(raw_data.text)
+    set_embedding(raw_data, await embedding_model.embed(raw_data.text))
     session.add(raw_data)
     session.commit()
     logger.debug(f"Embedding calculated in background for raw data ID {raw_data.id}")
+    if settings.raw_data_clustering == "incremental":
+        assign_raw_data_to_cluster(session, raw_data)
 
     # Check if we can generate a question from raw data
     current_account = session.get(Account, account_id)
@@ -35,34 +48,58 @@ async def calculate_raw_data_embedding_in_background(raw_data: RawData, account_
         return
     
     cluster = get_raw_data_cluster(session, current_account)
-    if cluster:
-        await generate_question_from_raw_data(cluster, current_account.id, session, embedding_model, background_tasks)
+    raw_data_ids = [raw_data.id for raw_data in cluster]
+    if cluster and claim_raw_data(session, raw_data_ids):
+        try:
+            await generate_question_from_raw_data(cluster, current_account.id, session, embedding_model, background_tasks)
+        finally:
+            release_raw_data(session, raw_data_ids)
 
-async def generate_question_from_raw_data(cluster: list[RawData], account_id: int, session: Session, embedding_model: LLMModel, background_tasks: BackgroundTasks):
-    generation_model = get_questions_llm()
-    question_generate = get_random_typed_question_create()
-    prompt = question_generate.prompt
+def _generated_exercise_to_dict(exercise) -> dict:
+    # Convert the exercise object to a dictionary to make it JSON serializable
+    if isinstance(exercise, MatchElementsExercise):
+        return exercise.pairs
+    return exercise.model_dump() if hasattr(exercise, "model_dump") else exercise.__dict__
+
+def _raw_data_prompt(prompt: str, cluster: list[RawData]) -> str:
     prompt += "Données :\n"
     for raw_data in cluster:
         prompt += f"{raw_data.text}\n"
-        if raw_data.file_path:
-            prompt += f"File: {raw_data.file_path}\n"
+    return prompt
+
+def _mark_cluster_used(session: Session, cluster: list[RawData], question: Question):
+    for raw_data in cluster:
+        raw_data.used_for_question_generation = question.id
+        session.add(raw_data)
+    mark_raw_data_clusters_used(session, cluster)
+    session.commit()
+
+def _record_generation(mode: str, number_of_questions: int, elapsed: float):
+    questions_generated.inc(number_of_questions, mode=mode)
+    question_generation_seconds.inc(elapsed, mode=mode)
+    rate = number_of_questions / elapsed if elapsed > 0 else 0
+    logger.info(f"{number_of_questions} question(s) generated in {elapsed:.1f}s ({rate:.2f} questions per GPU-second, mode={mode})")
+
+async def generate_question_from_raw_data(cluster: list[RawData], account_id: int, session: Session, embedding_model: LLMModel, background_tasks: BackgroundTasks):
+    if settings.llm_questions_per_cluster > 1:
+        await generate_questions_batch_from_raw_data(cluster, account_id, session, embedding_model, background_tasks, settings.llm_questions_per_cluster)
+        return
+
+    generation_model = get_questions_llm()
+    question_generate = get_random_typed_question_create()
+    prompt = _raw_data_prompt(question_generate.prompt, cluster)
+    start = time.perf_counter()
     generated_question = await generation_model.generate(prompt, format=question_generate.question_class)
+    elapsed = time.perf_counter() - start
     if generated_question is None:
         logger.warning("No question generated from raw data cluster")
         return
     print(f"Generated question: {generated_question}")
     
-    # Convert the exercise object to a dictionary to make it JSON serializable
-    if isinstance(generated_question.exercise, MatchElementsExercise):
-        exercise_dict = generated_question.exercise.pairs
-    else:
-        exercise_dict = generated_question.exercise.model_dump() if hasattr(generated_question.exercise, "model_dump") else generated_question.exercise.__dict__
-    
     formatted = Question(
         type=question_generate.type,
         category="IA",
-        exercise=exercise_dict,
+        exercise=_generated_exercise_to_dict(generated_question.exercise),
         image_path=generated_question.image_path,
         account_id=account_id,
         created_by=None,
@@ -73,12 +110,41 @@ async def generate_question_from_raw_data(cluster: list[RawData], account_id: in
     if question is None:
         logger.warning("Failed to create question from generated data")
         return
-    for raw_data in cluster:
-        raw_data.used_for_question_generation = question.id
-        session.add(raw_data)
-    session.commit()
+    _mark_cluster_used(session, cluster, question)
+    _record_generation("single", 1, elapsed)
     logger.info(f"Question generated from raw data cluster: {question.id}")
 
+async def generate_questions_batch_from_raw_data(cluster: list[RawData], account_id: int, session: Session, embedding_model: LLMModel, background_tasks: BackgroundTasks, number_of_questions: int) -> list[Question]:
+    generation_model = get_questions_llm()
+    prompt = _raw_data_prompt(get_batch_question_prompt(number_of_questions), cluster)
+    start = time.perf_counter()
+    generated = await generation_model.generate(prompt, format=QuestionBatchGenerate)
+    elapsed = time.perf_counter() - start
+    if generated is None or not generated.questions:
+        logger.warning("No question generated from raw data cluster")
+        return []
+
+    questions = []
+    for item in generated.questions[:number_of_questions]:
+        question_create = QuestionCreate(type=item.type, category="IA", exercise=_generated_exercise_to_dict(item.exercise))
+        try:
+            exercise_checker(question_create)
+        except HTTPException as e:
+            logger.warning(f"Generated exercise rejected: {e.detail}")
+            continue
+        questions.append(Question(**question_create.model_dump()))
+    if not questions:
+        logger.warning("No valid question in the generated batch")
+        return []
+
+    current_account = session.get(Account, account_id)
+    created_questions = create_questions(session, questions, current_account=current_account, embedding_model=embedding_model, background_tasks=background_tasks)
+    # used_for_question_generation ne référence qu'une question : la première du lot
+    _mark_cluster_used(session, cluster, created_questions[0])
+    _record_generation("batch", len(created_questions), elapsed)
+    logger.info(f"Questions generated from raw data cluster: {[question.id for question in created_questions]}")
+    return created_questions
+
 def create_question(session: Session, question: Question, embedding_model: LLMModel, background_tasks: BackgroundTasks, current_manager: Manager = None, current_account: Account = None,) -> Question:
     question.created_by = current_manager.id if current_manager else None
     question.edited_by = current_manager.id if current_manager else None
@@ -92,6 +158,20 @@ def create_question(session: Session, question: Question, embedding_model: LLMMo
 
     return question
 
+def create_questions(session: Session, questions: list[Question], embedding_model: LLMModel, background_tasks: BackgroundTasks, current_account: Account) -> list[Question]:
+    for question in questions:
+        question.account_id = current_account.id
+        question.created_by = None
+        question.edited_by = None
+    session.add_all(questions)
+    session.commit()
+
+    if embedding_model is not None:
+        for question in questions:
+            background_tasks.add_task(calculate_embedding_in_background, question, session, embedding_model)
+
+    return questions
+
 def read_questions(session: Session, current_account: Account, base_url: str, page: Optional[int] = None, size: Optional[int] = None) -> list[QuestionRead] | tuple[list[QuestionRead], PaginationMeta]:
     base_query = select(Question).join(Account).where(Question.account_id == current_account.id)
     
@@ -124,60 +204,170 @@ def update_question(session: Session, question_data: Question, current_question:
     
     if embedding_model is not None:
         background_tasks.add_task(calculate_embedding_in_background, current_question, session, embedding_model)
+    invalidate_quiz_cache(session, current_question.account_id)
     return current_question
 
 def delete_question(session: Session, current_question: Question) -> bool:
+    account_id = current_question.account_id
     session.delete(current_question)
     session.commit()
+    invalidate_quiz_cache(session, account_id)
     return True
 
-def get_nearest_questions(session: Session, current_question: Question, limit: int = 5) -> list[Question]:
+def invalidate_quiz_cache(session: Session, account_id: int) -> None:
+    # Le quiz en cache du patient contient peut-être la question modifiée ou supprimée
+    account = session.get(Account, account_id)
+    if account is not None:
+        quiz_cache.invalidate(account.patient_id)
+
+def get_nearest_questions(session: Session, current_question: Question, limit: int = 5) -> list[dict]:
     if current_question.embedding is None:
         raise HTTPException(status_code=503, detail="Question does not have an embedding")
 
-    nearest_questions = session.exec(
-        select(Question.exercise)
-        .where(Question.account_id == current_question.account_id, Question.id != current_question.id)
-        .order_by(Question.embedding.l2_distance(current_question.embedding))
-        .limit(limit)
-    ).all()
+    nearest_ids = get_nearest_question_ids(session, current_question, limit)
+    if not nearest_ids:
+        return []
+    exercises = dict(session.exec(select(Question.id, Question.exercise).where(Question.id.in_(nearest_ids))).all())
+    return [exercises[question_id] for question_id in nearest_ids if question_id in exercises]
+
+def get_nearest_question_ids(session: Session, current_question: Question, limit: int = llm_clues_neighbours) -> list[int]:
+    nearest = get_nearest_ids(
+        session, Question, current_question.embedding,
+        Question.account_id == current_question.account_id, Question.id != current_question.id,
+        limit=limit,
+    )
+    return [question_id for question_id, _ in nearest]
 
-    return nearest_questions
+def get_clues_context(session: Session, current_question: Question) -> list[dict]:
+    if current_question.neighbour_ids is None:
+        return get_nearest_questions(session, current_question, limit=llm_clues_neighbours)
+    if not current_question.neighbour_ids:
+        return []
+    exercises = dict(session.exec(
+        select(Question.id, Question.exercise).where(Question.id.in_(current_question.neighbour_ids))
+    ).all())
+    # Les questions supprimées depuis le calcul disparaissent simplement du contexte
+    return [exercises[question_id] for question_id in current_question.neighbour_ids if question_id in exercises]
 
-def create_raw_data(session: Session, text: str, current_account: Account, current_manager: Manager, file_path: str = None, filename: str = None, embedding_model: LLMModel = None, background_tasks: BackgroundTasks = None) -> RawData:
+def build_clues_prompt(session: Session, current_question: Question) -> dict:
+    prompt = {
+        "question": current_question.exercise,
+        "contexte": [],
+        "consigne": "Vérifie bien que la réponse N'EST PAS dans les indices que tu donnes.",
+    }
+    budget = llm_parameters["num_ctx"] - llm_clues_output_tokens - estimate_tokens(llm_clues_system)
+    budget -= estimate_tokens(json.dumps(prompt, ensure_ascii=False))
+    for exercise in get_clues_context(session, current_question):
+        cost = estimate_tokens(json.dumps(exercise, ensure_ascii=False))
+        if cost > budget:
+            break
+        prompt["contexte"].append(exercise)
+        budget -= cost
+    return prompt
+
+def create_raw_data(session: Session, text: str, current_account: Account, current_manager: Manager, file_path: str = None, file_sha256: str = None, embedding_model: LLMModel = None, background_tasks: BackgroundTasks = None) -> RawData:
     raw_data = RawData(
         account_id=current_account.id,
         text=text,
         created_by=current_manager.id,
         edited_by=current_manager.id,
-        file_path=f"{file_path}_{filename}" if file_path and filename else None,
+        file_path=file_path,
+        file_sha256=file_sha256,
     )
     
     session.add(raw_data)
     session.commit()
     session.refresh(raw_data)
-
-    if file_path and filename:
-        raw_data.file_path = f"{file_path}_{str(raw_data.id)}_{filename}"
-        session.commit()
     
     if embedding_model is not None and background_tasks is not None:
         background_tasks.add_task(calculate_raw_data_embedding_in_background, raw_data, current_account.id, session, embedding_model, background_tasks)
 
     return raw_data
 
+def create_import_job(session: Session, filename: str, current_account: Account, current_manager: Manager, file_path: str, file_sha256: str) -> ImportJob:
+    import_job = ImportJob(account_id=current_account.id, created_by=current_manager.id, filename=filename, file_path=file_path, file_sha256=file_sha256)
+    session.add(import_job)
+    session.commit()
+    session.refresh(import_job)
+    return import_job
+
+def read_import_job(session: Session, import_job_id: int, current_account: Account) -> ImportJob:
+    import_job = session.get(ImportJob, import_job_id)
+    if not import_job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    if import_job.account_id != current_account.id:
+        raise HTTPException(status_code=403, detail="Not authorized to perform this action")
+    return import_job
+
+def create_raw_data_chunks(session: Session, import_job: ImportJob, chunks: list[str]) -> list[RawData]:
+    raw_data_list = [
+        RawData(
+            account_id=import_job.account_id,
+            text=chunk,
+            created_by=import_job.created_by,
+            edited_by=import_job.created_by,
+            file_path=import_job.file_path,
+            file_sha256=import_job.file_sha256,
+            import_job_id=import_job.id,
+        )
+        for chunk in chunks
+    ]
+    session.add_all(raw_data_list)
+    import_job.chunks_total = len(raw_data_list)
+    session.add(import_job)
+    session.commit()
+    return raw_data_list
+
+def read_question_image_info(session: Session, question_id: int, account_id: int):
+    # Seules les colonnes utiles : ni l'exercice ni l'embedding ne sont chargés
+    row = session.exec(select(Question.account_id, Question.image_path, Question.image_sha256).where(Question.id == question_id)).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Question not found")
+    if row.account_id != account_id:
+        raise HTTPException(status_code=403, detail="Not authorized to perform this action")
+    return row
+
+def read_raw_data_file_info(session: Session, raw_data_id: int, account_id: int):
+    row = session.exec(select(RawData.account_id, RawData.file_path, RawData.file_sha256).where(RawData.id == raw_data_id)).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Raw data not found")
+    if row.account_id != account_id:
+        raise HTTPException(status_code=403, detail="Not authorized to perform this action")
+    return row
+
 def get_raw_data(session: Session, current_account: Account) -> list[RawData]:
     query = select(RawData).where(RawData.account_id == current_account.id)
     result = session.exec(query)
     return result.all()
 
-# function that gets a cluster of 3 raw data next to each other (l2 distance < 0.7)
-# Parcours optimisé de la base de données, récupère un cluster non utilisé de raw data
-def get_raw_data_cluster(session: Session, current_account: Account, limit: int = 3, l2_threshold: float = 0.8) -> list[RawData]:
+# function that gets a cluster of 3 raw data next to each other (l2 distance < 0.8)
+def get_raw_data_cluster(session: Session, current_account: Account, limit: int = raw_data_cluster_size, l2_threshold: float = raw_data_cluster_l2_threshold) -> list[RawData]:
+    clusters = get_raw_data_clusters(session, current_account, limit, l2_threshold, max_clusters=1)
+    return clusters[0] if clusters else []
+
+# Tous les clusters disjoints prêts pour la génération de questions
+def get_raw_data_clusters(session: Session, current_account: Account, limit: int = raw_data_cluster_size, l2_threshold: float = raw_data_cluster_l2_threshold, max_clusters: int | None = None) -> list[list[RawData]]:
     if not settings.llm_enabled:
         logger.warning("LLM is not enabled, cannot get raw data cluster")
         return []
 
+    if settings.raw_data_clustering == "incremental":
+        return get_ready_raw_data_clusters(session, current_account, limit, max_clusters=max_clusters)
+    if settings.raw_data_clustering == "numpy":
+        return get_raw_data_clusters_numpy(session, current_account, limit, l2_threshold, max_clusters=max_clusters)
+
+    clusters = []
+    excluded_ids = []
+    while max_clusters is None or len(clusters) < max_clusters:
+        cluster = get_raw_data_cluster_sql(session, current_account, limit, l2_threshold, excluded_ids)
+        if not cluster:
+            break
+        clusters.append(cluster)
+        excluded_ids.extend(raw_data.id for raw_data in cluster)
+    return clusters
+
+# Parcours optimisé de la base de données, récupère un cluster non utilisé de raw data
+def get_raw_data_cluster_sql(session: Session, current_account: Account, limit: int = raw_data_cluster_size, l2_threshold: float = raw_data_cluster_l2_threshold, excluded_ids: list[int] = ()) -> list[RawData]:
     # New approach: Find the first valid cluster by checking all possible pivots
     sql = text("""
         WITH candidate_pivots AS (
@@ -185,6 +375,8 @@ def get_raw_data_cluster(session: Session, current_account: Account, limit: int
             FROM rawdata rd
             WHERE rd.account_id = :account_id
             AND rd.used_for_question_generation IS NULL
+            AND (rd.claimed_at IS NULL OR rd.claimed_at < NOW() - :claim_ttl)
+            AND rd.id != ALL(CAST(:excluded_ids AS integer[]))
             AND rd.embedding IS NOT NULL
         ),
         pivot_with_neighbors AS (
@@ -195,6 +387,8 @@ def get_raw_data_cluster(session: Session, current_account: Account, limit: int
             JOIN rawdata rd ON TRUE
             WHERE rd.account_id = :account_id
             AND rd.used_for_question_generation IS NULL
+            AND (rd.claimed_at IS NULL OR rd.claimed_at < NOW() - :claim_ttl)
+            AND rd.id != ALL(CAST(:excluded_ids AS integer[]))
             AND rd.embedding IS NOT NULL
             AND rd.id != cp.pivot_id
             AND rd.embedding <-> (SELECT embedding FROM rawdata WHERE id = cp.pivot_id) <= :l2_threshold
@@ -204,31 +398,36 @@ def get_raw_data_cluster(session: Session, current_account: Account, limit: int
             LIMIT 1
         ),
         best_pivot AS (
-            SELECT rd.*
+            SELECT rd.id, rd.embedding
             FROM rawdata rd
             JOIN pivot_with_neighbors pwn ON rd.id = pwn.pivot_id
         ),
         neighbors AS (
-            SELECT rd.*
+            SELECT rd.id, rd.embedding <-> p.embedding AS distance, p.id AS pivot_id
             FROM rawdata rd
             JOIN best_pivot p ON TRUE
             WHERE rd.account_id = :account_id
             AND rd.used_for_question_generation IS NULL
+            AND (rd.claimed_at IS NULL OR rd.claimed_at < NOW() - :claim_ttl)
+            AND rd.id != ALL(CAST(:excluded_ids AS integer[]))
             AND rd.embedding IS NOT NULL
             AND rd.id != p.id
             AND rd.embedding <-> p.embedding <= :l2_threshold
             ORDER BY rd.embedding <-> p.embedding
             LIMIT :limit
         )
-        SELECT * FROM best_pivot
-        UNION
-        SELECT * FROM neighbors
+        SELECT id, 0.0 AS distance, id AS pivot_id FROM best_pivot
+        UNION ALL
+        SELECT id, distance, pivot_id FROM neighbors
+        ORDER BY distance, id = pivot_id DESC
     """)
     result = session.execute(sql, {
         "account_id": current_account.id,
         "limit": limit - 1,
         "l2_threshold": l2_threshold,
-        "min_neighbors": limit - 1
+        "min_neighbors": limit - 1,
+        "claim_ttl": raw_data_claim_ttl,
+        "excluded_ids": list(excluded_ids),
     })
 
     rows = result.fetchall()
@@ -238,22 +437,20 @@ def get_raw_data_cluster(session: Session, current_account: Account, limit: int
         logger.info(f"Aucun cluster adéquat trouvé: {len(rows)} éléments < {limit} demandés")
         return []
 
-    # Convertir les résultats bruts en objets RawData complets
-    raw_data_ids = [row.id for row in rows]
-    raw_data_objects = session.exec(select(RawData).where(RawData.id.in_(raw_data_ids))).all()
-    
-    # Calculer les distances L2 pour vérifier la cohérence du cluster à partir du pivot
-    if len(raw_data_objects) > 1:
-        pivot = raw_data_objects[0]
-        for i in range(1, len(raw_data_objects)):
-            if pivot.embedding is not None and raw_data_objects[i].embedding is not None:
-                distance = session.exec(
-                    select(RawData.embedding.l2_distance(pivot.embedding))
-                    .where(RawData.id == raw_data_objects[i].id)
-                ).first()
-                logger.debug(f"Distance L2 entre {pivot.id} et {raw_data_objects[i].id}: {distance}")
-                if distance > l2_threshold:
-                    logger.warning(f"Distance L2 inattendue > seuil: {distance} > {l2_threshold}")
+    # Vérifier la cohérence du cluster à partir des distances au pivot renvoyées par la requête
+    for row in rows:
+        if row.id == row.pivot_id:
+            continue
+        logger.debug(f"Distance L2 entre {row.pivot_id} et {row.id}: {row.distance}")
+        if row.distance > l2_threshold:
+            logger.warning(f"Distance L2 inattendue > seuil: {row.distance} > {l2_threshold}")
+
+    # Convertir les résultats bruts en objets RawData, sans recharger les embeddings
+    raw_data_by_id = {
+        raw_data.id: raw_data
+        for raw_data in session.exec(select(RawData).where(RawData.id.in_([row.id for row in rows])).options(*defer_embeddings(RawData))).all()
+    }
+    raw_data_objects = [raw_data_by_id[row.id] for row in rows if row.id in raw_data_by_id]
     
     logger.info(f"Cluster trouvé avec {len(raw_data_objects)} éléments")
     return raw_data_objects
\ No newline at end of file
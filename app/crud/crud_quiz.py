@@ -1,10 +1,13 @@
-from fastapi import HTTPException
-from sqlalchemy import select, func
+from fastapi import HTTPException, BackgroundTasks
+from sqlalchemy import select, update, delete, func, exists, literal, union_all, cast, null, case, Integer, Interval
+from sqlalchemy.exc import IntegrityError
 from app.schemas.schema_question import QuestionRead
-from app.schemas.schema_quiz import QuizRead, ResultRead
+from app.schemas.schema_quiz import QuizRead, ResultRead, AnswerCreate, AnswerOutcome
 from sqlmodel import Session
-from app.models.model_tables import Result, QuizQuestion, Question, Quiz, Account, LeitnerParameters
-from app.dependencies import get_image_url
+from app.models.model_tables import Result, QuizQuestion, Question, Quiz, Account
+from app.dependencies import engine, get_image_url, answer_checker
+from app.cache import quiz_cache
+from app.leitner import LeitnerPolicy, leitner_policies
 import base64
 
 def have_all_questions_been_answered(current_account: Account, session: Session) -> bool:
@@ -21,95 +24,183 @@ def have_all_questions_been_answered(current_account: Account, session: Session)
     ).first()
     return never_answered == None
 
-def create_leitner_quiz(number_of_questions: int, current_account: Account, session: Session, base_url: str) -> QuizRead:
-    # SELECT * FROM Question WHERE account_id = :account_id AND id NOT IN (SELECT question_id FROM QuizQuestion)
-    never_answered = session.exec(
-        select(Question).where(
-            Question.account_id == current_account.id,
-            Question.id.not_in(
-                select(QuizQuestion.question_id)
-            )
-        )
-    ).scalars().all()
+# Colonnes nécessaires à QuestionRead (et à l'URL signée de l'image) : ni embedding ni voisins
+QUIZ_QUESTION_COLUMNS = (
+    Question.id, Question.type, Question.category, Question.exercise, Question.created_at, Question.updated_at,
+    Question.created_by, Question.edited_by, Question.image_path, Question.image_sha256,
+)
 
-    # SELECT q.*
-    # FROM Question q
-    # JOIN QuizQuestion qq ON q.id = qq.question_id
-    # JOIN (
-    #     SELECT question_id, MAX(quiz_id) as max_quiz_id
-    #     FROM QuizQuestion
-    #     GROUP BY question_id
-    # ) latest_qq ON qq.quiz_id = latest_qq.max_quiz_id AND qq.question_id = latest_qq.question_id
-    # JOIN LeitnerParameters lp ON qq.box_number = lp.box_number
-    # JOIN Quiz qz ON qz.id = qq.quiz_id
-    # WHERE q.account_id = 9
-    # AND qz.created_at < (CURRENT_TIMESTAMP - lp.leitner_delay)
-    # ORDER BY qq.box_number ASC
-    # LIMIT 10;
-    leitner_data = session.exec(
-        select(Question, QuizQuestion.box_number).where(
-            Question.account_id == current_account.id
-        ).join(
-            QuizQuestion, QuizQuestion.question_id == Question.id
-        ).where(
-            QuizQuestion.quiz_id == (
-                select(func.max(QuizQuestion.quiz_id)).where(
-                    QuizQuestion.question_id == Question.id
-                ).correlate(Question).scalar_subquery()
-            )
-        ).join(
-            LeitnerParameters, QuizQuestion.box_number == LeitnerParameters.box_number
-        ).join(
-            Quiz, Quiz.id == QuizQuestion.quiz_id
+def box_delay(policy: LeitnerPolicy, box_number):
+    # CASE qq.box_number WHEN 1 THEN <délai 1> ... WHEN n THEN <délai n> ELSE <délai n> END
+    # Une boîte au-delà de la politique du compte (réglage réduit après coup) prend le délai de la dernière
+    return case(
+        {box: literal(policy.delay(box), Interval) for box in range(1, policy.max_box + 1)},
+        value=box_number,
+        else_=literal(policy.delay(policy.max_box), Interval),
+    )
+
+def select_quiz_candidates(account_id: int, number_of_questions: int, policy: LeitnerPolicy):
+    # SELECT * FROM (
+    #     SELECT q.<colonnes>, 0 AS priority, NULL AS box_number
+    #     FROM Question q
+    #     WHERE q.account_id = :account_id AND NOT EXISTS (SELECT 1 FROM QuizQuestion qq WHERE qq.question_id = q.id)
+    #   UNION ALL
+    #     SELECT q.<colonnes>, 1 AS priority, qq.box_number
+    #     FROM Question q
+    #     JOIN QuizQuestion qq ON q.id = qq.question_id
+    #     JOIN Quiz qz ON qz.id = qq.quiz_id
+    #     WHERE q.account_id = :account_id AND qq.box_number IS NOT NULL
+    #     AND qq.quiz_id = (SELECT MAX(quiz_id) FROM QuizQuestion WHERE question_id = q.id)
+    #     AND qz.created_at + <délai de la boîte> <= NOW()
+    # ) candidates
+    # ORDER BY priority, box_number, id
+    # LIMIT :number_of_questions;
+    # UNION ALL : les deux parties sont disjointes, et le type json n'a pas d'égalité pour un UNION
+    # Les délais des boîtes viennent de la politique du compte (app/leitner.py), plus de jointure sur LeitnerParameters
+    never_answered = select(
+        *QUIZ_QUESTION_COLUMNS, literal(0).label("priority"), cast(null(), Integer).label("box_number")
+    ).where(
+        Question.account_id == account_id,
+        ~exists().where(QuizQuestion.question_id == Question.id)
+    )
+    leitner = select(
+        *QUIZ_QUESTION_COLUMNS, literal(1).label("priority"), QuizQuestion.box_number
+    ).join(
+        QuizQuestion, QuizQuestion.question_id == Question.id
+    ).where(
+        Question.account_id == account_id,
+        QuizQuestion.box_number.is_not(None),
+        QuizQuestion.quiz_id == (
+            select(func.max(QuizQuestion.quiz_id)).where(
+                QuizQuestion.question_id == Question.id
+            ).correlate(Question).scalar_subquery()
         )
-        .where(
-            True
-            # Quiz.created_at <= func.now() - LeitnerParameters.leitner_delay
-        ).order_by(
-            QuizQuestion.box_number.asc()
-        ).limit(max(0, number_of_questions - len(never_answered)))
-    ).all()
-    
-    leitner_questions = []
-    leitner_boxes = {}
-    for question, box_number in leitner_data:
-        leitner_boxes[question.id] = box_number
-        leitner_questions.append(question)
+    ).join(
+        Quiz, Quiz.id == QuizQuestion.quiz_id
+    ).where(
+        # Date du dernier quiz où la question a été posée, dans le même fuseau que created_at
+        Quiz.created_at + box_delay(policy, QuizQuestion.box_number) <= func.timezone("Europe/Paris", func.now())
+    )
+    candidates = union_all(never_answered, leitner).subquery("candidates")
+    return select(candidates).order_by(
+        candidates.c.priority, candidates.c.box_number, candidates.c.id
+    ).limit(max(0, number_of_questions))
 
-    questions = never_answered + leitner_questions
+def compose_quiz(session: Session, account_id: int, patient_id: int, number_of_questions: int, policy: LeitnerPolicy, status: str = "active") -> tuple[Quiz, list]:
+    """Writes a new quiz with its due questions. Returns it with the rows needed to build QuestionRead."""
+    # Une seule requête bornée : jamais plus de number_of_questions lignes chargées
+    rows = session.exec(select_quiz_candidates(account_id, number_of_questions, policy)).all()
 
-    if not questions:
+    if not rows:
         raise HTTPException(status_code=404, detail="No quiz available")
 
-    new_quiz = Quiz(patient_id=current_account.patient_id)
+    new_quiz = Quiz(patient_id=patient_id, status=status, number_of_questions=number_of_questions)
     session.add(new_quiz)
+    session.flush()
+
+    for row in rows:
+        session.add(QuizQuestion(
+            quiz_id=new_quiz.id,
+            question_id=row.id,
+            box_number=row.box_number if row.box_number is not None else 1
+        ))
     session.commit()
-    session.refresh(new_quiz)
+    return new_quiz, rows
 
+def build_quiz_read(quiz_id: int, rows: list, base_url: str) -> QuizRead:
     questions_read = []
-
-    for question in questions:
-        quiz_question = QuizQuestion(
-            quiz_id=new_quiz.id,
-            question_id=question.id
-        )
-        if leitner_boxes.get(question.id) is None:
-            quiz_question.box_number = 1
-        else:
-            quiz_question.box_number = leitner_boxes[question.id]
-        q_dict = question.model_dump()
-        q_dict["image_url"] = get_image_url(base_url, question)  # lien public pour accès image
+    for row in rows:
+        q_dict = {column.key: getattr(row, column.key) for column in QUIZ_QUESTION_COLUMNS}
+        q_dict["image_url"] = get_image_url(base_url, row)  # lien public pour accès image
         questions_read.append(QuestionRead(**q_dict))
-        session.add(quiz_question)
+    return QuizRead(id=quiz_id, questions=questions_read)
+
+def create_leitner_quiz(number_of_questions: int, current_account: Account, session: Session, base_url: str) -> QuizRead:
+    new_quiz, rows = compose_quiz(session, current_account.id, current_account.patient_id, number_of_questions, leitner_policies.for_account(current_account))
+    quiz_read = build_quiz_read(new_quiz.id, rows, base_url)
+    quiz_cache.put(current_account.patient_id, quiz_read, base_url)
+    return quiz_read
+
+def activate_pending_quiz(number_of_questions: int, current_account: Account, session: Session, base_url: str) -> QuizRead | None:
+    """Shows the quiz composed in advance, if it is still suitable. Otherwise drops it and returns None."""
+    # UPDATE Quiz qz SET status = 'active', created_at = NOW()
+    # WHERE qz.patient_id = :patient_id AND qz.status = 'pending' AND qz.number_of_questions = :number_of_questions
+    # AND NOT EXISTS (SELECT 1 FROM Question q WHERE q.account_id = :account_id AND q.created_at > qz.created_at)
+    # RETURNING qz.id
+    # La date devient celle de l'affichage : statistiques de régularité et délais de Leitner
+    quiz_id = session.execute(
+        update(Quiz).where(
+            Quiz.patient_id == current_account.patient_id,
+            Quiz.status == "pending",
+            Quiz.number_of_questions == number_of_questions,
+            ~exists().where(Question.account_id == current_account.id, Question.created_at > Quiz.created_at)
+        ).values(
+            status="active", created_at=func.timezone("Europe/Paris", func.now())
+        ).returning(Quiz.id)
+    ).scalar()
+    if quiz_id is None:
+        # Composé pour une autre taille, ou avant l'ajout de nouvelles questions : remplacé par un quiz composé maintenant
+        session.execute(delete(Quiz).where(Quiz.patient_id == current_account.patient_id, Quiz.status == "pending"))
+        session.commit()
+        return None
     session.commit()
 
-    return QuizRead(id=new_quiz.id, questions=questions_read)
+    # SELECT q.<colonnes> FROM Question q JOIN QuizQuestion qq ON q.id = qq.question_id WHERE qq.quiz_id = :quiz_id ORDER BY qq.box_number, q.id
+    rows = session.exec(
+        select(*QUIZ_QUESTION_COLUMNS).join(
+            QuizQuestion, QuizQuestion.question_id == Question.id
+        ).where(
+            QuizQuestion.quiz_id == quiz_id
+        ).order_by(QuizQuestion.box_number, Question.id)
+    ).all()
+    quiz_read = build_quiz_read(quiz_id, rows, base_url)
+    quiz_cache.put(current_account.patient_id, quiz_read, base_url)
+    return quiz_read
+
+def is_quiz_complete(session: Session, quiz_id: int) -> bool:
+    # SELECT 1 FROM QuizQuestion qq WHERE qq.quiz_id = :quiz_id AND qq.result_id IS NULL LIMIT 1
+    return session.exec(
+        select(QuizQuestion.question_id).where(
+            QuizQuestion.quiz_id == quiz_id,
+            QuizQuestion.result_id.is_(None)
+        ).limit(1)
+    ).first() is None
+
+def compose_pending_quiz(account_id: int, patient_id: int, number_of_questions: int) -> None:
+    """Composes the next quiz in advance, so that the next GET /api/quiz/{n} only has to show it."""
+    # Tâche de fond : la session de la requête est déjà fermée quand elle s'exécute
+    with Session(engine) as session:
+        account = session.get(Account, account_id)
+        if account is None:
+            return
+        try:
+            compose_quiz(session, account_id, patient_id, number_of_questions, leitner_policies.for_account(account), status="pending")
+        except HTTPException:
+            pass # Plus aucune question : le prochain GET répondra 404
+        except IntegrityError:
+            # Déjà composé par une requête concurrente
+            session.rollback()
+
+def schedule_next_quiz(session: Session, current_quiz: Quiz, current_account: Account, background_tasks: BackgroundTasks) -> None:
+    """After the last answer of a quiz, composes the next one in the background."""
+    if current_quiz.status != "active" or not is_quiz_complete(session, current_quiz.id):
+        return
+    number_of_questions = current_quiz.number_of_questions
+    if number_of_questions is None:
+        # Quiz créé avant l'enregistrement de la taille demandée
+        number_of_questions = session.exec(select(func.count()).where(QuizQuestion.quiz_id == current_quiz.id)).scalar()
+    background_tasks.add_task(compose_pending_quiz, current_account.id, current_quiz.patient_id, number_of_questions)
 
 def get_latest_quiz_remaining_questions(current_account: Account, session: Session, base_url: str) -> QuizRead:
-    # SELECT id FROM Quiz q WHERE q.patient_id = :patient_id ORDER BY id DESC LIMIT 1
+    cached = quiz_cache.get(current_account.patient_id, base_url)
+    if cached is not None:
+        return cached
+
+    # SELECT id FROM Quiz q WHERE q.patient_id = :patient_id AND q.status = 'active' ORDER BY id DESC LIMIT 1
     latest_quiz_id = session.exec(
         select(Quiz.id).where(
-            Quiz.patient_id == current_account.patient_id
+            Quiz.patient_id == current_account.patient_id,
+            Quiz.status == "active"
         ).order_by(
             Quiz.id.desc()
         ).limit(1)
@@ -117,26 +208,21 @@ def get_latest_quiz_remaining_questions(current_account: Account, session: Sessi
     if not latest_quiz_id:
         return None
 
-    # SELECT * FROM Question q WHERE q.id IN (SELECT question_id FROM QuizQuestion qq WHERE qq.quiz_id = :quiz_id AND qq.result_id IS NULL)
-    questions = session.exec(
-        select(Question).where(
-            Question.id.in_(
-                select(QuizQuestion.question_id).where(
-                    QuizQuestion.quiz_id == latest_quiz_id,
-                    QuizQuestion.result_id.is_(None)
-                )
-            )
-        )
-    ).scalars().all()
+    # SELECT q.<colonnes> FROM Question q JOIN QuizQuestion qq ON q.id = qq.question_id WHERE qq.quiz_id = :quiz_id AND qq.result_id IS NULL
+    rows = session.exec(
+        select(*QUIZ_QUESTION_COLUMNS).join(
+            QuizQuestion, QuizQuestion.question_id == Question.id
+        ).where(
+            QuizQuestion.quiz_id == latest_quiz_id,
+            QuizQuestion.result_id.is_(None)
+        ).order_by(QuizQuestion.box_number, Question.id)
+    ).all()
 
-    if not questions:
+    if not rows:
         return None
-    questions_read = []
-    for question in questions:
-        q_dict = question.model_dump()
-        q_dict["image_url"] = get_image_url(base_url, question)
-        questions_read.append(QuestionRead(**q_dict))
-    return QuizRead(id=latest_quiz_id, questions=questions_read)
+    quiz_read = build_quiz_read(latest_quiz_id, rows, base_url)
+    quiz_cache.put(current_account.patient_id, quiz_read, base_url)
+    return quiz_read
 
 def read_quiz_by_id(current_quiz: Quiz, session: Session, base_url: str) -> QuizRead:
     # SELECT * FROM Question q WHERE q.id IN (SELECT question_id FROM QuizQuestion qq WHERE qq.quiz_id = :quiz_id)
@@ -157,7 +243,7 @@ def read_quiz_by_id(current_quiz: Quiz, session: Session, base_url: str) -> Quiz
         questions_read.append(QuestionRead(**q_dict))
     return QuizRead(id=current_quiz.id, questions=questions_read)
 
-def save_answer(answer: Result, current_quiz: Quiz, question: Question, session: Session) -> ResultRead:
+def save_answer(answer: Result, current_quiz: Quiz, question: Question, session: Session, policy: LeitnerPolicy | None = None) -> ResultRead:
     # SELECT * FROM QuizQuestion qq WHERE qq.question_id = :question_id AND qq.quiz_id = :quiz_id
     quiz_question = session.exec(
         select(QuizQuestion).where(QuizQuestion.question_id == question.id, QuizQuestion.quiz_id == current_quiz.id)
@@ -168,11 +254,64 @@ def save_answer(answer: Result, current_quiz: Quiz, question: Question, session:
     session.refresh(answer)
     
     quiz_question.result_id = answer.id
-    if answer.is_correct:
-        quiz_question.box_number = min(quiz_question.box_number + 1, 7)
-    else:
-        quiz_question.box_number = 1
+    update_box(quiz_question, answer.is_correct, policy or leitner_policies.default)
     session.add(quiz_question)
     session.commit()
     session.refresh(quiz_question)
-    return answer
\ No newline at end of file
+    # Mise à jour de l'entrée en cache plutôt que relecture en base au prochain affichage
+    quiz_cache.remove_answered(current_quiz.patient_id, current_quiz.id, [question.id])
+    return answer
+
+def update_box(quiz_question: QuizQuestion, is_correct: bool, policy: LeitnerPolicy) -> None:
+    quiz_question.box_number = policy.next_box(quiz_question.box_number, is_correct)
+
+def save_answers(answers: list[AnswerCreate], current_quiz: Quiz, session: Session, policy: LeitnerPolicy | None = None) -> list[AnswerOutcome]:
+    """Validates and stores a batch of answers in one transaction. Invalid items are reported, the others saved."""
+    # SELECT qq.*, q.* FROM QuizQuestion qq JOIN Question q ON q.id = qq.question_id
+    # WHERE qq.quiz_id = :quiz_id AND qq.question_id IN (...) FOR UPDATE OF qq
+    # Verrou : deux envois simultanés du même lot ne peuvent pas répondre deux fois à une question
+    rows = session.exec(
+        select(QuizQuestion, Question).join(
+            Question, Question.id == QuizQuestion.question_id
+        ).where(
+            QuizQuestion.quiz_id == current_quiz.id,
+            QuizQuestion.question_id.in_({answer.question_id for answer in answers})
+        ).with_for_update(of=QuizQuestion)
+    ).all()
+    quiz_questions = {question.id: (quiz_question, question) for quiz_question, question in rows}
+
+    outcomes = []
+    saved = []
+    seen = set()
+    for answer in answers:
+        if answer.question_id in seen:
+            outcomes.append(AnswerOutcome(question_id=answer.question_id, status_code=400, detail="Duplicate answer for this question in the batch"))
+            continue
+        seen.add(answer.question_id)
+        if answer.question_id not in quiz_questions:
+            outcomes.append(AnswerOutcome(question_id=answer.question_id, status_code=404, detail=f"The question {answer.question_id} is not in the quiz {current_quiz.id}"))
+            continue
+        quiz_question, question = quiz_questions[answer.question_id]
+        if quiz_question.result_id is not None:
+            # Renvoi d'une file hors ligne : déjà enregistrée (même code que POST /api/quiz/)
+            outcomes.append(AnswerOutcome(question_id=answer.question_id, status_code=400, detail="Answer already submitted for this question in the quiz"))
+            continue
+        try:
+            result = answer_checker.check(answer, question)
+        except HTTPException as e:
+            outcomes.append(AnswerOutcome(question_id=answer.question_id, status_code=e.status_code, detail=e.detail))
+            continue
+        session.add(result)
+        saved.append((quiz_question, result))
+        outcomes.append(AnswerOutcome(question_id=answer.question_id, status_code=201, result=ResultRead(data=result.data, is_correct=result.is_correct)))
+
+    if saved:
+        # Un seul flush pour obtenir les ids des résultats, un seul commit pour le lot
+        session.flush()
+        for quiz_question, result in saved:
+            quiz_question.result_id = result.id
+            update_box(quiz_question, result.is_correct, policy or leitner_policies.default)
+            session.add(quiz_question)
+    session.commit()
+    quiz_cache.remove_answered(current_quiz.patient_id, current_quiz.id, [quiz_question.question_id for quiz_question, result in saved])
+    return outcomes
\ No newline at end of file
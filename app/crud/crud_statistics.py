@@ -112,7 +112,7 @@ def calculate_regularity_statistics(session: Session, current_account: Account)
     quiz_dates = session.exec(
         select(func.date(Quiz.created_at).label('quiz_date'))
         .join(Patient, Quiz.patient_id == Patient.id)
-        .where(Patient.id == current_account.patient_id)
+        .where(Patient.id == current_account.patient_id, Quiz.status != "pending")
         .distinct()
         .order_by(func.date(Quiz.created_at))
     ).all()
@@ -12,17 +12,20 @@ from fastapi import HTTPException, status, Depends
 from typing import Annotated
 import os
 import json
-from jsonschema import validate, ValidationError
+from jsonschema import ValidationError
+from app.json_schemas import compile_validator, check_instance
 from app.schemas.schema_question import QuestionCreate, QuestionUpdate
-from app.schemas.schema_quiz import ResultRead
+from app.schemas.schema_quiz import ResultCreate
 from pydantic import ValidationError as PydanticValidationError
 from app.llm import LLMModel
+from app.media_urls import sign_media_url
+from app.grading import grade_answer
 
 # Image URL helper
 def get_image_url(base_url: str, question: Question) -> str | None:
-    """Helper function to generate image URL for a question"""
+    """Helper function to generate a signed, expiring image URL for a question"""
     if question.image_path:
-        return f"{base_url}api/questions/{question.id}/image"
+        return sign_media_url(base_url, question.image_path, question.image_sha256)
     return None
 
 # Database
@@ -54,7 +57,8 @@ def create_access_token(data: dict):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
-def get_current_account(token: Annotated[str, Depends(oauth2_scheme)], session: Annotated[Session, Depends(get_session)]) -> Account:
+def get_current_account_id(token: Annotated[str, Depends(oauth2_scheme)]) -> int:
+    """Account id from the token alone, for routes that only need it to filter their own query."""
     try:
         payload = jwt.decode(token, settings.token_secret_key, algorithms=settings.token_algorithm)
     except InvalidTokenError:
@@ -69,7 +73,10 @@ def get_current_account(token: Annotated[str, Depends(oauth2_scheme)], session:
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    account = read_account_by_id(session, int(payload["sub"]))
+    return int(payload["sub"])
+
+def get_current_account(account_id: Annotated[int, Depends(get_current_account_id)], session: Annotated[Session, Depends(get_session)]) -> Account:
+    account = read_account_by_id(session, account_id)
     if not account:
         raise HTTPException(status_code=404, detail="Account not found")
     return account
@@ -98,18 +105,20 @@ def get_current_manager(manager: Annotated[Manager, Depends(manager_checker)]) -
 class CheckerBase:
     def __init__(self, schema_dir: str):
         self.schemas = {}
+        self.validators = {}
         self.schema_dir = schema_dir
         for schema_file in os.listdir(self.schema_dir):
             if schema_file.endswith(".json"):
                 schema_name = schema_file.split(".")[0]
                 with open(os.path.join(self.schema_dir, schema_file), "r") as file:
                     self.schemas[schema_name] = json.load(file)
+                self.validators[schema_name] = compile_validator(self.schemas[schema_name])
 
     def validate_schema(self, instance: dict, schema_type: str):
-        schema = self.schemas.get(schema_type)
-        if not schema:
+        validator = self.validators.get(schema_type)
+        if not validator:
             raise HTTPException(status_code=400, detail=f"Unsupported type: {schema_type}")
-        validate(instance=instance, schema=schema)
+        check_instance(validator, instance)
 
 class ExerciseChecker(CheckerBase):
     def __init__(self):
@@ -160,7 +169,8 @@ class QuizChecker:
 
     def __call__(self, session: Annotated[Session, Depends(get_session)], current_account: Annotated[Account, Depends(get_current_account)], quiz_id: int) -> Quiz:
         quiz = session.get(Quiz, quiz_id)
-        if not quiz:
+        # Un quiz composé à l'avance n'existe pas pour le client tant qu'il n'est pas affiché
+        if not quiz or quiz.status == "pending":
             raise HTTPException(status_code=404, detail="Quiz not found")
         if quiz.patient_id != current_account.patient_id:
             raise HTTPException(status_code=403, detail="Not authorized to perform this action")
@@ -175,7 +185,7 @@ class AnswerChecker(CheckerBase):
     def __init__(self):
         super().__init__(os.path.join(json_schema_dir, "answers"))
 
-    def __call__(self, answer: ResultRead, current_question: Annotated[Question, Depends(get_current_question)], current_quiz: Annotated[Quiz, Depends(get_current_quiz)], session: Annotated[Session, Depends(get_session)]) -> Result:
+    def __call__(self, answer: ResultCreate, current_question: Annotated[Question, Depends(get_current_question)], current_quiz: Annotated[Quiz, Depends(get_current_quiz)], session: Annotated[Session, Depends(get_session)]) -> Result:
         if not current_question:
             raise HTTPException(status_code=400, detail="question_id query parameter required")
         quiz_question = session.exec(
@@ -185,28 +195,31 @@ class AnswerChecker(CheckerBase):
             raise HTTPException(status_code=404, detail=f"The question {current_question.id} is not in the quiz {current_quiz.id}")
         if quiz_question.result_id is not None:
             raise HTTPException(status_code=400, detail="Answer already submitted for this question in the quiz")
+        return self.check(answer, current_question)
 
+    def check(self, answer: ResultCreate, question: Question) -> Result:
+        """Validates and grades an answer to `question`, returns the Result to store."""
         try:
-            self.validate_schema(answer.data, current_question.type)
-            self.additional_validation(answer, current_question)
+            self.validate_schema(answer.data, question.type)
+            self.additional_validation(answer, question)
         except ValidationError as e:
-            raise HTTPException(status_code=400, detail=f"Invalid format for type '{current_question.type}': {e.message}")
-        self.answer_check(answer, current_question)
+            raise HTTPException(status_code=400, detail=f"Invalid format for type '{question.type}': {e.message}")
         result = Result(
             data=answer.data,
-            is_correct=answer.is_correct
+            is_correct=self.answer_check(answer, question)
         )
         return result
     
-    def additional_validation(self, answer: ResultRead, question: Question) -> None:
+    def additional_validation(self, answer: ResultCreate, question: Question) -> None:
         if question.type == "missing_words":
             num_words = len(answer.data["answers"])
             pipe_count = question.exercise["question"].count('|')
             if pipe_count != 2 * num_words:
                 raise ValidationError(f"expected {num_words} words, but found {pipe_count // 2} pipe pairs")
             
-    def answer_check(self, answer: ResultRead, question: Question) -> bool:
-        pass
+    def answer_check(self, answer: ResultCreate, question: Question) -> bool:
+        # Corrigé côté serveur : le is_correct envoyé par le client est ignoré
+        return grade_answer(question, answer.data)
 
 answer_checker = AnswerChecker()
 
@@ -0,0 +1,127 @@
+import re
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime
+from difflib import SequenceMatcher
+from threading import Lock
+from typing import Callable
+from app.config import settings, logger
+
+Grader = Callable[[dict], bool]
+
+GRADER_CACHE_SIZE = 4096
+# Diacritiques séparés par la décomposition NFKD (é -> e + ◌́)
+_COMBINING_MARKS = re.compile("[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]")
+
+def normalize_text(text: str) -> str:
+    """Lower case, without accents and with single spaces: "  Élysée   Palace" -> "elysee palace"."""
+    if not text.isascii():
+        text = _COMBINING_MARKS.sub("", unicodedata.normalize("NFKD", text))
+    return " ".join(text.split()).casefold()
+
+class TextMatcher:
+    """Compares answers to an expected text, normalized once."""
+    __slots__ = ("expected", "fuzzy_threshold")
+
+    def __init__(self, expected: str, fuzzy_threshold: float | None = None):
+        self.expected = normalize_text(expected)
+        self.fuzzy_threshold = fuzzy_threshold
+
+    def __call__(self, answer: str) -> bool:
+        answer = normalize_text(answer)
+        if answer == self.expected:
+            return True
+        if not self.fuzzy_threshold:
+            return False
+        # Fautes de frappe tolérées : ratio calculé seulement quand l'égalité stricte échoue
+        return SequenceMatcher(None, answer, self.expected).ratio() >= self.fuzzy_threshold
+
+def _compile_question(exercise: dict, fuzzy_threshold: float | None) -> Grader:
+    matcher = TextMatcher(exercise["answer"], fuzzy_threshold)
+    return lambda data: matcher(data["answer"])
+
+def _compile_mcq(exercise: dict, fuzzy_threshold: float | None) -> Grader:
+    # Choix sélectionnés parmi ceux proposés : pas de tolérance
+    expected = {normalize_text(exercise["answer"])}
+    return lambda data: {normalize_text(choice) for choice in data["choices"]} == expected
+
+def _compile_missing_words(exercise: dict, fuzzy_threshold: float | None) -> Grader:
+    matchers = [TextMatcher(word, fuzzy_threshold) for word in exercise["answers"]]
+    return lambda data: len(data["answers"]) == len(matchers) and all(matcher(word) for matcher, word in zip(matchers, data["answers"]))
+
+def match_pairs(exercise: dict) -> dict:
+    """Pairs of a match exercise, whichever of its two shapes it was saved in."""
+    # Les exercices générés par le LLM rangent les paires sous "pairs" (MatchElementsExercise) ;
+    # ceux saisis à la main sont les paires elles-mêmes, où "pairs" peut être un élément à associer
+    pairs = exercise.get("pairs")
+    if isinstance(pairs, dict) and len(exercise) == 1:
+        return pairs
+    return exercise
+
+def _compile_match_elements(exercise: dict, fuzzy_threshold: float | None) -> Grader:
+    pairs = match_pairs(exercise)
+    expected = {normalize_text(left): normalize_text(right) for left, right in pairs.items()}
+    return lambda data: {normalize_text(left): normalize_text(right) for left, right in data.items()} == expected
+
+def _compile_chronological_order(exercise: dict, fuzzy_threshold: float | None) -> Grader:
+    expected = [normalize_text(element) for element in exercise["ordered"]]
+    return lambda data: [normalize_text(element) for element in data["answer"]] == expected
+
+GRADER_COMPILERS = {
+    "question": _compile_question,
+    "mcq": _compile_mcq,
+    "missing_words": _compile_missing_words,
+    "match_elements": _compile_match_elements,
+    "chronological_order": _compile_chronological_order,
+}
+
+def compile_grader(question_type: str, exercise: dict, fuzzy_threshold: float | None = None) -> Grader:
+    """Grader of one exercise: expected answers are normalized here, not for each answer."""
+    compiler = GRADER_COMPILERS.get(question_type)
+    if compiler is None:
+        raise ValueError(f"Unsupported type: {question_type}")
+    try:
+        return compiler(exercise, fuzzy_threshold)
+    except (KeyError, TypeError, AttributeError) as e:
+        # Exercice mal formé (ancien ou généré) : aucune réponse ne peut être juste
+        logger.warning(f"Exercise of type '{question_type}' cannot be graded: {e!r}")
+        return lambda data: False
+
+class GraderCache:
+    """Compiled graders by question, least recently used first out. A modified question gets a new grader."""
+    def __init__(self, max_size: int = GRADER_CACHE_SIZE, fuzzy_threshold: float | None = None):
+        self.max_size = max_size
+        self.fuzzy_threshold = fuzzy_threshold
+        self._graders: OrderedDict[tuple[int, datetime | None], Grader] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, question_id: int, updated_at: datetime | None, question_type: str, exercise: dict) -> Grader:
+        key = (question_id, updated_at)
+        with self._lock:
+            grader = self._graders.get(key)
+            if grader is not None:
+                self._graders.move_to_end(key)
+                return grader
+        grader = compile_grader(question_type, exercise, self.fuzzy_threshold)
+        with self._lock:
+            self._graders[key] = grader
+            while len(self._graders) > self.max_size:
+                self._graders.popitem(last=False)
+        return grader
+
+    def clear(self) -> None:
+        with self._lock:
+            self._graders.clear()
+
+grader_cache = GraderCache(fuzzy_threshold=settings.grading_fuzzy_threshold)
+
+def grade_answer(question, data: dict, cache: GraderCache = grader_cache) -> bool:
+    """Whether `data` (already validated against the answer schema) answers `question` correctly."""
+    if question.id is None:
+        grader = compile_grader(question.type, question.exercise, cache.fuzzy_threshold)
+    else:
+        grader = cache.get(question.id, question.updated_at, question.type, question.exercise)
+    try:
+        return bool(grader(data))
+    except (KeyError, TypeError, AttributeError):
+        return False
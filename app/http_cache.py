@@ -0,0 +1,114 @@
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
+from app.config import settings
+from app.storage import storage, storage_key
+from app.images import image_variant_cache, get_image_variant
+
+# Seules les images sont affichées par le navigateur : tout autre fichier envoyé (html, svg...) est téléchargé,
+# sinon il s'exécuterait sur l'origine de l'API
+INLINE_MEDIA_TYPES = {".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".webp": "image/webp"}
+
+class CachedFileResponse(FileResponse):
+    # Starlette compare If-Range à son propre ETag (mtime + taille) : on accepte aussi celui envoyé
+    def _should_use_range(self, http_if_range: str, stat_result: os.stat_result) -> bool:
+        return http_if_range == self.headers.get("etag") or super()._should_use_range(http_if_range, stat_result)
+
+def make_etag(sha256: str | None, key: str, variant: str = "") -> str:
+    """Strong ETag from the content hash; files uploaded before hashing fall back to mtime and size."""
+    if sha256:
+        base = sha256
+    else:
+        stored = storage.stat(key)
+        if stored is None:
+            raise HTTPException(status_code=404, detail="File not found")
+        base = f"{int(stored.modified * 1e9):x}-{stored.size:x}"
+    return f'"{base}-{variant}"' if variant else f'"{base}"'
+
+def variant_tag(w: int | None, h: int | None, format: str | None) -> str:
+    if w is None and h is None and format is None:
+        return ""
+    return f"{w or 0}x{h or 0}{format or ''}"
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Comparaison faible (RFC 9110 13.1.2) : W/ ignoré
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag.removeprefix("W/") in candidates
+
+def is_not_modified(request: Request, etag: str, last_modified: float | None = None) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None and last_modified is not None:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def cache_headers(etag: str, max_age: int) -> dict:
+    return {"ETag": etag, "Cache-Control": f"private, max-age={max_age}", "X-Content-Type-Options": "nosniff"}
+
+def media_type_headers(key: str) -> tuple[str, dict]:
+    """Content-Type of a stored file, with Content-Disposition: attachment for anything but an image."""
+    media_type = INLINE_MEDIA_TYPES.get(os.path.splitext(key)[1].lower())
+    if media_type is not None:
+        return media_type, {}
+    return "application/octet-stream", {"Content-Disposition": f'attachment; filename="{os.path.basename(key)}"'}
+
+def not_modified_response(etag: str, max_age: int) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag, max_age))
+
+def cached_file_response(request: Request, path: str, etag: str, max_age: int, media_type: str | None = None, headers: dict | None = None) -> Response:
+    """FileResponse with validators and Cache-Control, or 304 when the client copy is still valid.
+
+    Range and If-Range requests are answered against the same ETag.
+    """
+    stat = os.stat(path)
+    if is_not_modified(request, etag, stat.st_mtime):
+        response = not_modified_response(etag, max_age)
+        response.headers["Last-Modified"] = formatdate(stat.st_mtime, usegmt=True)
+        return response
+    return CachedFileResponse(path, headers={**cache_headers(etag, max_age), **(headers or {})}, media_type=media_type, stat_result=stat)
+
+def media_key(path: str | None, detail: str = "File not found") -> str:
+    """Storage key of a media path from the database, 404 when there is none."""
+    if not path:
+        raise HTTPException(status_code=404, detail=detail)
+    try:
+        return storage_key(path)
+    except ValueError:
+        raise HTTPException(status_code=404, detail=detail)
+
+def serve_media(request: Request, key: str, sha256: str | None, etag: str, max_age: int, w: int | None = None, h: int | None = None, format: str | None = None) -> Response:
+    """Response for a stored media file (or its resized variant), whatever the storage backend."""
+    try:
+        variant = get_image_variant(image_variant_cache, key, sha256, w, h, format)
+        local_path = storage.local_path(key)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+    if variant is not None:
+        # Format de la variante : celui demandé, pas celui de l'original
+        return cached_file_response(request, variant, etag, max_age, *media_type_headers(variant))
+    media_type, headers = media_type_headers(key)
+    if local_path is not None:
+        if not os.path.isfile(local_path):
+            raise HTTPException(status_code=404, detail="File not found")
+        return cached_file_response(request, local_path, etag, max_age, media_type, headers)
+
+    stored = storage.stat(key)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    if is_not_modified(request, etag, stored.modified):
+        return not_modified_response(etag, max_age)
+    if settings.storage_redirect:
+        # Les octets partent directement du stockage objet, pas du processus API
+        url = storage.presigned_url(key, max(60, max_age), media_type, headers.get("Content-Disposition"))
+        if url is not None:
+            return RedirectResponse(url, status_code=307, headers={"Cache-Control": "private, no-cache", "X-Content-Type-Options": "nosniff"})
+    headers = {**cache_headers(etag, max_age), **headers, "Content-Length": str(stored.size), "Last-Modified": formatdate(stored.modified, usegmt=True)}
+    return StreamingResponse(storage.iter_chunks(key), media_type=media_type, headers=headers)
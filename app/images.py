@@ -0,0 +1,132 @@
+import hashlib
+import io
+import os
+import uuid
+from collections import OrderedDict
+from threading import Lock
+from fastapi import HTTPException
+from app.config import logger, settings
+from app.storage import Storage, storage
+
+# Pillow est optionnel : sans lui, l'image originale est toujours servie
+try:
+    from PIL import Image, ImageOps
+    # DecompressionBombError (image au-delà de Image.MAX_IMAGE_PIXELS) n'hérite ni d'OSError ni de ValueError
+    VARIANT_ERRORS = (OSError, ValueError, Image.DecompressionBombError)
+except ImportError: # pragma: no cover
+    Image = None
+    VARIANT_ERRORS = (OSError, ValueError)
+
+VARIANT_CACHE_ROOT = "media/variants"
+VARIANT_FORMATS = {"webp": "WEBP", "jpeg": "JPEG", "png": "PNG"}
+VARIANT_MAX_DIMENSION = 2048
+VARIANT_QUALITY = 80
+
+def resize_enabled() -> bool:
+    return Image is not None
+
+def render_variant(source, destination: str, width: int | None, height: int | None, format: str | None) -> None:
+    """Writes a copy of the image (path or binary stream) fitting in width x height (aspect ratio kept, never upscaled)."""
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((width or image.width, height or image.height))
+        pil_format = VARIANT_FORMATS[format] if format else (image.format or "PNG")
+        if pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        temp_path = f"{destination}.{uuid.uuid4().hex}.part"
+        try:
+            image.save(temp_path, format=pil_format, quality=VARIANT_QUALITY)
+            os.replace(temp_path, destination)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+def source_key(storage: Storage, key: str, source_sha256: str | None) -> str:
+    if source_sha256:
+        return source_sha256
+    # Fichiers envoyés avant le calcul des hash : la clé et la date de modification suffisent
+    stored = storage.stat(key)
+    if stored is None:
+        raise FileNotFoundError(key)
+    return f"{hashlib.sha1(key.encode()).hexdigest()}-{int(stored.modified * 1e9):x}-{stored.size:x}"
+
+class ImageVariantCache:
+    """Resized images on local disk, keyed by source hash and parameters, evicted least recently used first.
+
+    Sources are read from the media storage, which may be remote: the cache is per API node.
+    """
+    def __init__(self, root: str, max_bytes: int, storage: Storage):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.storage = storage
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._total_bytes = 0
+        self._lock = Lock()
+        self._loaded = False
+
+    def _load(self) -> None:
+        # Les variantes déjà sur disque (redémarrage) sont reprises, les plus anciennes en tête
+        os.makedirs(self.root, exist_ok=True)
+        files = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.endswith(".part") or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            files.append((stat.st_atime, path, stat.st_size))
+        for _, path, size in sorted(files):
+            self._entries[path] = size
+            self._total_bytes += size
+        self._loaded = True
+
+    def variant_path(self, cache_key: str, width: int | None, height: int | None, format: str | None, source: str) -> str:
+        extension = format or os.path.splitext(source)[1].lstrip(".").lower() or "png"
+        return os.path.join(self.root, f"{cache_key}_{width or 0}x{height or 0}.{extension}")
+
+    def get(self, key: str, source_sha256: str | None, width: int | None, height: int | None, format: str | None) -> str:
+        """Local path of the variant of the stored image `key`, rendered on first use."""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+        path = self.variant_path(source_key(self.storage, key, source_sha256), width, height, format, key)
+        with self._lock:
+            if path in self._entries and os.path.exists(path):
+                self._entries.move_to_end(path)
+                return path
+        with self.storage.open(key) as stream:
+            # Pillow a besoin de se déplacer dans le fichier, ce que les flux distants ne permettent pas
+            source = stream if stream.seekable() else io.BytesIO(stream.read())
+            render_variant(source, path, width, height, format)
+        with self._lock:
+            self._total_bytes -= self._entries.pop(path, 0)
+            self._entries[path] = os.path.getsize(path)
+            self._total_bytes += self._entries[path]
+            self._evict()
+        return path
+
+    def _evict(self) -> None:
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            path, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+image_variant_cache = ImageVariantCache(VARIANT_CACHE_ROOT, settings.image_variant_cache_bytes, storage)
+
+def wants_variant(w: int | None, h: int | None, format: str | None) -> bool:
+    if format is not None and format not in VARIANT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format, expected one of {', '.join(VARIANT_FORMATS)}")
+    return (w is not None or h is not None or format is not None) and resize_enabled()
+
+def get_image_variant(cache: ImageVariantCache, key: str, source_sha256: str | None, w: int | None, h: int | None, format: str | None) -> str | None:
+    """Local path of the resized variant of the stored image `key`, or None to serve the original."""
+    if not wants_variant(w, h, format):
+        return None
+    try:
+        return cache.get(key, source_sha256, w, h, format)
+    except VARIANT_ERRORS as e:
+        logger.warning(f"Image variant of '{key}' could not be created: {e}")
+        return None
@@ -0,0 +1,117 @@
+import asyncio
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+# pypdf est optionnel : sans lui, seuls les fichiers texte sont importés
+try:
+    from pypdf import PdfReader
+except ImportError: # pragma: no cover
+    PdfReader = None
+
+TEXT_EXTENSIONS = {".txt", ".md", ".markdown"}
+PDF_EXTENSIONS = {".pdf"}
+
+_MARKDOWN_PATTERNS = [
+    (re.compile(r"!\[([^\]]*)\]\([^)]*\)"), r"\1"),      # images -> texte alternatif
+    (re.compile(r"\[([^\]]*)\]\([^)]*\)"), r"\1"),       # liens -> texte du lien
+    (re.compile(r"^\s{0,3}#{1,6}\s*", re.MULTILINE), ""), # titres
+    (re.compile(r"^\s*>\s?", re.MULTILINE), ""),          # citations
+    (re.compile(r"(\*\*|__|\*|_|`)"), ""),                # emphase et code
+]
+
+def supported_extensions() -> set[str]:
+    if PdfReader is None:
+        return set(TEXT_EXTENSIONS)
+    return TEXT_EXTENSIONS | PDF_EXTENSIONS
+
+def strip_markdown(text: str) -> str:
+    for pattern, replacement in _MARKDOWN_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+def extract_text(file_path: str) -> str:
+    """Extracts plain text from a txt, markdown or PDF file. Runs in a worker process."""
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in PDF_EXTENSIONS:
+        if PdfReader is None:
+            raise ValueError("PDF import requires the 'pypdf' package")
+        reader = PdfReader(file_path)
+        return "\n\n".join(page.extract_text() or "" for page in reader.pages)
+    if extension in TEXT_EXTENSIONS:
+        with open(file_path, "r", encoding="utf-8", errors="replace") as file:
+            text = file.read()
+        return strip_markdown(text) if extension != ".txt" else text
+    raise ValueError(f"Unsupported file type: {extension}")
+
+def chunk_text(text: str, max_characters: int, overlap: int = 0) -> list[str]:
+    """Splits text into chunks of at most `max_characters`, on paragraph then word boundaries.
+
+    When a paragraph has to be cut, consecutive chunks share up to `overlap` characters
+    so that a fact cut in two stays usable.
+    """
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = " ".join(paragraph.split())
+        if len(paragraph) <= max_characters:
+            pieces.append(paragraph)
+        else:
+            pieces.extend(_split_words(paragraph, max_characters, overlap))
+    chunks = []
+    current = ""
+    for piece in filter(None, pieces):
+        if current and len(current) + 2 + len(piece) > max_characters:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _split_words(paragraph: str, max_characters: int, overlap: int) -> list[str]:
+    chunks = []
+    current = ""
+    for word in paragraph.split(" "):
+        # Un mot plus long que la taille maximale est coupé brutalement
+        while len(word) > max_characters:
+            chunks.append(word[:max_characters])
+            word = word[max_characters:]
+        if current and len(current) + 1 + len(word) > max_characters:
+            chunks.append(current)
+            current = _tail(current, overlap)
+            if current and len(current) + 1 + len(word) > max_characters:
+                current = ""
+        current = f"{current} {word}" if current else word
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _tail(text: str, overlap: int) -> str:
+    """Last whole words of `text` fitting in `overlap` characters."""
+    if overlap <= 0:
+        return ""
+    tail = text[-overlap:]
+    if len(tail) < len(text) and not text[-overlap - 1].isspace():
+        tail = tail.split(maxsplit=1)[1] if len(tail.split(maxsplit=1)) > 1 else ""
+    return " ".join(tail.split())
+
+_extraction_pool: ProcessPoolExecutor | None = None
+
+def get_extraction_pool(max_workers: int) -> ProcessPoolExecutor:
+    global _extraction_pool
+    if _extraction_pool is None:
+        # spawn : un fork du serveur (threads, connexions DB) n'est pas sûr
+        _extraction_pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+    return _extraction_pool
+
+def shutdown_extraction_pool() -> None:
+    global _extraction_pool
+    if _extraction_pool is not None:
+        _extraction_pool.shutdown(wait=False, cancel_futures=True)
+        _extraction_pool = None
+
+async def extract_text_in_pool(file_path: str, max_workers: int) -> str:
+    # L'extraction PDF est du CPU pur : hors de la boucle d'évènements et hors du GIL
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_extraction_pool(max_workers), extract_text, file_path)
@@ -0,0 +1,17 @@
+from jsonschema import Draft7Validator
+from jsonschema.exceptions import best_match
+from jsonschema.protocols import Validator
+from jsonschema.validators import validator_for
+
+def compile_validator(schema: dict) -> Validator:
+    """Validator checked and built once per schema, instead of at each jsonschema.validate call."""
+    cls = validator_for(schema, default=Draft7Validator)
+    cls.check_schema(schema)
+    return cls(schema, format_checker=cls.FORMAT_CHECKER)
+
+def check_instance(validator: Validator, instance) -> None:
+    """Raises the same ValidationError as jsonschema.validate when `instance` is invalid."""
+    # Cas courant, instance valide : aucune erreur n'est construite
+    if validator.is_valid(instance):
+        return
+    raise best_match(validator.iter_errors(instance))
@@ -0,0 +1,93 @@
+from dataclasses import dataclass
+from datetime import timedelta
+from functools import lru_cache
+from threading import Lock
+from sqlmodel import Session, select
+from app.models.model_tables import Account, LeitnerParameters
+from app.config import logger
+
+# Délais par défaut des boîtes 1 à 7, recopiés dans LeitnerParameters au démarrage
+DEFAULT_LEITNER_DELAYS = (
+    timedelta(0), timedelta(days=1), timedelta(days=2), timedelta(days=4), timedelta(days=7), timedelta(days=14), timedelta(days=30),
+)
+ACCOUNT_POLICY_CACHE_SIZE = 1024
+
+@dataclass(frozen=True)
+class LeitnerPolicy:
+    """Boxes and their delays. delays[0] is the delay of box 1."""
+    delays: tuple[timedelta, ...]
+
+    def __post_init__(self):
+        if not self.delays:
+            raise ValueError("A Leitner policy needs at least one box")
+        if any(delay < timedelta(0) for delay in self.delays):
+            raise ValueError("Leitner delays cannot be negative")
+
+    @property
+    def max_box(self) -> int:
+        return len(self.delays)
+
+    def delay(self, box_number: int) -> timedelta:
+        return self.delays[min(max(box_number, 1), self.max_box) - 1]
+
+    def next_box(self, box_number: int | None, is_correct: bool) -> int:
+        if not is_correct or box_number is None:
+            return 1
+        return min(box_number + 1, self.max_box)
+
+    def with_delays(self, seconds: list[int] | tuple[int, ...] | None) -> "LeitnerPolicy":
+        """Policy of an account overriding the delays (in seconds). It cannot have more boxes than this one."""
+        if seconds is None:
+            return self
+        if len(seconds) > self.max_box:
+            raise ValueError(f"At most {self.max_box} Leitner boxes")
+        return LeitnerPolicy(tuple(timedelta(seconds=value) for value in seconds))
+
+    def to_seconds(self) -> list[int]:
+        return [int(delay.total_seconds()) for delay in self.delays]
+
+def load_leitner_policy(session: Session) -> LeitnerPolicy:
+    # SELECT * FROM LeitnerParameters ORDER BY box_number
+    parameters = session.exec(select(LeitnerParameters).order_by(LeitnerParameters.box_number)).all()
+    if [parameter.box_number for parameter in parameters] != list(range(1, len(parameters) + 1)):
+        raise ValueError("Leitner boxes must be numbered 1 to n without gaps")
+    return LeitnerPolicy(tuple(parameter.leitner_delay for parameter in parameters))
+
+class LeitnerPolicies:
+    """Policy loaded once from LeitnerParameters, and the per-account overrides derived from it.
+
+    Nothing here queries the database except `reload`.
+    """
+    def __init__(self, default: LeitnerPolicy):
+        self._default = default
+        self._lock = Lock()
+        self._for_delays = lru_cache(maxsize=ACCOUNT_POLICY_CACHE_SIZE)(default.with_delays)
+
+    @property
+    def default(self) -> LeitnerPolicy:
+        return self._default
+
+    def reload(self, session: Session) -> LeitnerPolicy:
+        """To call after LeitnerParameters has been modified. A table left empty keeps the current policy."""
+        try:
+            policy = load_leitner_policy(session)
+        except ValueError as e:
+            logger.warning(f"Leitner parameters not reloaded: {e}")
+            return self._default
+        with self._lock:
+            # Remplacement en bloc : une requête en cours garde la politique qu'elle a lue
+            self._default = policy
+            self._for_delays = lru_cache(maxsize=ACCOUNT_POLICY_CACHE_SIZE)(policy.with_delays)
+        return policy
+
+    def for_account(self, account: Account | None) -> LeitnerPolicy:
+        if account is None or account.leitner_delays is None:
+            return self._default
+        try:
+            return self._for_delays(tuple(account.leitner_delays))
+        except ValueError as e:
+            # Réglage devenu invalide (boîtes retirées de la table) : la politique par défaut s'applique
+            logger.warning(f"Leitner delays of account {account.id} ignored: {e}")
+            return self._default
+
+leitner_policies = LeitnerPolicies(LeitnerPolicy(DEFAULT_LEITNER_DELAYS))
@@ -1,16 +1,125 @@
 from ollama import AsyncClient, Client, RequestError, ResponseError
-from app.config import logger, LLMSettings
+from app.config import logger, LLMSettings, settings
+from app.metrics import metrics
 import asyncio
+import copy
 import sys
 from functools import wraps
 from fastapi import HTTPException, status
 from pydantic import BaseModel, ValidationError
 import time
 import json
+from dataclasses import dataclass
 
 if sys.platform == "win32":
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
+llm_calls = metrics.counter("llm_calls_total", "LLM calls received by LLMModel, by model and kind")
+llm_coalesced_calls = metrics.counter("llm_coalesced_calls_total", "LLM calls served by an identical in-flight request")
+
+llm_tokens_per_second = metrics.histogram("llm_tokens_per_second", "Generation speed reported by Ollama (eval_count / eval_duration), by model", buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 200, 500))
+llm_time_to_first_token = metrics.histogram("llm_time_to_first_token_seconds", "Time from sending the request to the first generated token (queue + load + prompt evaluation), by model")
+llm_load_seconds = metrics.histogram("llm_load_seconds", "Model load time reported by Ollama, by model")
+llm_model_loads = metrics.counter("llm_model_loads_total", "Calls where Ollama had to load the model (cold starts), by model and kind; kind=warmup loads are expected, the others are incidents")
+
+NANOSECONDS = 1e9
+
+@dataclass
+class LLMCallTimings:
+    model: str
+    kind: str
+    wall_seconds: float
+    total_seconds: float = 0.0
+    load_seconds: float = 0.0
+    prompt_eval_count: int = 0
+    prompt_eval_seconds: float = 0.0
+    eval_count: int = 0
+    eval_seconds: float = 0.0
+
+    @classmethod
+    def from_response(cls, response, model: str, kind: str, wall_seconds: float) -> "LLMCallTimings":
+        return cls(
+            model=model,
+            kind=kind,
+            wall_seconds=wall_seconds,
+            total_seconds=(response.get("total_duration") or 0) / NANOSECONDS,
+            load_seconds=(response.get("load_duration") or 0) / NANOSECONDS,
+            prompt_eval_count=response.get("prompt_eval_count") or 0,
+            prompt_eval_seconds=(response.get("prompt_eval_duration") or 0) / NANOSECONDS,
+            eval_count=response.get("eval_count") or 0,
+            eval_seconds=(response.get("eval_duration") or 0) / NANOSECONDS,
+        )
+
+    @property
+    def queue_seconds(self) -> float:
+        # Temps passé avant qu'Ollama ne traite la requête (réseau + attente du GPU)
+        return max(0.0, self.wall_seconds - self.total_seconds)
+
+    @property
+    def time_to_first_token(self) -> float:
+        return self.queue_seconds + self.load_seconds + self.prompt_eval_seconds
+
+    @property
+    def tokens_per_second(self) -> float | None:
+        if self.eval_count and self.eval_seconds:
+            return self.eval_count / self.eval_seconds
+        return None
+
+    @property
+    def is_cold_load(self) -> bool:
+        return self.load_seconds >= settings.llm_cold_load_seconds
+
+    def record(self) -> None:
+        llm_load_seconds.observe(self.load_seconds, model=self.model)
+        if self.is_cold_load:
+            llm_model_loads.inc(model=self.model, kind=self.kind)
+        if self.kind == "generate" and self.eval_count:
+            llm_time_to_first_token.observe(self.time_to_first_token, model=self.model)
+        if self.tokens_per_second is not None:
+            llm_tokens_per_second.observe(self.tokens_per_second, model=self.model)
+        if self.wall_seconds >= settings.llm_slow_call_seconds:
+            logger.warning(
+                f"Slow LLM call ({self.kind} on '{self.model}'): {self.wall_seconds:.1f}s total, "
+                f"queue {self.queue_seconds:.1f}s, load {self.load_seconds:.1f}s{' (cold start)' if self.is_cold_load else ''}, "
+                f"prompt {self.prompt_eval_count} tokens in {self.prompt_eval_seconds:.1f}s, "
+                f"output {self.eval_count} tokens in {self.eval_seconds:.1f}s"
+                + (f" ({self.tokens_per_second:.1f} tokens/s)" if self.tokens_per_second is not None else "")
+            )
+
+def estimate_tokens(text: str) -> int:
+    # Approximation volontairement pessimiste (~3 caractères par token pour du français)
+    return len(text) // 3 + 1
+
+class SingleFlight:
+    """Coalesces concurrent identical calls so that only one upstream request is made.
+
+    Each caller gets its own copy of the result: one modifying it does not affect the others.
+    """
+    def __init__(self):
+        self.in_flight: dict[tuple, asyncio.Task] = {}
+
+    async def do(self, key: tuple, func, *args, **kwargs):
+        llm_calls.inc(model=key[0], kind=key[1])
+        task = self.in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self.in_flight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            llm_coalesced_calls.inc(model=key[0], kind=key[1])
+        # shield: a caller that gets cancelled must not cancel the request shared with the others
+        return copy.deepcopy(await asyncio.shield(task))
+
+    def _forget(self, key: tuple, task: asyncio.Task):
+        if self.in_flight.get(key) is task:
+            del self.in_flight[key]
+        if not task.cancelled():
+            task.exception()  # marks the exception as retrieved even if every caller went away
+
+    @staticmethod
+    def make_key(model: str, kind: str, prompt, format: type[BaseModel] = None, **kwargs) -> tuple:
+        return (model, kind, json.dumps(prompt, sort_keys=True, default=str), format, json.dumps(kwargs, sort_keys=True, default=str))
+
 class LLMModel(AsyncClient):
     def __init__(self, settings: LLMSettings):
         self.host = settings.host
@@ -19,6 +128,10 @@ class LLMModel(AsyncClient):
         self.model_name = settings.model_name
         self.is_custom = settings.is_custom
         self.is_initialized = False
+        self.single_flight = SingleFlight()
+        self.keep_alive = settings.keep_alive
+        self.keep_warm_interval = settings.keep_warm_interval
+        self.is_embedding = settings.is_embedding
         if self.is_custom:
             self.from_ = settings.from_
             self.parameters = settings.parameters
@@ -88,24 +201,70 @@ class LLMModel(AsyncClient):
 
     @manage_llm_errors
     async def generate(self, prompt: str, format: type[BaseModel] = None, **kwargs):
+        key = SingleFlight.make_key(self.model_name, "generate", prompt, format, **kwargs)
+        return await self.single_flight.do(key, self._generate, prompt, format, **kwargs)
+
+    async def _generate(self, prompt: str, format: type[BaseModel] = None, **kwargs):
         kwargs['model'] = self.model_name
+        kwargs.setdefault('keep_alive', self.keep_alive)
         if format is not None:
-            response = await super().generate(prompt=json.dumps(prompt), format=format.model_json_schema(), **kwargs)
+            response = await self._timed("generate", super().generate(prompt=json.dumps(prompt, ensure_ascii=False), format=format.model_json_schema(), **kwargs))
             try:
                 formatted = format.model_validate_json(response['response'])
                 return formatted
             except ValidationError as e:
                 logger.error(f"LLM validation error: {e}")
                 raise HTTPException(status_code=status.HTTP_408_REQUEST_TIMEOUT, detail=f"LLM validation Error: {e}")
-        response = await super().generate(prompt=prompt, **kwargs)
+        response = await self._timed("generate", super().generate(prompt=prompt, **kwargs))
         return response['response']
     
     @manage_llm_errors
     async def embed(self, prompt: str, **kwargs):
+        key = SingleFlight.make_key(self.model_name, "embed", prompt, **kwargs)
+        return await self.single_flight.do(key, self._embed, prompt, **kwargs)
+
+    async def _embed(self, prompt: str, **kwargs):
         kwargs['model'] = self.model_name
-        response = await super().embed(input=prompt, **kwargs)
+        kwargs.setdefault('keep_alive', self.keep_alive)
+        response = await self._timed("embed", super().embed(input=prompt, **kwargs))
         return response['embeddings'][0]
 
+    @manage_llm_errors
+    async def embed_batch(self, prompts: list[str], **kwargs) -> list[list[float]]:
+        """Embeds several texts in a single Ollama call."""
+        if not prompts:
+            return []
+        llm_calls.inc(model=self.model_name, kind="embed_batch")
+        kwargs['model'] = self.model_name
+        kwargs.setdefault('keep_alive', self.keep_alive)
+        response = await self._timed("embed_batch", super().embed(input=prompts, **kwargs))
+        return response['embeddings']
+
+    async def warm_up(self):
+        """Loads the model in Ollama (or keeps it loaded) with an empty request."""
+        try:
+            if self.is_embedding:
+                await self._timed("warmup", super().embed(model=self.model_name, input="", keep_alive=self.keep_alive))
+            else:
+                await self._timed("warmup", super().generate(model=self.model_name, prompt="", keep_alive=self.keep_alive))
+            logger.debug(f"Model '{self.model_name}' is warm")
+        except Exception as e:
+            logger.warning(f"Warm-up of model '{self.model_name}' failed: {e}")
+
+    async def keep_warm(self):
+        if not self.keep_warm_interval:
+            return
+        while True:
+            await asyncio.sleep(self.keep_warm_interval)
+            await self.warm_up()
+
+    async def _timed(self, kind: str, request):
+        start = time.perf_counter()
+        response = await request
+        timings = LLMCallTimings.from_response(response, self.model_name, kind, time.perf_counter() - start)
+        timings.record()
+        return response
+
     def model_exists(self) -> bool:
         tries = 0
         while True:
@@ -1,11 +1,17 @@
+import hmac
 import random
-from fastapi import FastAPI
+from typing import Annotated
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.routing import APIRoute
 from fastapi.middleware.cors import CORSMiddleware
 from sqlmodel import SQLModel, Session, select, func
 from app.routers import router_account
-from app.dependencies import engine
-from app.config import logger
+from app.dependencies import engine, get_clues_llm, get_questions_llm, get_embedding_llm
+from app.config import logger, settings
+from app.metrics import metrics
+from app.tasks import run_periodically, sweep_raw_data_clusters, purge_media_blobs, reconcile_media
+from app.ingestion import shutdown_extraction_pool
+from app.leitner import DEFAULT_LEITNER_DELAYS, leitner_policies
 from app.routers import router_auth
 from app.routers import router_patient
 from app.routers import router_manager, router_questions
@@ -13,12 +19,14 @@ from sqlalchemy.exc import IntegrityError
 from contextlib import asynccontextmanager
 from sqlalchemy import cast, String
 import json
+import asyncio
 from app.routers import router_default_questions
 from app.routers import router_quiz
 from app.routers import router_statistics
+from app.routers import router_media
 
 # Load tables to metadata
-from app.models.model_tables import Account, Manager, Patient, Question, Result, Quiz, QuizQuestion, DefaultQuestions , LeitnerParameters, RawData
+from app.models.model_tables import Account, Manager, Patient, Question, Result, Quiz, QuizQuestion, DefaultQuestions , LeitnerParameters, RawData, RawDataCluster, ImportJob, MediaBlob, MediaDeletion
 
 # Unique IDs for routes for frontend client generation
 # !!! All the routes must have unique names !!!
@@ -31,8 +39,21 @@ API_PREFIX = "/api"
 async def lifespan(app: FastAPI):
     populate_default_questions()
     populate_leitner_parameters()
+    load_leitner_parameters()
+    llm_models = [model for model in (get_clues_llm(), get_questions_llm(), get_embedding_llm()) if model is not None]
+    # Preload the models so that the first clue request does not pay the model load
+    await asyncio.gather(*(model.warm_up() for model in llm_models))
+    background_jobs = [asyncio.create_task(model.keep_warm()) for model in llm_models]
+    if settings.llm_enabled and settings.raw_data_sweep_interval:
+        background_jobs.append(asyncio.create_task(run_periodically(sweep_raw_data_clusters, settings.raw_data_sweep_interval, "raw data sweep")))
+    if settings.media_gc_interval:
+        background_jobs.append(asyncio.create_task(run_periodically(purge_media_blobs, settings.media_gc_interval, "media blob purge")))
+    if settings.media_reconcile_interval:
+        background_jobs.append(asyncio.create_task(run_periodically(reconcile_media, settings.media_reconcile_interval, "media reconciliation")))
     yield
-    # Add any cleanup logic here if needed
+    for task in background_jobs:
+        task.cancel()
+    shutdown_extraction_pool()
 
 app = FastAPI(generate_unique_id_function=custom_generate_unique_id, lifespan=lifespan)
 
@@ -58,6 +79,15 @@ def read_random():
     logger.debug(f"Generated random number: {r}")
     return {"random": r}
 
+@app.get("/metrics", include_in_schema=False)
+def read_metrics(authorization: Annotated[str | None, Header()] = None):
+    # Temps et volumes des appels au LLM : absent sans METRICS_TOKEN, sinon réservé au collecteur
+    if not settings.metrics_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest((authorization or "").encode(), f"Bearer {settings.metrics_token}".encode()):
+        raise HTTPException(status_code=401, detail="Invalid metrics token", headers={"WWW-Authenticate": "Bearer"})
+    return metrics.snapshot()
+
 app.include_router(router_account.router, prefix=f"{API_PREFIX}/accounts", tags=["account"])
 app.include_router(router_auth.router, prefix=f"{API_PREFIX}/auth", tags=["auth"])
 app.include_router(router_patient.router, prefix=f"{API_PREFIX}/patients", tags=["patient"])
@@ -66,6 +96,7 @@ app.include_router(router_questions.router, prefix=f"{API_PREFIX}/questions", ta
 app.include_router(router_default_questions.router, prefix=f"{API_PREFIX}/default-questions", tags=["default-questions"])
 app.include_router(router_quiz.router, prefix=f"{API_PREFIX}/quiz", tags=["quiz"])
 app.include_router(router_statistics.router, prefix=f"{API_PREFIX}/statistics", tags=["statistics"])
+app.include_router(router_media.router, prefix=f"{API_PREFIX}/media", tags=["media"])
 
 SQLModel.metadata.create_all(engine)
 logger.info("Database tables created")
@@ -88,11 +119,16 @@ def populate_default_questions():
             session.commit()
 
 def populate_leitner_parameters():
-    delays = ["0 seconds", "1 day", "2 days", "4 days", "7 days", "14 days", "30 days"]
     with Session(engine) as session:
         table_count = session.exec(select(func.count(LeitnerParameters.box_number))).first()
         if table_count == 0:
-            for i, delay in enumerate(delays):
+            for i, delay in enumerate(DEFAULT_LEITNER_DELAYS):
                 session.add(LeitnerParameters(box_number=i+1, leitner_delay=delay))
             session.commit()
-            logger.info("Leitner parameters populated")
\ No newline at end of file
+            logger.info("Leitner parameters populated")
+
+def load_leitner_parameters():
+    # Lue une seule fois : les quiz et les réponses n'interrogent plus la table
+    with Session(engine) as session:
+        policy = leitner_policies.reload(session)
+    logger.info(f"Leitner policy loaded: {policy.max_box} boxes")
@@ -0,0 +1,53 @@
+import base64
+import hashlib
+import hmac
+import math
+import time
+from urllib.parse import urlencode
+from fastapi import HTTPException
+from app.config import settings
+from app.storage import storage_key
+
+MEDIA_URL_PREFIX = "api/media"
+
+def _signing_key() -> bytes:
+    # Clé dérivée : une signature de lien ne peut pas servir de jeton et inversement
+    secret = settings.media_url_secret or settings.token_secret_key
+    return hashlib.sha256(b"media-url:" + secret.encode()).digest()
+
+def media_signature(media_path: str, expires: int, version: str | None = None) -> str:
+    message = f"{media_path}\n{expires}\n{version or ''}".encode()
+    digest = hmac.new(_signing_key(), message, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+def media_expiry(now: float | None = None) -> int:
+    # Arrondie à la tranche suivante : la même URL est renvoyée pendant toute la tranche, le cache client reste valable
+    now = time.time() if now is None else now
+    bucket = settings.media_url_bucket_seconds
+    return int(math.ceil((now + settings.media_url_ttl_seconds) / bucket) * bucket)
+
+def to_media_path(file_path: str) -> str | None:
+    try:
+        return storage_key(file_path)
+    except ValueError:
+        return None
+
+def sign_media_url(base_url: str, file_path: str | None, version: str | None = None, now: float | None = None) -> str | None:
+    """Expiring URL to a media file, served without authentication nor database access."""
+    if not file_path:
+        return None
+    media_path = to_media_path(file_path)
+    if media_path is None:
+        return None
+    expires = media_expiry(now)
+    query = {"expires": expires, "signature": media_signature(media_path, expires, version)}
+    if version:
+        query["v"] = version
+    return f"{base_url}{MEDIA_URL_PREFIX}/{media_path}?{urlencode(query)}"
+
+def verify_media_signature(media_path: str, expires: int, signature: str, version: str | None = None, now: float | None = None) -> None:
+    now = time.time() if now is None else now
+    if not hmac.compare_digest(signature, media_signature(media_path, expires, version)):
+        raise HTTPException(status_code=403, detail="Invalid media signature")
+    if expires < now:
+        raise HTTPException(status_code=403, detail="Media link expired")
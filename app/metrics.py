@@ -0,0 +1,89 @@
+from collections import defaultdict
+from threading import Lock
+
+# Bornes cumulées (<=), en secondes par défaut
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+class Counter:
+    def __init__(self, name: str, description: str = ""):
+        self.name = name
+        self.description = description
+        self._values = defaultdict(float)
+        self._lock = Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        with self._lock:
+            self._values[_labels_key(labels)] += amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_labels_key(labels), 0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "description": self.description,
+                "type": "counter",
+                "values": [{"labels": dict(key), "value": value} for key, value in self._values.items()],
+            }
+
+class Histogram:
+    def __init__(self, name: str, description: str = "", buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        with self._lock:
+            series = self._values.setdefault(_labels_key(labels), {"count": 0, "sum": 0.0, "buckets": [0] * len(self.buckets)})
+            series["count"] += 1
+            series["sum"] += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+
+    def count(self, **labels) -> int:
+        series = self._values.get(_labels_key(labels))
+        return series["count"] if series else 0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "description": self.description,
+                "type": "histogram",
+                "values": [
+                    {
+                        "labels": dict(key),
+                        "count": series["count"],
+                        "sum": series["sum"],
+                        "buckets": {str(bound): count for bound, count in zip(self.buckets, series["buckets"])},
+                    }
+                    for key, series in self._values.items()
+                ],
+            }
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = Lock()
+
+    def counter(self, name: str, description: str = "") -> Counter:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Counter(name, description)
+            return self._metrics[name]
+
+    def histogram(self, name: str, description: str = "", buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, description, buckets)
+            return self._metrics[name]
+
+    def snapshot(self) -> dict:
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+metrics = MetricsRegistry()
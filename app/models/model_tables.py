@@ -2,11 +2,24 @@ from datetime import date, datetime
 from typing import Optional, Any
 from sqlmodel import Field, SQLModel
 from sqlalchemy.dialects.postgresql import JSON
-from sqlalchemy import DateTime, text, Interval
-from pgvector.sqlalchemy import Vector
+from sqlalchemy import DateTime, text, Interval, Index
+from pgvector.sqlalchemy import Vector, HALFVEC, BIT
 from pydantic import ConfigDict
 from app.config import settings
 
+def embedding_type():
+    # halfvec divise par deux la taille des embeddings, la colonne binaire sert au premier filtrage
+    if settings.embedding_compact:
+        return HALFVEC(settings.embedding_dimensions)
+    return Vector
+
+def embedding_indexes(table_name: str) -> tuple:
+    if not (settings.llm_enabled and settings.embedding_compact):
+        return ()
+    return (
+        Index(f"ix_{table_name}_embedding_binary", "embedding_binary", postgresql_using="hnsw", postgresql_ops={"embedding_binary": "bit_hamming_ops"}),
+    )
+
 class BaseTable(SQLModel):
     id: Optional[int] = Field(default=None, primary_key=True)
     created_at: datetime | None = Field(
@@ -35,6 +48,7 @@ class Account(BaseTable, table=True):
     patient_id: Optional[int] = Field(default=None, foreign_key="patient.id", unique=True, ondelete="SET NULL")
     username: str = Field(unique=True)
     password_hash: str
+    leitner_delays: Optional[list[int]] = Field(default=None, sa_type=JSON, description="Delays of the Leitner boxes in seconds, box 1 first. NULL: those of LeitnerParameters")
 
 
 class Manager(BaseTable, table=True):
@@ -44,6 +58,7 @@ class Manager(BaseTable, table=True):
     email: str = Field(unique=True)
     relationship: str
     pp_path: Optional[str] = Field(default=None, description="profile picture")
+    pp_sha256: Optional[str] = Field(default=None, description="profile picture content hash")
 
 
 class Question(BaseTable, table=True):
@@ -51,22 +66,70 @@ class Question(BaseTable, table=True):
     category: str
     exercise: dict = Field(sa_type=JSON)
     if settings.llm_enabled:
-        embedding: Optional[Any] = Field(sa_type=Vector)
+        embedding: Optional[Any] = Field(sa_type=embedding_type())
+        if settings.embedding_compact:
+            embedding_binary: Optional[Any] = Field(default=None, sa_type=BIT(settings.embedding_dimensions))
+        neighbour_ids: Optional[list[int]] = Field(default=None, sa_type=JSON, description="nearest questions, computed with the embedding")
     account_id: int = Field(foreign_key="account.id", ondelete="CASCADE")
     created_by: Optional[int] = Field(foreign_key="manager.id", nullable=True, ondelete="SET NULL")
     edited_by: Optional[int] = Field(foreign_key="manager.id", nullable=True, ondelete="SET NULL")
     image_path: Optional[str] = Field(default=None, description="question image path")
+    image_sha256: Optional[str] = Field(default=None, description="question image content hash")
+
+    __table_args__ = embedding_indexes("question")
 
 
 class RawData(BaseTable, table=True):
     account_id: int = Field(foreign_key="account.id", ondelete="CASCADE")
     text: str
     if settings.llm_enabled:
-        embedding: Optional[Any] = Field(sa_type=Vector)
+        embedding: Optional[Any] = Field(sa_type=embedding_type())
+        if settings.embedding_compact:
+            embedding_binary: Optional[Any] = Field(default=None, sa_type=BIT(settings.embedding_dimensions))
     created_by: Optional[int] = Field(foreign_key="manager.id", nullable=True, ondelete="SET NULL")
     edited_by: Optional[int] = Field(foreign_key="manager.id", nullable=True, ondelete="SET NULL")
     file_path: Optional[str] = Field(default=None, description="raw data file path")
+    file_sha256: Optional[str] = Field(default=None, description="raw data file content hash")
     used_for_question_generation: Optional[int] = Field(foreign_key="question.id", nullable=True, default=None, ondelete="SET NULL")
+    cluster_id: Optional[int] = Field(foreign_key="rawdatacluster.id", nullable=True, default=None, ondelete="SET NULL", index=True)
+    import_job_id: Optional[int] = Field(foreign_key="importjob.id", nullable=True, default=None, ondelete="SET NULL", index=True)
+    claimed_at: Optional[datetime] = Field(default=None, sa_type=DateTime(timezone=True), nullable=True, description="claimed for question generation")
+
+    __table_args__ = embedding_indexes("rawdata")
+
+
+class RawDataCluster(BaseTable, table=True):
+    account_id: int = Field(foreign_key="account.id", ondelete="CASCADE")
+    size: int = Field(default=0)
+    used: bool = Field(default=False)
+
+    __table_args__ = (
+        Index("ix_rawdatacluster_open", "account_id", "size", postgresql_where=text("NOT used")),
+    )
+
+
+class ImportJob(BaseTable, table=True):
+    account_id: int = Field(foreign_key="account.id", ondelete="CASCADE")
+    created_by: Optional[int] = Field(foreign_key="manager.id", nullable=True, ondelete="SET NULL")
+    filename: str
+    file_path: Optional[str] = Field(default=None, description="uploaded file path")
+    file_sha256: Optional[str] = Field(default=None, description="uploaded file content hash")
+    status: str = Field(default="pending", description="pending, extracting, embedding, done or failed")
+    chunks_total: int = Field(default=0)
+    chunks_done: int = Field(default=0)
+    error: Optional[str] = Field(default=None)
+
+
+class MediaBlob(BaseTable, table=True):
+    sha256: str = Field(unique=True, index=True)
+    size: int
+    path: str = Field(index=True)
+    refcount: int = Field(default=0)
+
+
+class MediaDeletion(BaseTable, table=True):
+    # Fichier à supprimer par le garbage collector, enregistré dans la transaction qui le déréférence
+    path: str
 
 
 class Result(BaseTable, table=True):
@@ -76,6 +139,11 @@ class Result(BaseTable, table=True):
 
 class Quiz(BaseTable, table=True):
     patient_id: int = Field(foreign_key="patient.id")
+    status: str = Field(default="active", description="active, or pending: composed in advance and not shown yet")
+    number_of_questions: Optional[int] = Field(default=None, description="number of questions asked for")
+
+    # Un seul quiz en attente par patient, même si deux dernières réponses arrivent en même temps
+    __table_args__ = (Index("ix_quiz_pending_patient", "patient_id", unique=True, postgresql_where=text("status = 'pending'")),)
 
 
 class QuizQuestion(SQLModel, table=True):
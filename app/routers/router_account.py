@@ -1,10 +1,11 @@
 from fastapi import APIRouter, HTTPException, Depends
 from sqlmodel import Session
 from app.models.model_tables import Account, Patient
-from app.schemas.schema_account import AccountRead, AccountCreate
+from app.schemas.schema_account import AccountRead, AccountCreate, LeitnerDelaysRead, LeitnerDelaysUpdate
 from app.schemas.schema_patient import PatientCreate
 from app.dependencies import get_session, get_password_hash, get_current_account
-from app.crud.crud_account import create_account, read_account_by_id, update_account, delete_account
+from app.crud.crud_account import create_account, read_account_by_id, update_account, delete_account, update_leitner_delays
+from app.leitner import leitner_policies
 from app.crud.crud_patient import create_patient
 from typing import Annotated
 
@@ -49,4 +50,14 @@ def update_account_route(current_account: Annotated[Account, Depends(get_current
 def delete_account_route(current_account: Annotated[Account, Depends(get_current_account)], session: Annotated[Session, Depends(get_session)]) -> dict:
     if not delete_account(session, current_account):
         raise HTTPException(status_code=404, detail="Account not found") # pragma: no cover (security measure)
-    return {"detail": "Account deleted successfully"}
\ No newline at end of file
+    return {"detail": "Account deleted successfully"}
+
+@router.get("/leitner-delays", response_model=LeitnerDelaysRead, description="Delays of the Leitner boxes applied to the account's quizzes, in seconds.")
+def read_leitner_delays_route(current_account: Annotated[Account, Depends(get_current_account)]) -> LeitnerDelaysRead:
+    policy = leitner_policies.for_account(current_account)
+    return LeitnerDelaysRead(delays=policy.to_seconds(), is_default=policy is leitner_policies.default)
+
+@router.put("/leitner-delays", response_model=LeitnerDelaysRead, description="Overrides the delays of the Leitner boxes for the account. There can be fewer boxes than the default, not more.")
+def update_leitner_delays_route(current_account: Annotated[Account, Depends(get_current_account)], delays: LeitnerDelaysUpdate, session: Annotated[Session, Depends(get_session)]) -> LeitnerDelaysRead:
+    updated_account = update_leitner_delays(session, current_account, delays.delays)
+    return read_leitner_delays_route(updated_account)
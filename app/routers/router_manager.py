@@ -1,11 +1,14 @@
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Query
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Query, Request
 from sqlmodel import Session
 from app.models.model_tables import Account, Manager
 from app.schemas.schema_manager import ManagerRead, ManagerCreate, ManagerUpdate, PaginatedManagersResponse
-from app.dependencies import get_session, get_current_account, get_current_manager
-from app.crud.crud_manager import create_manager, update_manager, delete_manager, read_managers, save_manager_profile_picture
+from app.dependencies import get_session, get_current_account, get_current_account_id, get_current_manager
+from app.config import settings
+from app.crud.crud_manager import create_manager, update_manager, delete_manager, read_managers, save_manager_profile_picture, read_manager_picture_info
 from typing import Annotated, Optional, Union
 from fastapi.responses import FileResponse
+from app.images import VARIANT_MAX_DIMENSION
+from app.http_cache import make_etag, variant_tag, is_not_modified, not_modified_response, media_key, serve_media
 import os
 
 MEDIA_ROOT = "media/pp"
@@ -68,13 +71,22 @@ async def upload_profile_picture(current_manager: Annotated[Manager, Depends(get
     ext = os.path.splitext(file.filename)[1].lower()
     if ext not in allowed_exts:
         raise HTTPException(status_code=400, detail="Only .png, .jpeg, .jpg files are allowed")
-    if current_manager.pp_path and os.path.exists(current_manager.pp_path):
-        os.remove(current_manager.pp_path)
-    file_path = save_manager_profile_picture(session, current_manager, file, ext)
+    file_path = await save_manager_profile_picture(session, current_manager, file, ext)
     return {"detail": "Profile picture uploaded", "pp_path": file_path}
 
-@router.get("/{manager_id}/profile-picture")
-def get_profile_picture(current_manager: Annotated[Manager, Depends(get_current_manager)]) -> FileResponse:
-    if not current_manager.pp_path or not os.path.exists(current_manager.pp_path):
-        raise HTTPException(status_code=404, detail="Profile picture not found")
-    return FileResponse(current_manager.pp_path)
\ No newline at end of file
+@router.get("/{manager_id}/profile-picture", description="Returns the profile picture, resized to fit in w x h and/or converted when asked.")
+def get_profile_picture(
+    manager_id: int,
+    current_account_id: Annotated[int, Depends(get_current_account_id)],
+    session: Annotated[Session, Depends(get_session)],
+    request: Request,
+    w: Optional[int] = Query(None, ge=1, le=VARIANT_MAX_DIMENSION, description="Maximum width in pixels"),
+    h: Optional[int] = Query(None, ge=1, le=VARIANT_MAX_DIMENSION, description="Maximum height in pixels"),
+    format: Optional[str] = Query(None, description="webp, jpeg or png"),
+) -> FileResponse:
+    picture = read_manager_picture_info(session, manager_id, current_account_id)
+    key = media_key(picture.pp_path, "Profile picture not found")
+    etag = make_etag(picture.pp_sha256, key, variant_tag(w, h, format))
+    if is_not_modified(request, etag):
+        return not_modified_response(etag, settings.media_cache_max_age)
+    return serve_media(request, key, picture.pp_sha256, etag, settings.media_cache_max_age, w, h, format)
\ No newline at end of file
@@ -0,0 +1,36 @@
+from fastapi import APIRouter, Query, Request
+from typing import Optional
+from app.config import settings
+from app.media_urls import verify_media_signature
+from app.images import VARIANT_MAX_DIMENSION
+from app.http_cache import make_etag, variant_tag, is_not_modified, not_modified_response, serve_media
+import os
+import time
+
+IMAGE_EXTENSIONS = {".png", ".jpeg", ".jpg", ".webp"}
+
+router = APIRouter()
+
+@router.get("/{media_path:path}", description="Serves a media file from a signed URL (see QuestionRead.image_url). No token needed.")
+def get_media_file(
+    media_path: str,
+    request: Request,
+    expires: int = Query(...),
+    signature: str = Query(...),
+    v: Optional[str] = Query(None, description="content hash of the file"),
+    w: Optional[int] = Query(None, ge=1, le=VARIANT_MAX_DIMENSION, description="Maximum width in pixels (images)"),
+    h: Optional[int] = Query(None, ge=1, le=VARIANT_MAX_DIMENSION, description="Maximum height in pixels (images)"),
+    format: Optional[str] = Query(None, description="webp, jpeg or png (images)"),
+):
+    # La signature suffit : ni JWT ni base de données
+    verify_media_signature(media_path, expires, signature, v)
+    is_image = os.path.splitext(media_path)[1].lower() in IMAGE_EXTENSIONS
+    if not is_image:
+        w = h = format = None
+    # Le client ne doit pas garder le fichier au-delà de l'expiration du lien
+    max_age = max(0, min(settings.media_cache_max_age, expires - int(time.time())))
+    # Le chemin signé est directement la clé dans le stockage
+    etag = make_etag(v, media_path, variant_tag(w, h, format))
+    if is_not_modified(request, etag):
+        return not_modified_response(etag, max_age)
+    return serve_media(request, media_path, v, etag, max_age, w, h, format)
@@ -1,30 +1,34 @@
 from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Request, Form, BackgroundTasks, Query
 from sqlmodel import Session
-from app.schemas.schema_question import QuestionCreate, QuestionRead, QuestionUpdate, Clues, PaginatedQuestionsResponse, RawDataRead
-from app.dependencies import get_current_account, get_session, get_current_manager, get_validated_question, get_current_question, get_clues_llm, get_embedding_llm, get_current_raw_data
+from app.schemas.schema_question import QuestionCreate, QuestionRead, QuestionUpdate, Clues, PaginatedQuestionsResponse, RawDataRead, ImportJobRead
+from app.dependencies import get_image_url as get_question_image_url
+from app.dependencies import get_current_account, get_current_account_id, get_session, get_current_manager, get_validated_question, get_current_question, get_clues_llm, get_embedding_llm, get_current_raw_data
 from app.models.model_tables import Account, Manager, Question, RawData
-from app.crud.crud_questions import create_question, read_questions, update_question, delete_question, get_nearest_questions, create_raw_data, get_raw_data, get_raw_data_cluster
+from app.crud.crud_questions import create_question, read_questions, update_question, delete_question, build_clues_prompt, create_raw_data, get_raw_data, get_raw_data_cluster, create_import_job, read_import_job, read_question_image_info, read_raw_data_file_info
+from app.ingestion import supported_extensions
+from app.tasks import run_import_job
 from typing import List, Annotated, Optional, Union
 from jsonschema import validate, ValidationError
 from fastapi.responses import FileResponse
 import os
 import json
+from app.crud.crud_media import store_upload, release_media
+from app.images import VARIANT_MAX_DIMENSION
+from app.media_urls import sign_media_url
+from app.http_cache import make_etag, variant_tag, is_not_modified, not_modified_response, media_key, serve_media
+from app.config import settings
 from pydantic import ValidationError as PydanticValidationError
 from app.llm import LLMModel
 
-QUESTION_IMAGES_ROOT = "media/question_images"
-RAW_DATA_ROOT = "media/raw_data"
 
 router = APIRouter()
 
 def get_image_url(request: Request, question: Question):
-    if question.image_path:
-        return str(request.base_url) + f"api/questions/{question.id}/image"
-    return None
+    return get_question_image_url(str(request.base_url), question)
 
 def get_file_url(request: Request, raw_data: RawData):
     if raw_data.file_path:
-        return str(request.base_url) + f"api/questions/data/{raw_data.id}/file"
+        return sign_media_url(str(request.base_url), raw_data.file_path, raw_data.file_sha256)
     return None
 
 @router.post("/", response_model=QuestionRead)
@@ -44,12 +48,9 @@ def create_question_route(question: Annotated[str, Form(...)], current_manager:
         ext = os.path.splitext(image.filename)[1].lower()
         if ext not in allowed_exts:
             raise HTTPException(status_code=400, detail="Only .png, .jpeg, .jpg files are allowed")
-        os.makedirs(QUESTION_IMAGES_ROOT, exist_ok=True)
-        filename = f"question_{current_manager.id}_{image.filename}"
-        file_path = os.path.join(QUESTION_IMAGES_ROOT, filename)
-        with open(file_path, "wb") as f:
-            f.write(image.file.read())
-        question_data["image_path"] = file_path
+        blob = store_upload(session, image, ext, settings.upload_max_image_bytes)
+        question_data["image_path"] = blob.path
+        question_data["image_sha256"] = blob.sha256
     question_to_create = Question(**question_data)
     return create_question(session, question_to_create, current_manager=current_manager, embedding_model=embedding_model, background_tasks=background_tasks)
 
@@ -98,30 +99,35 @@ def update_question_route(question: Annotated[str, Form(...)], current_question:
 def delete_question_route(current_question: Annotated[Question, Depends(get_current_question)], session: Annotated[Session, Depends(get_session)]) -> dict:
     if not current_question:
         raise HTTPException(status_code=400, detail="question_id query parameter required")
-    if current_question.image_path and os.path.exists(current_question.image_path):
-        os.remove(current_question.image_path)
+    release_media(session, [(current_question.image_sha256, current_question.image_path)])
     delete_question(session, current_question)
     return {"detail": "Question deleted successfully"}
 
-@router.get("/{question_id}/image")
-def get_question_image(current_question: Annotated[Question, Depends(get_current_question)]):
-    if not current_question.image_path or not os.path.exists(current_question.image_path):
-        raise HTTPException(status_code=404, detail="Image not found")
-    return FileResponse(current_question.image_path)
+@router.get("/{question_id}/image", description="Returns the question image, resized to fit in w x h and/or converted when asked.")
+def get_question_image(
+    question_id: int,
+    current_account_id: Annotated[int, Depends(get_current_account_id)],
+    session: Annotated[Session, Depends(get_session)],
+    request: Request,
+    w: Optional[int] = Query(None, ge=1, le=VARIANT_MAX_DIMENSION, description="Maximum width in pixels"),
+    h: Optional[int] = Query(None, ge=1, le=VARIANT_MAX_DIMENSION, description="Maximum height in pixels"),
+    format: Optional[str] = Query(None, description="webp, jpeg or png"),
+):
+    image = read_question_image_info(session, question_id, current_account_id)
+    key = media_key(image.image_path, "Image not found")
+    # Validation avant toute génération de variante ou lecture du stockage
+    etag = make_etag(image.image_sha256, key, variant_tag(w, h, format))
+    if is_not_modified(request, etag):
+        return not_modified_response(etag, settings.media_cache_max_age)
+    return serve_media(request, key, image.image_sha256, etag, settings.media_cache_max_age, w, h, format)
 
 @router.get("/{question_id}/clues", response_model=Clues)
 async def get_clues_route(current_question: Annotated[Question, Depends(get_current_question)], clues_llm: Annotated[LLMModel, Depends(get_clues_llm)], embedding_model: Annotated[LLMModel, Depends(get_embedding_llm)], session: Annotated[Session, Depends(get_session)]) -> Clues:
     if clues_llm is None or embedding_model is None:
         raise HTTPException(status_code=503, detail="LLM service is not activated")
     
-    nearest_questions = get_nearest_questions(session, current_question)
-
-    prompt = f"{current_question.exercise}\n\n"
-    if nearest_questions:
-        prompt += f"context: {nearest_questions}\n\n"
-    prompt += "Vérifie bien que la réponse N'EST PAS dans les indices que tu donnes."
-
-    return await clues_llm.generate(current_question.exercise, format=Clues)
+    prompt = build_clues_prompt(session, current_question)
+    return await clues_llm.generate(prompt, format=Clues)
 
 @router.post("/data", response_model=RawDataRead)
 def import_data_route(
@@ -133,27 +139,25 @@ def import_data_route(
     file: UploadFile = File(None),
     request: Request = None
 ) -> RawDataRead:
-    file_path = None
+    blob = None
     if file:
-        os.makedirs(RAW_DATA_ROOT, exist_ok=True)
-        file_path = os.path.join(RAW_DATA_ROOT, f"raw_data")
+        ext = os.path.splitext(os.path.basename(file.filename or ""))[1].lower()
+        allowed_exts = supported_extensions()
+        if ext not in allowed_exts:
+            raise HTTPException(status_code=400, detail=f"Only {', '.join(sorted(allowed_exts))} files are allowed")
+        blob = store_upload(session, file, ext, settings.upload_max_raw_data_bytes)
 
     raw_data = create_raw_data(
         session=session,
         text=text,
         current_account=current_account,
         current_manager=current_manager,
-        file_path=file_path,
-        filename=file.filename if file else None,
+        file_path=blob.path if blob else None,
+        file_sha256=blob.sha256 if blob else None,
         embedding_model=get_embedding_llm(),
         background_tasks=background_tasks
     )
 
-    if file:
-        file_path=raw_data.file_path
-        with open(file_path, "wb") as f:
-            f.write(file.file.read())
-
     return RawDataRead(
         id=raw_data.id,
         text=raw_data.text,
@@ -164,6 +168,34 @@ def import_data_route(
         image_url=get_file_url(request, raw_data)
     )
 
+@router.post("/data/import", response_model=ImportJobRead, status_code=202, description="Imports a txt, markdown or PDF file as raw data in the background. Poll the returned job for progress.")
+def import_file_route(
+    current_account: Annotated[Account, Depends(get_current_account)],
+    current_manager: Annotated[Manager, Depends(get_current_manager)],
+    session: Annotated[Session, Depends(get_session)],
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+) -> ImportJobRead:
+    filename = os.path.basename(file.filename or "")
+    ext = os.path.splitext(filename)[1].lower()
+    allowed_exts = supported_extensions()
+    if ext not in allowed_exts:
+        raise HTTPException(status_code=400, detail=f"Only {', '.join(sorted(allowed_exts))} files are allowed")
+
+    blob = store_upload(session, file, ext, settings.upload_max_raw_data_bytes)
+    import_job = create_import_job(session, filename, current_account, current_manager, blob.path, blob.sha256)
+
+    background_tasks.add_task(run_import_job, import_job.id)
+    return ImportJobRead.model_validate(import_job)
+
+@router.get("/data/import/{import_job_id}", response_model=ImportJobRead)
+def read_import_job_route(
+    import_job_id: int,
+    current_account: Annotated[Account, Depends(get_current_account)],
+    session: Annotated[Session, Depends(get_session)],
+) -> ImportJobRead:
+    return ImportJobRead.model_validate(read_import_job(session, import_job_id, current_account))
+
 @router.get("/data", response_model=list[RawDataRead])
 def get_raw_data_route(
     current_account: Annotated[Account, Depends(get_current_account)],
@@ -186,10 +218,14 @@ def get_raw_data_route(
         ))
     return raw_data_read_list
 
-@router.get("/data/{raw_data_id}/file")
+@router.get("/data/{raw_data_id}/file", description="Returns the raw data file. Supports conditional and byte-range requests.")
 def get_raw_data_file_route(
-    raw_data: Annotated[RawData, Depends(get_current_raw_data)]
+    raw_data_id: int,
+    current_account_id: Annotated[int, Depends(get_current_account_id)],
+    session: Annotated[Session, Depends(get_session)],
+    request: Request,
 ) -> FileResponse:
-    if not raw_data.file_path or not os.path.exists(raw_data.file_path):
-        raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(raw_data.file_path)
\ No newline at end of file
+    raw_data = read_raw_data_file_info(session, raw_data_id, current_account_id)
+    key = media_key(raw_data.file_path)
+    etag = make_etag(raw_data.file_sha256, key)
+    return serve_media(request, key, raw_data.file_sha256, etag, settings.media_cache_max_age)
\ No newline at end of file
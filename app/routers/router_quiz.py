@@ -1,15 +1,17 @@
-from app.schemas.schema_quiz import QuizRead, ResultRead
+from app.schemas.schema_quiz import QuizRead, ResultRead, AnswerCreate, AnswerOutcome
 from sqlmodel import Session
-from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi import APIRouter, HTTPException, Depends, Request, Body, BackgroundTasks
 from app.dependencies import get_current_account, get_session, get_current_manager, get_validated_question, get_current_question, get_current_quiz, get_validated_answer
 from app.models.model_tables import Account, Manager, Question, Quiz, QuizQuestion, Result
 from typing import List, Annotated
-from app.crud.crud_quiz import create_leitner_quiz, have_all_questions_been_answered, save_answer, read_quiz_by_id, get_latest_quiz_remaining_questions
+from app.crud.crud_quiz import create_leitner_quiz, have_all_questions_been_answered, save_answer, save_answers, read_quiz_by_id, get_latest_quiz_remaining_questions, activate_pending_quiz, schedule_next_quiz
+from app.config import quiz_answers_max_batch
+from app.leitner import leitner_policies
 from app.schemas.schema_quiz import ResultRead
 
 router = APIRouter()
 
-@router.get("/{number_of_questions}", response_model=QuizRead, description="Creates a Leitner quiz with the specified number of questions. If the previous quiz has not completely been answered, it will be returned instead.")
+@router.get("/{number_of_questions}", response_model=QuizRead, description="Returns a Leitner quiz with the specified number of questions, usually composed in advance after the last answer of the previous one. If the previous quiz has not completely been answered, it will be returned instead.")
 def read_leitner_quiz_route(number_of_questions: int, current_account: Annotated[Account, Depends(get_current_account)], session: Annotated[Session, Depends(get_session)], request: Request) -> QuizRead:
     base_url = str(request.base_url)
     if not current_account.patient_id:
@@ -17,6 +19,9 @@ def read_leitner_quiz_route(number_of_questions: int, current_account: Annotated
     latest_quiz_remaining_questions = get_latest_quiz_remaining_questions(current_account, session, base_url)
     if latest_quiz_remaining_questions:
         return latest_quiz_remaining_questions
+    pending_quiz = activate_pending_quiz(number_of_questions, current_account, session, base_url)
+    if pending_quiz:
+        return pending_quiz
     return create_leitner_quiz(number_of_questions, current_account, session, base_url)
 
 @router.get("/", response_model=QuizRead)
@@ -25,8 +30,16 @@ def read_quiz_by_id_route(current_quiz: Annotated[Quiz, Depends(get_current_quiz
     return read_quiz_by_id(current_quiz, session, base_url)
 
 @router.post("/", response_model=ResultRead)
-def answer_question_route(answer: Annotated[Result, Depends(get_validated_answer)], current_quiz: Annotated[Quiz, Depends(get_current_quiz)], current_question: Annotated[Question, Depends(get_current_question)], session: Annotated[Session, Depends(get_session)]) -> ResultRead:
+def answer_question_route(answer: Annotated[Result, Depends(get_validated_answer)], current_quiz: Annotated[Quiz, Depends(get_current_quiz)], current_question: Annotated[Question, Depends(get_current_question)], current_account: Annotated[Account, Depends(get_current_account)], session: Annotated[Session, Depends(get_session)], background_tasks: BackgroundTasks) -> ResultRead:
     if not current_question:
         raise HTTPException(status_code=400, detail="question_id query parameter required")
 
-    return save_answer(answer, current_quiz, current_question, session)
\ No newline at end of file
+    result = save_answer(answer, current_quiz, current_question, session, leitner_policies.for_account(current_account))
+    schedule_next_quiz(session, current_quiz, current_account, background_tasks)
+    return result
+
+@router.post("/{quiz_id}/answers", response_model=list[AnswerOutcome], description="Saves several answers to the quiz at once (e.g. queued offline). Each answer gets its own outcome: 201 when saved, otherwise the error it would have had alone (400 when already submitted, or sent twice in the batch).")
+def answer_questions_route(answers: Annotated[list[AnswerCreate], Body(min_length=1, max_length=quiz_answers_max_batch)], current_quiz: Annotated[Quiz, Depends(get_current_quiz)], current_account: Annotated[Account, Depends(get_current_account)], session: Annotated[Session, Depends(get_session)], background_tasks: BackgroundTasks) -> list[AnswerOutcome]:
+    outcomes = save_answers(answers, current_quiz, session, leitner_policies.for_account(current_account))
+    schedule_next_quiz(session, current_quiz, current_account, background_tasks)
+    return outcomes
@@ -1,4 +1,5 @@
-from sqlmodel import SQLModel
+from sqlmodel import SQLModel, Field
+from typing import Optional
 from datetime import datetime
 
 class AccountCreate(SQLModel):
@@ -8,4 +9,11 @@ class AccountCreate(SQLModel):
 class AccountRead(SQLModel):
     username: str
     created_at: datetime
-    updated_at: datetime
\ No newline at end of file
+    updated_at: datetime
+
+class LeitnerDelaysUpdate(SQLModel):
+    delays: Optional[list[int]] = Field(default=None, min_length=1, description="Delay of each Leitner box in seconds, box 1 first. null restores the default delays.")
+
+class LeitnerDelaysRead(SQLModel):
+    delays: list[int]
+    is_default: bool
@@ -1,8 +1,8 @@
 from sqlmodel import SQLModel
 from datetime import datetime
 from app.schemas.schema_pagination import PaginatedResponse
-from pydantic import BaseModel
-from typing import Type, Union
+from pydantic import BaseModel, Field
+from typing import Type, Union, Literal, Annotated
 import random
 
 class QuestionCreate(SQLModel):
@@ -36,6 +36,16 @@ class RawDataRead(SQLModel):
     edited_by: int | None = None
     image_url: str | None = None
 
+class ImportJobRead(SQLModel):
+    id: int
+    filename: str
+    status: str
+    chunks_total: int
+    chunks_done: int
+    error: str | None = None
+    created_at: datetime
+    updated_at: datetime
+
 class QuestionExercise(SQLModel):
     question: str
     answer: str
@@ -116,5 +126,36 @@ def get_random_typed_question_create() -> QuestionGenerate:
         question_class=question_class
     )
 
+# Génération de plusieurs exercices de types variés en un seul appel au LLM
+
+class SimpleQuestionItem(BaseModel):
+    type: Literal["question"]
+    exercise: QuestionExercise
+
+class MCQQuestionItem(BaseModel):
+    type: Literal["mcq"]
+    exercise: MultipleChoiceQuestionExercise
+
+class MissingWordsQuestionItem(BaseModel):
+    type: Literal["missing_words"]
+    exercise: MissingWordsExercise
+
+class MatchElementsQuestionItem(BaseModel):
+    type: Literal["match_elements"]
+    exercise: MatchElementsExercise
+
+class ChronologicalOrderQuestionItem(BaseModel):
+    type: Literal["chronological_order"]
+    exercise: ChronologicalOrderExercise
+
+class QuestionBatchGenerate(BaseModel):
+    questions: list[Annotated[Union[SimpleQuestionItem, MCQQuestionItem, MissingWordsQuestionItem, MatchElementsQuestionItem, ChronologicalOrderQuestionItem], Field(discriminator="type")]]
+
+def get_batch_question_prompt(number_of_questions: int) -> str:
+    prompt = f"Génère {number_of_questions} exercices différents, en variant les types. Chaque exercice a un champ \"type\" et un champ \"exercise\".\n"
+    for question_type, mapping in EXERCISE_TYPE_MAPPING.items():
+        prompt += f"- type \"{question_type}\" : {mapping['prompt']}"
+    return prompt
+
 # Alias pour la réponse paginée de questions
 PaginatedQuestionsResponse = PaginatedResponse[QuestionRead]
\ No newline at end of file
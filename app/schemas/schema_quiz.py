@@ -1,4 +1,4 @@
-from sqlmodel import SQLModel
+from sqlmodel import SQLModel, Field
 from datetime import datetime
 from app.schemas.schema_question import QuestionRead
 
@@ -8,4 +8,17 @@ class QuizRead(SQLModel):
 
 class ResultRead(SQLModel):
     data: dict
-    is_correct: bool
\ No newline at end of file
+    is_correct: bool
+
+class ResultCreate(SQLModel):
+    data: dict
+    is_correct: bool | None = Field(default=None, description="Ignored: answers are graded by the server")
+
+class AnswerCreate(ResultCreate):
+    question_id: int
+
+class AnswerOutcome(SQLModel):
+    question_id: int
+    status_code: int
+    detail: str | None = None
+    result: ResultRead | None = None
\ No newline at end of file
@@ -0,0 +1,238 @@
+import io
+import os
+import shutil
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from threading import Lock
+from typing import BinaryIO, Iterator
+from app.config import settings
+
+# boto3 est optionnel : seulement nécessaire avec STORAGE_BACKEND=s3
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError: # pragma: no cover
+    boto3 = None
+
+MEDIA_ROOT = "media"
+STREAM_CHUNK_SIZE = 64 * 1024
+
+@dataclass(frozen=True)
+class StoredObject:
+    key: str
+    size: int
+    modified: float
+
+def storage_key(path: str) -> str:
+    """Storage key of a media path stored in the database ("media/blobs/ab/..." -> "blobs/ab/...")."""
+    key = os.path.relpath(path, MEDIA_ROOT).replace(os.sep, "/")
+    if key == ".." or key.startswith("../") or os.path.isabs(key):
+        raise ValueError(f"'{path}' is outside of the media root")
+    return key
+
+class Storage(ABC):
+    """Where media files live. Keys are relative paths such as "blobs/ab/cd/<sha256>.jpg"."""
+
+    @abstractmethod
+    def put_file(self, key: str, source_path: str) -> None:
+        """Stores a complete local file under `key`. The local file is consumed."""
+
+    @abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        """Readable stream of the object. Raises FileNotFoundError."""
+
+    @abstractmethod
+    def stat(self, key: str) -> StoredObject | None:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def list(self, prefix: str = "") -> Iterator[StoredObject]:
+        ...
+
+    def exists(self, key: str) -> bool:
+        return self.stat(key) is not None
+
+    def local_path(self, key: str) -> str | None:
+        """Path on this machine when the object is a local file (served with sendfile and ranges)."""
+        return None
+
+    def presigned_url(self, key: str, expires_in: int, content_type: str | None = None, content_disposition: str | None = None) -> str | None:
+        """URL the client can fetch directly, bypassing the API, when the backend supports it."""
+        return None
+
+    def iter_chunks(self, key: str, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+        with self.open(key) as stream:
+            while chunk := stream.read(chunk_size):
+                yield chunk
+
+    def fetch_to(self, key: str, destination: str) -> None:
+        os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+        with self.open(key) as stream, open(destination, "wb") as file:
+            shutil.copyfileobj(stream, file, STREAM_CHUNK_SIZE)
+
+class LocalStorage(Storage):
+    def __init__(self, root: str = MEDIA_ROOT):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        root = os.path.realpath(self.root)
+        path = os.path.realpath(os.path.join(root, key))
+        if os.path.commonpath([root, path]) != root:
+            raise FileNotFoundError(key)
+        return path
+
+    def put_file(self, key: str, source_path: str) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Même système de fichiers : simple renommage atomique
+        os.replace(source_path, path)
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self._path(key), "rb")
+
+    def stat(self, key: str) -> StoredObject | None:
+        try:
+            stat = os.stat(self._path(key))
+        except FileNotFoundError:
+            return None
+        return StoredObject(key=key, size=stat.st_size, modified=stat.st_mtime)
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def list(self, prefix: str = "") -> Iterator[StoredObject]:
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                key = os.path.relpath(os.path.join(directory, name), self.root).replace(os.sep, "/")
+                if key.startswith(prefix):
+                    stored = self.stat(key)
+                    if stored is not None:
+                        yield stored
+
+    def local_path(self, key: str) -> str | None:
+        return self._path(key)
+
+class MemoryStorage(Storage):
+    """Keeps objects in a dict. For tests and single-process development."""
+    def __init__(self):
+        self.objects: dict[str, tuple[bytes, float]] = {}
+        self._lock = Lock()
+
+    def put_file(self, key: str, source_path: str) -> None:
+        with open(source_path, "rb") as file:
+            content = file.read()
+        os.remove(source_path)
+        with self._lock:
+            self.objects[key] = (content, time.time())
+
+    def open(self, key: str) -> BinaryIO:
+        with self._lock:
+            if key not in self.objects:
+                raise FileNotFoundError(key)
+            return io.BytesIO(self.objects[key][0])
+
+    def stat(self, key: str) -> StoredObject | None:
+        with self._lock:
+            if key not in self.objects:
+                return None
+            content, modified = self.objects[key]
+            return StoredObject(key=key, size=len(content), modified=modified)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self.objects.pop(key, None)
+
+    def list(self, prefix: str = "") -> Iterator[StoredObject]:
+        with self._lock:
+            items = [(key, content, modified) for key, (content, modified) in self.objects.items() if key.startswith(prefix)]
+        for key, content, modified in items:
+            yield StoredObject(key=key, size=len(content), modified=modified)
+
+class S3Storage(Storage):
+    """S3-compatible object storage (AWS S3, MinIO, ...)."""
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: str | None = None, region: str | None = None, access_key_id: str | None = None, secret_access_key: str | None = None):
+        if boto3 is None:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires the 'boto3' package")
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key,
+        )
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def put_file(self, key: str, source_path: str) -> None:
+        # upload_file découpe en multipart au-delà de quelques Mo, sans tout charger en mémoire
+        self.client.upload_file(source_path, self.bucket, self._key(key))
+        os.remove(source_path)
+
+    def open(self, key: str) -> BinaryIO:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(key))["Body"]
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                raise FileNotFoundError(key) from e
+            raise
+
+    def stat(self, key: str) -> StoredObject | None:
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return None
+            raise
+        return StoredObject(key=key, size=head["ContentLength"], modified=head["LastModified"].timestamp())
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def list(self, prefix: str = "") -> Iterator[StoredObject]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            for item in page.get("Contents", []):
+                yield StoredObject(key=item["Key"][len(self.prefix):], size=item["Size"], modified=item["LastModified"].timestamp())
+
+    def presigned_url(self, key: str, expires_in: int, content_type: str | None = None, content_disposition: str | None = None) -> str | None:
+        params = {"Bucket": self.bucket, "Key": self._key(key)}
+        # En-têtes imposés à la réponse du stockage, comme pour un fichier servi par l'API
+        if content_type:
+            params["ResponseContentType"] = content_type
+        if content_disposition:
+            params["ResponseContentDisposition"] = content_disposition
+        return self.client.generate_presigned_url("get_object", Params=params, ExpiresIn=expires_in)
+
+def create_storage() -> Storage:
+    if settings.storage_backend == "local":
+        return LocalStorage(MEDIA_ROOT)
+    if settings.storage_backend == "memory":
+        return MemoryStorage()
+    if settings.storage_backend == "s3":
+        return S3Storage(
+            bucket=settings.s3_bucket,
+            prefix=settings.s3_prefix,
+            endpoint_url=settings.s3_endpoint_url,
+            region=settings.s3_region,
+            access_key_id=settings.s3_access_key_id,
+            secret_access_key=settings.s3_secret_access_key,
+        )
+    raise ValueError(f"Unknown storage backend: {settings.storage_backend}")
+
+storage = create_storage()
+
+def scratch_path(ext: str = "") -> str:
+    """Local temporary file for an upload being written, before it is handed to the storage."""
+    return os.path.join(MEDIA_ROOT, "tmp", f"{uuid.uuid4().hex}{ext.lower()}")
@@ -0,0 +1,206 @@
+import asyncio
+from fastapi import BackgroundTasks
+from sqlmodel import Session, select
+from app.config import logger, settings, import_chunk_characters, import_chunk_overlap, import_embedding_batch_size
+from app.dependencies import engine, get_embedding_llm
+from app.models.model_tables import Account, RawData, ImportJob
+from app.crud.crud_clustering import raw_data_available, assign_raw_data_to_cluster, claim_raw_data, release_raw_data, release_expired_claims
+from app.crud.crud_questions import get_raw_data_clusters, generate_question_from_raw_data, create_raw_data_chunks
+from app.crud.crud_embeddings import set_embedding
+from app.crud.crud_media import purge_unreferenced_blobs, process_media_deletions, reconcile_media_storage
+from app.storage import storage, storage_key, scratch_path
+from app.ingestion import extract_text_in_pool, chunk_text
+from app.metrics import metrics
+import os
+import time
+
+raw_data_sweep_clusters = metrics.counter("raw_data_sweep_clusters_total", "Raw data clusters handled by the periodic sweep, by outcome")
+import_jobs = metrics.counter("import_jobs_total", "File imports, by outcome")
+import_chunks = metrics.counter("import_chunks_total", "Raw data chunks created by file imports")
+import_seconds = metrics.histogram("import_seconds", "Duration of each file import step, by step")
+media_gc_bytes = metrics.counter("media_gc_bytes_total", "Bytes of media files removed by the garbage collector, by source")
+
+# Rows embedded before incremental clustering existed are attached a few at a time
+BACKFILL_BATCH_SIZE = 200
+
+async def run_periodically(func, interval: float, name: str):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await func()
+        except Exception as e:
+            logger.error(f"Periodic task '{name}' failed: {e}")
+
+def _accounts_with_raw_data() -> list[int]:
+    with Session(engine) as session:
+        return session.exec(
+            select(RawData.account_id).where(raw_data_available(), RawData.embedding.is_not(None)).distinct()
+        ).all()
+
+def _claim_ready_clusters(account_id: int) -> list[list[int]]:
+    """Attaches the account's unclustered raw data, then claims its ready clusters. Returns the claimed raw data ids."""
+    with Session(engine) as session:
+        account = session.get(Account, account_id)
+        if account is None:
+            return []
+        if settings.raw_data_clustering == "incremental":
+            release_expired_claims(session, account.id)
+            backfill_raw_data_clusters(session, account)
+        claimed = []
+        for cluster in get_raw_data_clusters(session, account):
+            raw_data_ids = [raw_data.id for raw_data in cluster]
+            # Un autre worker peut avoir pris une partie du cluster entre-temps
+            if claim_raw_data(session, raw_data_ids):
+                claimed.append(raw_data_ids)
+            else:
+                raw_data_sweep_clusters.inc(outcome="already_claimed")
+        return claimed
+
+async def sweep_raw_data_clusters() -> int:
+    """Turns every ready raw data cluster of every account into questions."""
+    # Requêtes kNN, commits et clustering NumPy bloquants : hors de la boucle d'évènements, les requêtes en cours continuent
+    account_ids = await asyncio.to_thread(_accounts_with_raw_data)
+
+    semaphore = asyncio.Semaphore(settings.llm_max_concurrent_generations)
+    generations = []
+    for account_id in account_ids:
+        for raw_data_ids in await asyncio.to_thread(_claim_ready_clusters, account_id):
+            generations.append(generate_from_claimed_raw_data(raw_data_ids, account_id, semaphore))
+
+    results = await asyncio.gather(*generations, return_exceptions=True)
+    failures = [result for result in results if isinstance(result, Exception)]
+    for failure in failures:
+        logger.error(f"Question generation from raw data failed: {failure}")
+    raw_data_sweep_clusters.inc(len(results) - len(failures), outcome="completed")
+    raw_data_sweep_clusters.inc(len(failures), outcome="failed")
+    if results:
+        logger.info(f"Raw data sweep: {len(results) - len(failures)} cluster(s) turned into questions, {len(failures)} failure(s)")
+    return len(results) - len(failures)
+
+def _load_raw_data(session: Session, raw_data_ids: list[int]) -> list[RawData]:
+    return session.exec(select(RawData).where(RawData.id.in_(raw_data_ids)).order_by(RawData.id)).all()
+
+async def generate_from_claimed_raw_data(raw_data_ids: list[int], account_id: int, semaphore: asyncio.Semaphore):
+    async with semaphore:
+        with Session(engine) as session:
+            cluster = await asyncio.to_thread(_load_raw_data, session, raw_data_ids)
+            background_tasks = BackgroundTasks()
+            try:
+                await generate_question_from_raw_data(cluster, account_id, session, get_embedding_llm(), background_tasks)
+            finally:
+                await asyncio.to_thread(release_raw_data, session, raw_data_ids)
+            # Embeddings of the new questions
+            await background_tasks()
+
+def backfill_raw_data_clusters(session: Session, account: Account) -> None:
+    unclustered = session.exec(
+        select(RawData).where(
+            RawData.account_id == account.id,
+            RawData.cluster_id.is_(None),
+            RawData.embedding.is_not(None),
+            raw_data_available(),
+        ).order_by(RawData.id).limit(BACKFILL_BATCH_SIZE)
+    ).all()
+    for raw_data in unclustered:
+        # Peut avoir été rattaché entre-temps comme voisin d'un autre
+        if raw_data.cluster_id is None:
+            assign_raw_data_to_cluster(session, raw_data)
+
+async def run_import_job(import_job_id: int):
+    """Extracts the text of an uploaded file, stores it as raw data chunks and embeds them in batches.
+
+    Question generation is left to the raw data sweep, which picks the new clusters up.
+    """
+    # expire_on_commit=False : les chunks restent utilisables après chaque commit sans être rechargés un par un
+    with Session(engine, expire_on_commit=False) as session:
+        import_job = session.get(ImportJob, import_job_id)
+        if import_job is None:
+            logger.warning(f"Import job {import_job_id} not found")
+            return
+        try:
+            _set_import_status(session, import_job, "extracting")
+            start = time.perf_counter()
+            text = await _extract_stored_text(import_job.file_path)
+            chunks = chunk_text(text, import_chunk_characters, import_chunk_overlap)
+            import_seconds.observe(time.perf_counter() - start, step="extract")
+            if not chunks:
+                raise ValueError("No text found in the file")
+            raw_data_list = create_raw_data_chunks(session, import_job, chunks)
+            import_chunks.inc(len(raw_data_list))
+
+            embedding_model = get_embedding_llm()
+            if embedding_model is not None:
+                _set_import_status(session, import_job, "embedding")
+                start = time.perf_counter()
+                await embed_raw_data_in_batches(session, import_job, raw_data_list, embedding_model)
+                import_seconds.observe(time.perf_counter() - start, step="embed")
+                if settings.raw_data_clustering == "incremental":
+                    for raw_data in raw_data_list:
+                        # Peut avoir été rattaché entre-temps comme voisin d'un autre chunk
+                        if raw_data.cluster_id is None:
+                            assign_raw_data_to_cluster(session, raw_data)
+            _set_import_status(session, import_job, "done")
+            import_jobs.inc(outcome="done")
+            logger.info(f"Import job {import_job.id}: {len(raw_data_list)} chunk(s) imported from '{import_job.filename}'")
+        except Exception as e:
+            logger.error(f"Import job {import_job_id} failed: {e}")
+            session.rollback()
+            import_job.error = str(e)
+            _set_import_status(session, import_job, "failed")
+            import_jobs.inc(outcome="failed")
+
+async def embed_raw_data_in_batches(session: Session, import_job: ImportJob, raw_data_list: list[RawData], embedding_model) -> None:
+    for start in range(0, len(raw_data_list), import_embedding_batch_size):
+        batch = raw_data_list[start:start + import_embedding_batch_size]
+        embeddings = await embedding_model.embed_batch([raw_data.text for raw_data in batch])
+        for raw_data, embedding in zip(batch, embeddings):
+            set_embedding(raw_data, embedding)
+            session.add(raw_data)
+        # Progression visible par le client à chaque lot
+        import_job.chunks_done += len(batch)
+        session.add(import_job)
+        session.commit()
+
+async def _extract_stored_text(file_path: str) -> str:
+    key = storage_key(file_path)
+    local_path = storage.local_path(key)
+    if local_path is not None:
+        return await extract_text_in_pool(local_path, settings.import_workers)
+    # Stockage distant : copie locale temporaire pour les processus d'extraction
+    scratch = scratch_path(os.path.splitext(key)[1])
+    try:
+        await asyncio.to_thread(storage.fetch_to, key, scratch)
+        return await extract_text_in_pool(scratch, settings.import_workers)
+    finally:
+        if os.path.exists(scratch):
+            os.remove(scratch)
+
+def _set_import_status(session: Session, import_job: ImportJob, status: str) -> None:
+    import_job.status = status
+    session.add(import_job)
+    session.commit()
+
+def _purge_media_blobs() -> int:
+    with Session(engine) as session:
+        blobs = purge_unreferenced_blobs(session)
+        media_gc_bytes.inc(blobs, source="blobs")
+        deletions = process_media_deletions(session)
+        media_gc_bytes.inc(deletions, source="queue")
+        if deletions:
+            logger.info(f"Queued media deletions: {deletions} bytes freed")
+        return blobs + deletions
+
+async def purge_media_blobs() -> int:
+    """Removes unreferenced blobs and the files queued for deletion by requests."""
+    # Suppressions de fichiers bloquantes : hors de la boucle d'évènements
+    return await asyncio.to_thread(_purge_media_blobs)
+
+def _reconcile_media_storage() -> int:
+    with Session(engine) as session:
+        freed = reconcile_media_storage(session)
+        media_gc_bytes.inc(freed, source="reconcile")
+        return freed
+
+async def reconcile_media() -> int:
+    """Lists the media storage against the database: orphan files are removed and blob refcounts recounted."""
+    return await asyncio.to_thread(_reconcile_media_storage)
@@ -7,9 +7,11 @@ from sqlmodel import Session, SQLModel, create_engine
 from app.main import app
 from app.dependencies import get_session, get_password_hash, create_access_token
 from app.database import Database
+from app.cache import quiz_cache, MemoryCacheBackend
+from app.crud import crud_quiz
 
 # Import the models to test to create the tables from metadata
-from app.models.model_tables import Account, Manager, Patient, Question, Result, Quiz, QuizQuestion, DefaultQuestions , LeitnerParameters, RawData
+from app.models.model_tables import Account, Manager, Patient, Question, Result, Quiz, QuizQuestion, DefaultQuestions , LeitnerParameters, RawData, RawDataCluster, ImportJob, MediaBlob, MediaDeletion
 
 @pytest.fixture(name="session")
 def session_fixture():
@@ -21,10 +23,15 @@ def session_fixture():
     SQLModel.metadata.drop_all(engine)
 
 @pytest.fixture(name="client")
-def client_fixture(session: Session):
+def client_fixture(session: Session, monkeypatch):
     def get_session_override():
         return session
 
+    # Base recréée à chaque test : les identifiants reviennent, le cache des quiz doit repartir vide
+    monkeypatch.setattr(quiz_cache, "backend", MemoryCacheBackend())
+    # Les tâches de fond ouvrent leur propre session : sur la base de test
+    monkeypatch.setattr(crud_quiz, "engine", session.get_bind())
+
     app.dependency_overrides[get_session] = get_session_override
     client = TestClient(app)
     yield client
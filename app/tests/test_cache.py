@@ -0,0 +1,64 @@
+import os
+import pytest
+from datetime import datetime
+from app.cache import MemoryCacheBackend, QuizCache, RedisCacheBackend
+from app.schemas.schema_quiz import QuizRead
+
+def make_quiz(quiz_id: int, question_ids: list[int]) -> QuizRead:
+    now = datetime(2025, 1, 1)
+    return QuizRead(id=quiz_id, questions=[
+        {"id": question_id, "type": "question", "category": "general", "exercise": {"question": "?", "answer": "!"}, "created_at": now, "updated_at": now}
+        for question_id in question_ids
+    ])
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture(params=["memory", "redis"])
+def backend(request):
+    if request.param == "memory":
+        return MemoryCacheBackend()
+    pytest.importorskip("redis")
+    if not os.environ.get("REDIS_TEST_URL"):
+        pytest.skip("REDIS_TEST_URL not set")
+    backend = RedisCacheBackend(os.environ["REDIS_TEST_URL"])
+    backend.delete(QuizCache.key(1))
+    return backend
+
+def test_answers_remove_their_question_from_the_cached_quiz(backend):
+    cache = QuizCache(backend, ttl=60)
+    assert cache.get(1, "http://test/") is None
+    cache.put(1, make_quiz(10, [1, 2, 3]), "http://test/")
+
+    cache.remove_answered(1, 10, [2])
+    assert [question.id for question in cache.get(1, "http://test/").questions] == [1, 3]
+    # Un autre quiz n'est pas touché
+    cache.remove_answered(1, 9, [1])
+    assert [question.id for question in cache.get(1, "http://test/").questions] == [1, 3]
+
+    cache.remove_answered(1, 10, [1, 3])
+    assert cache.get(1, "http://test/") is None
+
+def test_quiz_read_before_an_answer_does_not_bring_it_back(backend):
+    cache = QuizCache(backend, ttl=60)
+    # La réponse arrive entre la lecture en base et la mise en cache
+    cache.remove_answered(1, 10, [2])
+    cache.put(1, make_quiz(10, [1, 2, 3]), "http://test/")
+    assert [question.id for question in cache.get(1, "http://test/").questions] == [1, 3]
+
+def test_entries_expire_and_depend_on_the_base_url():
+    clock = Clock()
+    cache = QuizCache(MemoryCacheBackend(clock=clock), ttl=60)
+    cache.put(1, make_quiz(10, [1]), "http://test/")
+    assert cache.get(1, "http://other/") is None
+    clock.now = 61
+    assert cache.get(1, "http://test/") is None
+
+def test_ttl_stays_below_the_signed_url_lifetime(monkeypatch):
+    from app.config import settings
+    monkeypatch.setattr(settings, "media_url_ttl_seconds", 600)
+    assert QuizCache(MemoryCacheBackend(), ttl=3600).ttl == 300
@@ -0,0 +1,29 @@
+import numpy as np
+from app.crud.crud_clustering import find_disjoint_clusters
+
+def grouped_embeddings(groups: int, per_group: int, noise: int, dimensions: int = 64) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(groups, dimensions))
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    rows = [center + 0.01 * rng.normal(size=(per_group, dimensions)) for center in centers]
+    rows.append(3 * rng.normal(size=(noise, dimensions)))
+    return np.vstack(rows)
+
+def test_find_disjoint_clusters_extracts_every_group():
+    embeddings = grouped_embeddings(groups=3, per_group=3, noise=4)
+    clusters = find_disjoint_clusters(embeddings, limit=3, l2_threshold=0.8)
+    assert sorted(sorted(cluster) for cluster in clusters) == [[0, 1, 2], [3, 4, 5], [6, 7, 8]]
+
+def test_find_disjoint_clusters_members_are_disjoint_and_close_to_pivot():
+    embeddings = grouped_embeddings(groups=4, per_group=5, noise=10)
+    clusters = find_disjoint_clusters(embeddings, limit=3, l2_threshold=0.8, block_size=7)
+    members = [member for cluster in clusters for member in cluster]
+    assert len(members) == len(set(members))
+    for pivot, *others in clusters:
+        assert all(np.linalg.norm(embeddings[pivot] - embeddings[other]) <= 0.8 for other in others)
+
+def test_find_disjoint_clusters_respects_max_clusters_and_size():
+    embeddings = grouped_embeddings(groups=3, per_group=3, noise=0)
+    assert len(find_disjoint_clusters(embeddings, limit=3, l2_threshold=0.8, max_clusters=1)) == 1
+    assert find_disjoint_clusters(embeddings, limit=4, l2_threshold=0.8) == []
+    assert find_disjoint_clusters(embeddings[:2], limit=3, l2_threshold=0.8) == []
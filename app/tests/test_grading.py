@@ -0,0 +1,38 @@
+import pytest
+from datetime import datetime
+from app.grading import GraderCache, compile_grader, normalize_text
+
+def test_normalization_ignores_case_accents_and_spaces():
+    assert normalize_text("  Élysée \t Palace ") == "elysee palace"
+    assert normalize_text("ÇA") == normalize_text("ca")
+
+@pytest.mark.parametrize("question_type, exercise, right, wrong", [
+    ("question", {"question": "?", "answer": "Pacifique"}, {"answer": " pacifique"}, {"answer": "Atlantique"}),
+    ("mcq", {"question": "?", "choices": ["Paris", "Lyon"], "answer": "Paris"}, {"choices": ["paris"]}, {"choices": ["Paris", "Lyon"]}),
+    ("missing_words", {"question": "Le |Sahara| est en |Afrique|", "answers": ["Sahara", "Afrique"]}, {"answers": ["sahara", "afrique"]}, {"answers": ["Sahara"]}),
+    ("match_elements", {"Chien": "Animal", "Paris": "Capitale"}, {"paris": "capitale", "chien": "animal"}, {"Chien": "Capitale", "Paris": "Animal"}),
+    ("match_elements", {"pairs": {"Chien": "Animal"}}, {"Chien": "Animal"}, {"Chien": "Capitale"}),
+    # Paires saisies à la main dont un élément s'appelle "pairs"
+    ("match_elements", {"pairs": "Paires", "Chien": "Animal"}, {"Pairs": "paires", "Chien": "Animal"}, {"Chien": "Animal"}),
+    ("chronological_order", {"ordered": ["Révolution", "Empire"]}, {"answer": ["revolution", "empire"]}, {"answer": ["Empire", "Révolution"]}),
+])
+def test_each_exercise_type_is_graded(question_type, exercise, right, wrong):
+    grader = compile_grader(question_type, exercise)
+    assert grader(right)
+    assert not grader(wrong)
+
+def test_fuzzy_threshold_tolerates_typos_on_free_text():
+    assert not compile_grader("question", {"question": "?", "answer": "Pacifique"})({"answer": "Pacifiqe"})
+    assert compile_grader("question", {"question": "?", "answer": "Pacifique"}, fuzzy_threshold=0.85)({"answer": "Pacifiqe"})
+    assert not compile_grader("question", {"question": "?", "answer": "Pacifique"}, fuzzy_threshold=0.85)({"answer": "Arctique"})
+
+def test_malformed_exercise_is_never_correct():
+    assert not compile_grader("question", {"question": "?"})({"answer": "x"})
+
+def test_graders_are_cached_until_the_question_changes():
+    cache = GraderCache(max_size=2)
+    created = datetime(2025, 1, 1)
+    grader = cache.get(1, created, "question", {"question": "?", "answer": "Paris"})
+    assert cache.get(1, created, "question", {"question": "?", "answer": "Paris"}) is grader
+    updated = cache.get(1, datetime(2025, 1, 2), "question", {"question": "?", "answer": "Lyon"})
+    assert updated({"answer": "Lyon"}) and not updated({"answer": "Paris"})
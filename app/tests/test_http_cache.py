@@ -0,0 +1,86 @@
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from app.http_cache import cached_file_response, make_etag
+
+@pytest.fixture
+def client(tmp_path):
+    path = tmp_path / "souvenir.bin"
+    path.write_bytes(bytes(range(256)) * 4)
+    app = FastAPI()
+
+    @app.get("/file")
+    def get_file(request: Request):
+        return cached_file_response(request, str(path), make_etag("abc123", str(path)), max_age=60)
+
+    return TestClient(app)
+
+def test_file_is_sent_with_validators(client):
+    response = client.get("/file")
+    assert response.status_code == 200
+    assert response.headers["etag"] == '"abc123"'
+    assert response.headers["cache-control"] == "private, max-age=60"
+    assert "last-modified" in response.headers
+
+def test_matching_etag_returns_304(client):
+    response = client.get("/file", headers={"If-None-Match": 'W/"other", "abc123"'})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == '"abc123"'
+    assert client.get("/file", headers={"If-None-Match": '"other"'}).status_code == 200
+
+def test_if_modified_since_returns_304(client):
+    last_modified = client.get("/file").headers["last-modified"]
+    assert client.get("/file", headers={"If-Modified-Since": last_modified}).status_code == 304
+
+def test_byte_range_and_if_range(client):
+    response = client.get("/file", headers={"Range": "bytes=10-19", "If-Range": '"abc123"'})
+    assert response.status_code == 206
+    assert response.content == bytes(range(10, 20))
+    assert response.headers["content-range"] == "bytes 10-19/1024"
+    # Validateur périmé : le fichier entier est renvoyé
+    assert client.get("/file", headers={"Range": "bytes=10-19", "If-Range": '"old"'}).status_code == 200
+
+def test_remote_storage_is_streamed(tmp_path, monkeypatch):
+    from app import http_cache
+    from app.storage import MemoryStorage
+    storage = MemoryStorage()
+    source = tmp_path / "notes.txt"
+    source.write_text("souvenirs")
+    storage.put_file("raw_data/notes.txt", str(source))
+    monkeypatch.setattr(http_cache, "storage", storage)
+    app = FastAPI()
+
+    @app.get("/media")
+    def get_media(request: Request):
+        return http_cache.serve_media(request, "raw_data/notes.txt", "abc123", '"abc123"', max_age=60)
+
+    client = TestClient(app)
+    response = client.get("/media")
+    assert response.status_code == 200
+    assert response.text == "souvenirs"
+    assert response.headers["etag"] == '"abc123"'
+    # Pas une image : téléchargé, jamais affiché
+    assert response.headers["content-type"] == "application/octet-stream"
+    assert response.headers["content-disposition"] == 'attachment; filename="notes.txt"'
+    assert response.headers["x-content-type-options"] == "nosniff"
+    assert client.get("/media", headers={"If-None-Match": '"abc123"'}).status_code == 304
+
+@pytest.mark.parametrize("name, content_type, inline", [("page.html", "application/octet-stream", False), ("logo.svg", "application/octet-stream", False), ("photo.JPG", "image/jpeg", True)])
+def test_only_images_are_served_inline(tmp_path, monkeypatch, name, content_type, inline):
+    from app import http_cache
+    from app.storage import LocalStorage
+    (tmp_path / "raw_data").mkdir()
+    (tmp_path / "raw_data" / name).write_bytes(b"<svg onload=alert(1)>")
+    monkeypatch.setattr(http_cache, "storage", LocalStorage(str(tmp_path)))
+    app = FastAPI()
+
+    @app.get("/media")
+    def get_media(request: Request):
+        return http_cache.serve_media(request, f"raw_data/{name}", "abc123", '"abc123"', max_age=60)
+
+    response = TestClient(app).get("/media")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == content_type
+    assert ("content-disposition" in response.headers) is not inline
+    assert response.headers["x-content-type-options"] == "nosniff"
@@ -0,0 +1,46 @@
+import os
+import pytest
+from app.images import ImageVariantCache, get_image_variant
+from app.storage import MemoryStorage
+
+Image = pytest.importorskip("PIL.Image")
+
+@pytest.fixture
+def storage(tmp_path):
+    path = tmp_path / "photo.png"
+    Image.new("RGB", (800, 600), color=(200, 100, 50)).save(path)
+    storage = MemoryStorage()
+    storage.put_file("question_images/photo.png", str(path))
+    return storage
+
+@pytest.fixture
+def cache(tmp_path, storage):
+    return ImageVariantCache(str(tmp_path / "variants"), max_bytes=10 * 1024 * 1024, storage=storage)
+
+def test_variant_is_resized_converted_and_cached(cache):
+    path = get_image_variant(cache, "question_images/photo.png", "abc", 200, None, "webp")
+
+    with Image.open(path) as variant:
+        assert variant.size == (200, 150)
+        assert variant.format == "WEBP"
+    modified = os.stat(path).st_mtime_ns
+    assert get_image_variant(cache, "question_images/photo.png", "abc", 200, None, "webp") == path
+    assert os.stat(path).st_mtime_ns == modified
+
+def test_original_is_served_without_parameters(cache):
+    assert get_image_variant(cache, "question_images/photo.png", "abc", None, None, None) is None
+
+def test_oversized_image_falls_back_to_the_original(cache, monkeypatch):
+    # 800 x 600 pixels : plus du double de la limite, Pillow refuse de l'ouvrir
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    assert get_image_variant(cache, "question_images/photo.png", "abc", 200, None, "webp") is None
+
+def test_least_recently_used_variants_are_evicted(cache):
+    first = cache.get("question_images/photo.png", "abc", 100, None, "png")
+    second = cache.get("question_images/photo.png", "abc", 120, None, "png")
+    cache.get("question_images/photo.png", "abc", 100, None, "png")  # first redevient le plus récent
+    cache.max_bytes = os.path.getsize(first) + os.path.getsize(second)
+    third = cache.get("question_images/photo.png", "abc", 80, None, "png")
+
+    assert os.path.exists(first) and os.path.exists(third)
+    assert not os.path.exists(second)
@@ -0,0 +1,30 @@
+import pytest
+from app.ingestion import chunk_text, extract_text
+
+def test_chunk_text_packs_paragraphs_up_to_the_limit():
+    text = "Premier paragraphe.\n\nDeuxième paragraphe.\n\n\nTroisième paragraphe un peu plus long."
+    chunks = chunk_text(text, max_characters=45)
+    assert chunks == ["Premier paragraphe.\n\nDeuxième paragraphe.", "Troisième paragraphe un peu plus long."]
+
+def test_chunk_text_splits_long_paragraphs_with_overlap():
+    words = [f"mot{i}" for i in range(200)]
+    chunks = chunk_text(" ".join(words), max_characters=100, overlap=20)
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert chunks[0].split()[0] == "mot0" and chunks[-1].split()[-1] == "mot199"
+    for previous, current in zip(chunks, chunks[1:]):
+        assert current.split()[0] in previous.split()
+
+def test_chunk_text_cuts_words_longer_than_the_limit():
+    assert chunk_text("x" * 250, max_characters=100) == ["x" * 100, "x" * 100, "x" * 50]
+    assert chunk_text("  \n\n  ", max_characters=100) == []
+
+def test_extract_text_reads_text_and_strips_markdown(tmp_path):
+    text_file = tmp_path / "souvenirs.txt"
+    text_file.write_text("Mariage à Lyon en 1975", encoding="utf-8")
+    markdown_file = tmp_path / "souvenirs.md"
+    markdown_file.write_text("# Vacances\n\n**Été** 1982 à [Biarritz](https://example.com)", encoding="utf-8")
+
+    assert extract_text(str(text_file)) == "Mariage à Lyon en 1975"
+    assert extract_text(str(markdown_file)) == "Vacances\n\nÉté 1982 à Biarritz"
+    with pytest.raises(ValueError):
+        extract_text(str(tmp_path / "photo.jpg"))
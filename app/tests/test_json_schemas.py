@@ -0,0 +1,24 @@
+import json
+import os
+import pytest
+from jsonschema import ValidationError, validate
+from app.config import json_schema_dir
+from app.json_schemas import compile_validator, check_instance
+
+@pytest.mark.parametrize("kind", ["questions", "answers"])
+def test_every_schema_file_compiles(kind):
+    for schema_file in os.listdir(os.path.join(json_schema_dir, kind)):
+        with open(os.path.join(json_schema_dir, kind, schema_file)) as file:
+            compile_validator(json.load(file))
+
+def test_compiled_validator_raises_the_same_error_as_validate():
+    with open(os.path.join(json_schema_dir, "answers", "mcq.json")) as file:
+        schema = json.load(file)
+    validator = compile_validator(schema)
+    check_instance(validator, {"choices": ["Paris"]})
+    for instance in ({"choices": "Paris"}, {"answer": "Paris"}, {"choices": [], "other": 1}):
+        with pytest.raises(ValidationError) as expected:
+            validate(instance=instance, schema=schema)
+        with pytest.raises(ValidationError) as compiled:
+            check_instance(validator, instance)
+        assert compiled.value.message == expected.value.message
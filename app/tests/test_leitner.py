@@ -0,0 +1,38 @@
+from datetime import timedelta
+import pytest
+from app.leitner import LeitnerPolicy, LeitnerPolicies, DEFAULT_LEITNER_DELAYS
+from app.models.model_tables import Account
+
+def test_boxes_go_up_one_at_a_time_and_back_to_one():
+    policy = LeitnerPolicy(DEFAULT_LEITNER_DELAYS)
+    assert policy.max_box == 7
+    assert policy.next_box(1, True) == 2
+    assert policy.next_box(7, True) == 7
+    assert policy.next_box(5, False) == 1
+    assert policy.delay(4) == timedelta(days=4)
+
+def test_account_delays_override_the_default():
+    policy = LeitnerPolicy(DEFAULT_LEITNER_DELAYS).with_delays([0, 3600, 86400])
+    assert policy.max_box == 3
+    assert policy.delay(2) == timedelta(hours=1)
+    # Boîte au-delà de la politique du compte (réglage réduit après coup)
+    assert policy.next_box(6, True) == 3
+    assert policy.delay(6) == timedelta(days=1)
+
+def test_invalid_overrides_are_rejected():
+    policy = LeitnerPolicy(DEFAULT_LEITNER_DELAYS)
+    with pytest.raises(ValueError):
+        policy.with_delays([0] * 8)
+    with pytest.raises(ValueError):
+        policy.with_delays([0, -1])
+    with pytest.raises(ValueError):
+        policy.with_delays([])
+
+def test_policies_are_shared_between_accounts_with_the_same_delays():
+    policies = LeitnerPolicies(LeitnerPolicy(DEFAULT_LEITNER_DELAYS))
+    assert policies.for_account(Account(username="a", password_hash="x")) is policies.default
+    first = policies.for_account(Account(username="a", password_hash="x", leitner_delays=[0, 60]))
+    second = policies.for_account(Account(username="b", password_hash="x", leitner_delays=[0, 60]))
+    assert first is second and first.to_seconds() == [0, 60]
+    # Réglage devenu invalide : politique par défaut
+    assert policies.for_account(Account(username="c", password_hash="x", leitner_delays=[0] * 8)) is policies.default
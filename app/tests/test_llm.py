@@ -0,0 +1,89 @@
+import asyncio
+from app.llm import SingleFlight, LLMCallTimings, llm_calls, llm_coalesced_calls, llm_model_loads, llm_tokens_per_second
+
+def test_single_flight_coalesces_identical_calls():
+    upstream_calls = []
+
+    async def fake_generate(prompt):
+        upstream_calls.append(prompt)
+        await asyncio.sleep(0.05)
+        return f"response to {prompt}"
+
+    async def run():
+        single_flight = SingleFlight()
+        key = SingleFlight.make_key("test-model", "generate", {"question": "Q"})
+        other_key = SingleFlight.make_key("test-model", "generate", {"question": "Other"})
+        return await asyncio.gather(
+            single_flight.do(key, fake_generate, "Q"),
+            single_flight.do(key, fake_generate, "Q"),
+            single_flight.do(key, fake_generate, "Q"),
+            single_flight.do(other_key, fake_generate, "Other"),
+        ), single_flight
+
+    coalesced_before = llm_coalesced_calls.value(model="test-model", kind="generate")
+    calls_before = llm_calls.value(model="test-model", kind="generate")
+    results, single_flight = asyncio.run(run())
+    assert results == ["response to Q"] * 3 + ["response to Other"]
+    assert upstream_calls == ["Q", "Other"]
+    assert single_flight.in_flight == {}
+    assert llm_calls.value(model="test-model", kind="generate") - calls_before == 4
+    assert llm_coalesced_calls.value(model="test-model", kind="generate") - coalesced_before == 2
+
+def test_single_flight_callers_get_their_own_copy():
+    async def fake_embed():
+        await asyncio.sleep(0.01)
+        return {"embeddings": [[0.1, 0.2]]}
+
+    async def run():
+        single_flight = SingleFlight()
+        key = SingleFlight.make_key("test-model", "embed", "text")
+        return await asyncio.gather(single_flight.do(key, fake_embed), single_flight.do(key, fake_embed))
+
+    first, second = asyncio.run(run())
+    assert first == second and first is not second
+    first["embeddings"][0].append(0.3)
+    assert second == {"embeddings": [[0.1, 0.2]]}
+
+def test_single_flight_shares_errors_and_retries_afterwards():
+    attempts = []
+
+    async def failing_embed():
+        attempts.append(1)
+        await asyncio.sleep(0.01)
+        raise ConnectionError("down")
+
+    async def run():
+        single_flight = SingleFlight()
+        key = SingleFlight.make_key("test-model", "embed", "text")
+        first = await asyncio.gather(single_flight.do(key, failing_embed), single_flight.do(key, failing_embed), return_exceptions=True)
+        second = await asyncio.gather(single_flight.do(key, failing_embed), return_exceptions=True)
+        return first + second
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ConnectionError) for result in results)
+    assert len(attempts) == 2
+
+def test_call_timings_from_ollama_response():
+    response = {
+        "total_duration": 5_000_000_000,
+        "load_duration": 3_000_000_000,
+        "prompt_eval_count": 120,
+        "prompt_eval_duration": 500_000_000,
+        "eval_count": 40,
+        "eval_duration": 1_000_000_000,
+    }
+    timings = LLMCallTimings.from_response(response, "timing-model", "generate", wall_seconds=6.0)
+    assert timings.queue_seconds == 1.0
+    assert timings.time_to_first_token == 4.5
+    assert timings.tokens_per_second == 40.0
+    assert timings.is_cold_load
+
+    timings.record()
+    assert llm_model_loads.value(model="timing-model", kind="generate") == 1
+    assert llm_tokens_per_second.count(model="timing-model") == 1
+
+def test_call_timings_embed_without_eval():
+    response = {"total_duration": 20_000_000, "load_duration": 1_000_000, "prompt_eval_count": 12}
+    timings = LLMCallTimings.from_response(response, "embed-model", "embed", wall_seconds=0.05)
+    assert timings.tokens_per_second is None
+    assert not timings.is_cold_load
@@ -1,5 +1,6 @@
 from fastapi.testclient import TestClient
 from app.main import app
+from app.config import settings
 
 def test_read_root(client: TestClient):
     response = client.get("/")
@@ -10,4 +11,16 @@ def test_read_random(client: TestClient):
     response = client.get("/random")
     assert response.status_code == 200
     assert "random" in response.json()
-    assert 1 <= response.json()["random"] <= 100
\ No newline at end of file
+    assert 1 <= response.json()["random"] <= 100
+
+def test_metrics_are_disabled_without_a_token(client: TestClient, monkeypatch):
+    monkeypatch.setattr(settings, "metrics_token", None)
+    assert client.get("/metrics").status_code == 404
+
+def test_metrics_require_the_token(client: TestClient, monkeypatch):
+    monkeypatch.setattr(settings, "metrics_token", "s3cret")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer other"}).status_code == 401
+    response = client.get("/metrics", headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 200
+    assert "llm_calls_total" in response.json()
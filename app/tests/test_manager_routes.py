@@ -1,7 +1,7 @@
 import pytest
 from fastapi.testclient import TestClient
 from sqlmodel import Session, select
-from app.models.model_tables import Manager
+from app.models.model_tables import Manager, MediaBlob
 from app.models.model_tables import Account
 from app.schemas.schema_manager import ManagerRead
 from app.dependencies import create_access_token, get_password_hash
@@ -244,4 +244,20 @@ def test_delete_manager_not_found(client: TestClient, token):
 def test_delete_manager_invalid_id_format(client: TestClient, token):
     response = client.delete("/api/managers/invalid_id", headers={"Authorization": f"Bearer {token}"})
     assert response.status_code == 422
-    assert any(detail["loc"][-1] == "manager_id" for detail in response.json()["detail"])
\ No newline at end of file
+    assert any(detail["loc"][-1] == "manager_id" for detail in response.json()["detail"])
+
+def test_identical_profile_pictures_are_stored_once(client: TestClient, session: Session, token, manager1, manager2):
+    headers = {"Authorization": f"Bearer {token}"}
+    manager_ids = [client.post("/api/managers/", json=manager, headers=headers).json()["id"] for manager in (manager1, manager2)]
+    for manager_id in manager_ids:
+        response = client.post(f"/api/managers/{manager_id}/profile-picture", files={"file": ("photo.png", b"same picture", "image/png")}, headers=headers)
+        assert response.status_code == 200
+
+    managers = [session.get(Manager, manager_id) for manager_id in manager_ids]
+    assert managers[0].pp_path == managers[1].pp_path
+    blob = session.exec(select(MediaBlob).where(MediaBlob.sha256 == managers[0].pp_sha256)).one()
+    assert blob.refcount == 2
+
+    client.delete(f"/api/managers/{manager_ids[0]}", headers=headers)
+    session.refresh(blob)
+    assert blob.refcount == 1
@@ -0,0 +1,48 @@
+import pytest
+from datetime import timedelta
+from sqlmodel import Session, select
+from app.crud import crud_media
+from app.crud.crud_media import release_media, process_media_deletions, reconcile_media_storage
+from app.models.model_tables import Account, Manager, MediaBlob, MediaDeletion
+from app.storage import MemoryStorage
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    storage = MemoryStorage()
+    monkeypatch.setattr(crud_media, "storage", storage)
+
+    def put(key: str, content: bytes) -> None:
+        source = tmp_path / "upload"
+        source.write_bytes(content)
+        storage.put_file(key, str(source))
+    storage.put = put
+    return storage
+
+@pytest.fixture
+def account(session: Session) -> Account:
+    account = Account(username="gc", password_hash="x")
+    session.add(account)
+    session.commit()
+    return account
+
+def test_released_legacy_files_are_removed_in_the_background(session: Session, storage, account):
+    storage.put("pp/manager_1.png", b"photo")
+    release_media(session, [(None, "media/pp/manager_1.png")])
+    session.commit()
+    assert storage.exists("pp/manager_1.png")
+
+    assert process_media_deletions(session) == 5
+    assert not storage.exists("pp/manager_1.png")
+    assert session.exec(select(MediaDeletion)).all() == []
+
+def test_reconciliation_removes_orphans_and_recounts_blobs(session: Session, storage, account):
+    storage.put("blobs/ab/cd/abcd.png", b"shared")
+    storage.put("question_images/orphan.png", b"orphan")
+    session.add(Manager(account_id=account.id, firstname="A", lastname="B", email="gc@test.fr", relationship="fils", pp_path="media/blobs/ab/cd/abcd.png", pp_sha256="abcd"))
+    session.add(MediaBlob(sha256="abcd", size=6, path="media/blobs/ab/cd/abcd.png", refcount=5))
+    session.commit()
+
+    assert reconcile_media_storage(session, grace_period=timedelta(0)) == 6
+    assert storage.exists("blobs/ab/cd/abcd.png")
+    assert not storage.exists("question_images/orphan.png")
+    assert session.exec(select(MediaBlob.refcount).where(MediaBlob.sha256 == "abcd")).one() == 1
@@ -0,0 +1,48 @@
+import pytest
+from urllib.parse import urlsplit, parse_qs
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from app.config import settings
+from app.media_urls import sign_media_url, verify_media_signature, media_signature
+from app.routers import router_media
+
+def split(url: str) -> tuple[str, dict]:
+    parts = urlsplit(url)
+    return parts.path, {key: values[0] for key, values in parse_qs(parts.query).items()}
+
+def test_signed_url_round_trip():
+    url = sign_media_url("http://test/", "media/question_images/photo.jpg", "abc", now=1000)
+    path, query = split(url)
+    assert path == "/api/media/question_images/photo.jpg"
+    assert int(query["expires"]) >= 1000 + settings.media_url_ttl_seconds
+    verify_media_signature("question_images/photo.jpg", int(query["expires"]), query["signature"], "abc", now=1000)
+
+def test_url_is_stable_within_a_bucket():
+    first = sign_media_url("http://test/", "media/pp/manager_1.png", now=settings.media_url_bucket_seconds * 10 + 1)
+    second = sign_media_url("http://test/", "media/pp/manager_1.png", now=settings.media_url_bucket_seconds * 11 - 1)
+    assert first == second
+
+def test_tampered_or_expired_signature_is_rejected():
+    signature = media_signature("pp/manager_1.png", 2000)
+    with pytest.raises(HTTPException):
+        verify_media_signature("pp/manager_2.png", 2000, signature, now=1000)
+    with pytest.raises(HTTPException):
+        verify_media_signature("pp/manager_1.png", 2000, signature, "other", now=1000)
+    with pytest.raises(HTTPException):
+        verify_media_signature("pp/manager_1.png", 2000, signature, now=3000)
+
+def test_media_route_serves_signed_files_only(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "media" / "raw_data").mkdir(parents=True)
+    (tmp_path / "media" / "raw_data" / "notes.txt").write_text("souvenirs")
+    app = FastAPI()
+    app.include_router(router_media.router, prefix="/api/media")
+    client = TestClient(app)
+
+    path, query = split(sign_media_url("http://test/", "media/raw_data/notes.txt", "abc"))
+    response = client.get(path, params=query)
+    assert response.status_code == 200
+    assert response.text == "souvenirs"
+    assert response.headers["etag"] == '"abc"'
+    assert client.get(path, params={**query, "signature": "x"}).status_code == 403
+    assert client.get("/api/media/raw_data/other.txt", params=query).status_code == 403
@@ -365,4 +365,9 @@ def test_delete_question_no_question_id(client: TestClient, session: Session, ma
     assert question_db is not None
     assert question_db.exercise == question_payload["exercise"]
     assert question_db.type == question_payload["type"]
-    assert question_db.category == question_payload["category"]
\ No newline at end of file
+    assert question_db.category == question_payload["category"]
+def test_import_data_rejects_unsupported_files(client: TestClient, manager_created):
+    token = manager_created["token"]
+    manager_id = manager_created["manager_id"]
+    response = client.post(f"/api/questions/data?manager_id={manager_id}", data={"text": "souvenir"}, files={"file": ("page.HTML", b"<script>alert(1)</script>", "text/html")}, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 400
@@ -0,0 +1,163 @@
+import datetime
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+from app.models.model_tables import Account, Patient, Question, LeitnerParameters, Quiz, QuizQuestion
+from app.dependencies import get_password_hash
+
+@pytest.fixture
+def quiz(client: TestClient, session: Session, token):
+    for box_number in range(1, 8):
+        session.add(LeitnerParameters(box_number=box_number, leitner_delay=datetime.timedelta(days=box_number - 1)))
+    patient = Patient(firstname="John", lastname="Doe", birthday=datetime.date(1940, 1, 1))
+    session.add(patient)
+    session.commit()
+    account = session.exec(select(Account)).one()
+    account.patient_id = patient.id
+    session.add(account)
+    questions = [
+        Question(type="question", category="general", exercise={"question": "Capitale de la France ?", "answer": "Paris"}, account_id=account.id),
+        Question(type="mcq", category="general", exercise={"question": "Couleur du ciel ?", "choices": ["bleu", "rouge", "vert"], "answer": "bleu"}, account_id=account.id),
+        Question(type="question", category="general", exercise={"question": "Plus grand océan ?", "answer": "Pacifique"}, account_id=account.id),
+    ]
+    session.add_all(questions)
+    session.commit()
+
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get("/api/quiz/3", headers=headers)
+    assert response.status_code == 200
+    return {"id": response.json()["id"], "question_ids": [question.id for question in questions], "headers": headers}
+
+def test_batch_answers_are_saved_with_per_item_outcomes(client: TestClient, session: Session, quiz):
+    first, second, third = quiz["question_ids"]
+    answers = [
+        {"question_id": first, "data": {"answer": " paris "}},
+        {"question_id": second, "data": {"wrong": []}, "is_correct": False},
+        {"question_id": third, "data": {"answer": "Atlantique"}, "is_correct": True},
+        {"question_id": first, "data": {"answer": "Lyon"}, "is_correct": False},
+        {"question_id": 999999, "data": {"answer": "?"}, "is_correct": False},
+    ]
+    response = client.post(f"/api/quiz/{quiz['id']}/answers", json=answers, headers=quiz["headers"])
+    assert response.status_code == 200
+    assert [outcome["status_code"] for outcome in response.json()] == [201, 400, 201, 400, 404]
+    # Corrigé par le serveur, quel que soit le is_correct envoyé
+    assert response.json()[0]["result"] == {"data": {"answer": " paris "}, "is_correct": True}
+    assert response.json()[2]["result"]["is_correct"] is False
+
+    quiz_questions = {quiz_question.question_id: quiz_question for quiz_question in session.exec(select(QuizQuestion).where(QuizQuestion.quiz_id == quiz["id"])).all()}
+    assert quiz_questions[first].result_id is not None and quiz_questions[first].box_number == 2
+    assert quiz_questions[second].result_id is None
+    assert quiz_questions[third].result_id is not None and quiz_questions[third].box_number == 1
+
+def test_resent_batch_reports_answers_already_saved(client: TestClient, quiz):
+    answers = [{"question_id": quiz["question_ids"][0], "data": {"answer": "Paris"}, "is_correct": True}]
+    assert client.post(f"/api/quiz/{quiz['id']}/answers", json=answers, headers=quiz["headers"]).json()[0]["status_code"] == 201
+    outcome = client.post(f"/api/quiz/{quiz['id']}/answers", json=answers, headers=quiz["headers"]).json()[0]
+    # Même réponse que la route d'une seule réponse
+    single = client.post("/api/quiz/", params={"quiz_id": quiz["id"], "question_id": quiz["question_ids"][0]}, json={"data": {"answer": "Paris"}}, headers=quiz["headers"])
+    assert outcome["status_code"] == single.status_code == 400
+    assert outcome["detail"] == single.json()["detail"]
+
+def test_batch_answers_need_a_non_empty_list(client: TestClient, quiz):
+    assert client.post(f"/api/quiz/{quiz['id']}/answers", json=[], headers=quiz["headers"]).status_code == 422
+
+def test_new_quiz_is_limited_and_starts_with_new_questions(client: TestClient, session: Session, quiz):
+    first, second, third = quiz["question_ids"]
+    answers = [
+        {"question_id": first, "data": {"answer": "Paris"}},
+        {"question_id": second, "data": {"choices": ["rouge"]}},
+        {"question_id": third, "data": {"answer": "Pacifique"}},
+    ]
+    client.post(f"/api/quiz/{quiz['id']}/answers", json=answers, headers=quiz["headers"])
+    account_id = session.get(Question, first).account_id
+    new_questions = [Question(type="question", category="general", exercise={"question": f"Question {i} ?", "answer": "Oui"}, account_id=account_id) for i in range(4)]
+    session.add_all(new_questions)
+    session.commit()
+
+    response = client.get("/api/quiz/5", headers=quiz["headers"])
+    assert response.status_code == 200
+    question_ids = [question["id"] for question in response.json()["questions"]]
+    assert question_ids == [question.id for question in new_questions] + [second]
+    assert client.get("/api/quiz/5", headers=quiz["headers"]).json()["id"] == response.json()["id"]
+
+def test_next_quiz_is_composed_after_the_last_answer(client: TestClient, session: Session, quiz):
+    first, second, third = quiz["question_ids"]
+    answers = [{"question_id": question_id, "data": {"answer": "?"}} for question_id in (first, third)] + [{"question_id": second, "data": {"choices": ["rouge"]}}]
+    client.post(f"/api/quiz/{quiz['id']}/answers", json=answers, headers=quiz["headers"])
+
+    pending = session.exec(select(Quiz).where(Quiz.status == "pending")).one()
+    assert pending.number_of_questions == 3
+    # Invisible pour le client tant qu'il n'est pas affiché
+    assert client.get("/api/quiz/", params={"quiz_id": pending.id}, headers=quiz["headers"]).status_code == 404
+
+    response = client.get("/api/quiz/3", headers=quiz["headers"])
+    assert response.json()["id"] == pending.id
+    assert len(response.json()["questions"]) == 3
+    session.refresh(pending)
+    assert pending.status == "active"
+
+def test_pending_quiz_of_another_size_is_replaced(client: TestClient, session: Session, quiz):
+    first, second, third = quiz["question_ids"]
+    answers = [{"question_id": question_id, "data": {"answer": "?"}} for question_id in (first, third)] + [{"question_id": second, "data": {"choices": ["rouge"]}}]
+    client.post(f"/api/quiz/{quiz['id']}/answers", json=answers, headers=quiz["headers"])
+    pending_id = session.exec(select(Quiz.id).where(Quiz.status == "pending")).one()
+
+    response = client.get("/api/quiz/2", headers=quiz["headers"])
+    assert response.json()["id"] != pending_id
+    assert len(response.json()["questions"]) == 2
+    assert session.exec(select(Quiz).where(Quiz.status == "pending")).first() is None
+
+def test_remaining_questions_are_served_from_the_cache(client: TestClient, session: Session, quiz):
+    first, second, third = quiz["question_ids"]
+    client.post("/api/quiz/", params={"quiz_id": quiz["id"], "question_id": first}, json={"data": {"answer": "Paris"}}, headers=quiz["headers"])
+    # Modifiée en base sans passer par l'API : le cache ne la voit pas
+    question = session.get(Question, third)
+    question.category = "modifiée"
+    session.add(question)
+    session.commit()
+
+    response = client.get("/api/quiz/3", headers=quiz["headers"])
+    assert response.json()["id"] == quiz["id"]
+    assert {question["id"] for question in response.json()["questions"]} == {second, third}
+    assert {question["category"] for question in response.json()["questions"]} == {"general"}
+
+def test_account_leitner_delays_drive_the_boxes(client: TestClient, session: Session, quiz):
+    response = client.get("/api/accounts/leitner-delays", headers=quiz["headers"])
+    assert response.status_code == 200
+    assert response.json() == {"delays": [0, 86400, 172800, 345600, 604800, 1209600, 2592000], "is_default": True}
+    assert client.put("/api/accounts/leitner-delays", json={"delays": [0] * 8}, headers=quiz["headers"]).status_code == 400
+
+    response = client.put("/api/accounts/leitner-delays", json={"delays": [0]}, headers=quiz["headers"])
+    assert response.json() == {"delays": [0], "is_default": False}
+    first = quiz["question_ids"][0]
+    client.post(f"/api/quiz/{quiz['id']}/answers", json=[{"question_id": first, "data": {"answer": "Paris"}}], headers=quiz["headers"])
+    # Une seule boîte pour ce compte : une bonne réponse y reste
+    quiz_question = session.exec(select(QuizQuestion).where(QuizQuestion.quiz_id == quiz["id"], QuizQuestion.question_id == first)).one()
+    assert quiz_question.box_number == 1
+
+    response = client.put("/api/accounts/leitner-delays", json={"delays": None}, headers=quiz["headers"])
+    assert response.json()["is_default"] is True
+
+def test_account_delays_decide_which_questions_are_due(client: TestClient, session: Session, quiz):
+    # Second compte aux délais nuls, avec les mêmes questions
+    patient = Patient(firstname="Jane", lastname="Doe", birthday=datetime.date(1940, 1, 1))
+    session.add(patient)
+    session.commit()
+    other = Account(username="Jane", password_hash=get_password_hash("password"), patient_id=patient.id, leitner_delays=[0] * 7)
+    session.add(other)
+    session.commit()
+    session.add_all(Question(type=question.type, category=question.category, exercise=question.exercise, account_id=other.id) for question in session.exec(select(Question).where(Question.id.in_(quiz["question_ids"]))).all())
+    session.commit()
+    other_headers = {"Authorization": f"Bearer {client.post('/api/auth/token', data={'username': 'Jane', 'password': 'password'}).json()['access_token']}"}
+
+    for headers in (quiz["headers"], other_headers):
+        current = client.get("/api/quiz/3", headers=headers).json()
+        correct = {"Capitale de la France ?": {"answer": "Paris"}, "Couleur du ciel ?": {"choices": ["bleu"]}, "Plus grand océan ?": {"answer": "Pacifique"}}
+        answers = [{"question_id": question["id"], "data": correct[question["exercise"]["question"]]} for question in current["questions"]]
+        assert all(outcome["result"]["is_correct"] for outcome in client.post(f"/api/quiz/{current['id']}/answers", json=answers, headers=headers).json())
+
+    # Toutes en boîte 2 : pas avant un jour avec les délais par défaut, tout de suite avec des délais nuls
+    assert client.get("/api/quiz/3", headers=quiz["headers"]).status_code == 404
+    response = client.get("/api/quiz/3", headers=other_headers)
+    assert response.status_code == 200
+    assert len(response.json()["questions"]) == 3
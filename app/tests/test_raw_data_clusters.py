@@ -0,0 +1,62 @@
+import pytest
+from sqlmodel import Session, select, update, func
+from app.models.model_tables import Account, RawData, RawDataCluster
+from app.crud.crud_clustering import link_raw_data_to_cluster, claim_raw_data, release_raw_data, get_ready_raw_data_clusters
+
+@pytest.fixture
+def account(session: Session):
+    account = Account(username="John", password_hash="-")
+    session.add(account)
+    session.commit()
+    return account
+
+def add_raw_data(session: Session, account: Account, count: int) -> list[RawData]:
+    raw_data = [RawData(account_id=account.id, text=f"souvenir {i}") for i in range(count)]
+    session.add_all(raw_data)
+    session.commit()
+    return raw_data
+
+def cluster_size(session: Session, cluster_id: int) -> int:
+    return session.exec(select(RawDataCluster.size).where(RawDataCluster.id == cluster_id)).one()
+
+def test_single_linkage_merges_the_clusters_a_raw_data_touches(session: Session, account):
+    first, second, third, bridge = add_raw_data(session, account, 4)
+    left = link_raw_data_to_cluster(session, first, [], l2_threshold=0.5)
+    assert link_raw_data_to_cluster(session, second, [(first.id, 0.3)], l2_threshold=0.5) == left
+    # Trop loin : cluster à part
+    right = link_raw_data_to_cluster(session, third, [(first.id, 0.9)], l2_threshold=0.5)
+    assert right != left
+
+    # Proche d'un membre de chaque cluster : les deux n'en font plus qu'un, celui du voisin le plus proche
+    assert link_raw_data_to_cluster(session, bridge, [(second.id, 0.2), (third.id, 0.4)], l2_threshold=0.5) == left
+    assert session.get(RawDataCluster, right) is None
+    assert set(session.exec(select(RawData.id).where(RawData.cluster_id == left)).all()) == {first.id, second.id, third.id, bridge.id}
+    assert cluster_size(session, left) == 4
+
+def test_claims_are_all_or_nothing_and_update_the_size(session: Session, account):
+    raw_data = add_raw_data(session, account, 3)
+    cluster_id = link_raw_data_to_cluster(session, raw_data[0], [(other.id, 0.1) for other in raw_data[1:]], l2_threshold=0.5)
+    ids = [item.id for item in raw_data]
+    assert cluster_size(session, cluster_id) == 3
+
+    assert claim_raw_data(session, ids[:2])
+    assert cluster_size(session, cluster_id) == 1
+    # Un autre worker veut un cluster qui recouvre le premier : rien n'est réservé
+    assert not claim_raw_data(session, ids[1:])
+    assert session.exec(select(func.count()).where(RawData.id == ids[2], RawData.claimed_at.is_not(None))).one() == 0
+
+    release_raw_data(session, ids[:2])
+    assert cluster_size(session, cluster_id) == 3
+    assert claim_raw_data(session, ids[1:])
+
+def test_ready_clusters_skip_those_whose_members_are_claimed(session: Session, account):
+    raw_data = add_raw_data(session, account, 6)
+    busy = link_raw_data_to_cluster(session, raw_data[0], [(item.id, 0.1) for item in raw_data[1:3]], l2_threshold=0.5)
+    ready = link_raw_data_to_cluster(session, raw_data[3], [(item.id, 0.1) for item in raw_data[4:]], l2_threshold=0.5)
+    assert busy < ready
+    # Réservé par un worker sans mise à jour de size (ancienne ligne) : seul le HAVING l'écarte
+    session.exec(update(RawData).where(RawData.id == raw_data[0].id).values(claimed_at=func.now()))
+    session.commit()
+
+    clusters = get_ready_raw_data_clusters(session, account, limit=3, max_clusters=1)
+    assert [[item.id for item in cluster] for cluster in clusters] == [[item.id for item in raw_data[3:]]]
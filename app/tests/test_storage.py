@@ -0,0 +1,60 @@
+import os
+import uuid
+import pytest
+from app.storage import LocalStorage, MemoryStorage, S3Storage, storage_key
+
+@pytest.fixture(params=["local", "memory", "s3"])
+def storage(request, tmp_path):
+    if request.param == "local":
+        return LocalStorage(str(tmp_path / "media"))
+    if request.param == "memory":
+        return MemoryStorage()
+    # Contre un vrai service compatible S3 (MinIO...) seulement
+    pytest.importorskip("boto3")
+    if not os.environ.get("S3_TEST_ENDPOINT"):
+        pytest.skip("S3_TEST_ENDPOINT not set")
+    return S3Storage(
+        bucket=os.environ.get("S3_TEST_BUCKET", "memora-test"),
+        prefix=f"tests/{uuid.uuid4().hex}",
+        endpoint_url=os.environ["S3_TEST_ENDPOINT"],
+        access_key_id=os.environ.get("S3_TEST_ACCESS_KEY_ID"),
+        secret_access_key=os.environ.get("S3_TEST_SECRET_ACCESS_KEY"),
+    )
+
+def put(storage, tmp_path, key: str, content: bytes) -> None:
+    source = tmp_path / uuid.uuid4().hex
+    source.write_bytes(content)
+    storage.put_file(key, str(source))
+    assert not source.exists()
+
+def test_storage_round_trip(storage, tmp_path):
+    put(storage, tmp_path, "blobs/ab/cd/abcd.txt", b"souvenirs")
+
+    stored = storage.stat("blobs/ab/cd/abcd.txt")
+    assert stored.size == 9
+    assert b"".join(storage.iter_chunks("blobs/ab/cd/abcd.txt", chunk_size=4)) == b"souvenirs"
+    storage.fetch_to("blobs/ab/cd/abcd.txt", str(tmp_path / "copy.txt"))
+    assert (tmp_path / "copy.txt").read_bytes() == b"souvenirs"
+
+    storage.delete("blobs/ab/cd/abcd.txt")
+    storage.delete("blobs/ab/cd/abcd.txt")
+    assert not storage.exists("blobs/ab/cd/abcd.txt")
+    with pytest.raises(FileNotFoundError):
+        storage.open("blobs/ab/cd/abcd.txt")
+
+def test_storage_lists_by_prefix(storage, tmp_path):
+    put(storage, tmp_path, "blobs/ab/one.png", b"1")
+    put(storage, tmp_path, "blobs/cd/two.png", b"22")
+    put(storage, tmp_path, "pp/manager_1.png", b"333")
+
+    assert sorted(stored.key for stored in storage.list("blobs/")) == ["blobs/ab/one.png", "blobs/cd/two.png"]
+    assert sum(stored.size for stored in storage.list()) == 6
+
+def test_storage_keys_stay_inside_the_media_root(tmp_path):
+    assert storage_key("media/blobs/ab/cd/abcd.png") == "blobs/ab/cd/abcd.png"
+    with pytest.raises(ValueError):
+        storage_key("/etc/passwd")
+    local = LocalStorage(str(tmp_path / "media"))
+    assert local.stat("../secret") is None
+    with pytest.raises(FileNotFoundError):
+        local.open("../../etc/passwd")
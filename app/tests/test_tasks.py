@@ -0,0 +1,106 @@
+import asyncio
+import datetime
+import threading
+import numpy as np
+import pytest
+from sqlmodel import Session, select
+from app import tasks
+from app.config import settings, raw_data_claim_ttl
+from app.crud.crud_embeddings import set_embedding
+from app.models.model_tables import Account, RawData, RawDataCluster
+
+@pytest.fixture
+def account(session: Session, monkeypatch):
+    # Les tâches ouvrent leurs propres sessions : sur la base de test
+    monkeypatch.setattr(tasks, "engine", session.get_bind())
+    account = Account(username="John", password_hash="-")
+    session.add(account)
+    session.commit()
+    return account
+
+@pytest.fixture
+def sweep(session: Session, account, monkeypatch):
+    raw_data = [RawData(account_id=account.id, text=f"souvenir {i}") for i in range(6)]
+    session.add_all(raw_data)
+    session.commit()
+    ids = [item.id for item in raw_data]
+    threads = []
+    generated = []
+
+    # Embeddings et clustering demandent le LLM (désactivé pour les tests) : les clusters sont donnés
+    def get_raw_data_clusters(session: Session, account: Account):
+        threads.append(threading.current_thread())
+        groups = [ids[0:3], ids[3:6], ids[2:5]]
+        return [session.exec(select(RawData).where(RawData.id.in_(group))).all() for group in groups]
+
+    def backfill_raw_data_clusters(session: Session, account: Account):
+        threads.append(threading.current_thread())
+
+    async def generate_question_from_raw_data(cluster, account_id, session, embedding_model, background_tasks):
+        claimed = session.exec(select(RawData.claimed_at).where(RawData.id.in_([item.id for item in cluster]))).all()
+        assert all(claimed_at is not None for claimed_at in claimed)
+        generated.append([item.id for item in cluster])
+        if cluster[0].id == ids[3]:
+            raise RuntimeError("LLM unavailable")
+
+    monkeypatch.setattr(tasks, "_accounts_with_raw_data", lambda: [account.id])
+    monkeypatch.setattr(tasks, "get_raw_data_clusters", get_raw_data_clusters)
+    monkeypatch.setattr(tasks, "backfill_raw_data_clusters", backfill_raw_data_clusters)
+    monkeypatch.setattr(tasks, "generate_question_from_raw_data", generate_question_from_raw_data)
+    monkeypatch.setattr(settings, "raw_data_clustering", "incremental")
+    return {"ids": ids, "threads": threads, "generated": generated}
+
+def test_sweep_claims_generates_and_releases(session: Session, sweep):
+    ids = sweep["ids"]
+    already_claimed = tasks.raw_data_sweep_clusters.value(outcome="already_claimed")
+    failed = tasks.raw_data_sweep_clusters.value(outcome="failed")
+
+    assert asyncio.run(tasks.sweep_raw_data_clusters()) == 1
+    # Le troisième cluster recouvre les deux premiers, déjà réservés
+    assert sorted(sweep["generated"]) == [ids[0:3], ids[3:6]]
+    assert tasks.raw_data_sweep_clusters.value(outcome="already_claimed") - already_claimed == 1
+    assert tasks.raw_data_sweep_clusters.value(outcome="failed") - failed == 1
+    # Réservations libérées après la génération, réussie ou non
+    session.expire_all()
+    assert session.exec(select(RawData.claimed_at).where(RawData.id.in_(ids))).all() == [None] * 6
+
+def test_sweep_keeps_blocking_work_off_the_event_loop(sweep):
+    asyncio.run(tasks.sweep_raw_data_clusters())
+    assert len(sweep["threads"]) == 2
+    assert all(thread is not threading.main_thread() for thread in sweep["threads"])
+
+def test_sweep_releases_expired_claims(session: Session, sweep, monkeypatch):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    stale, running = session.get(RawData, sweep["ids"][0]), session.get(RawData, sweep["ids"][1])
+    stale.claimed_at = now - raw_data_claim_ttl - datetime.timedelta(minutes=1)
+    running.claimed_at = now
+    session.add_all([stale, running])
+    session.commit()
+    monkeypatch.setattr(tasks, "get_raw_data_clusters", lambda session, account: [])
+
+    asyncio.run(tasks.sweep_raw_data_clusters())
+    session.expire_all()
+    # Génération abandonnée : libérée ; génération en cours : gardée
+    assert session.get(RawData, sweep["ids"][0]).claimed_at is None
+    assert session.get(RawData, sweep["ids"][1]).claimed_at is not None
+
+@pytest.mark.skipif(not settings.llm_enabled, reason="RawData has no embedding column without the LLM")
+def test_backfill_attaches_unclustered_raw_data_in_batches(session: Session, account, monkeypatch):
+    rng = np.random.default_rng(0)
+    center = rng.normal(size=settings.embedding_dimensions)
+    center /= np.linalg.norm(center)
+    raw_data = []
+    for i in range(3):
+        item = RawData(account_id=account.id, text=f"souvenir {i}")
+        set_embedding(item, (center + 0.001 * rng.normal(size=settings.embedding_dimensions)).tolist())
+        raw_data.append(item)
+    session.add_all(raw_data)
+    session.commit()
+    monkeypatch.setattr(tasks, "BACKFILL_BATCH_SIZE", 2)
+
+    tasks.backfill_raw_data_clusters(session, account)
+    session.expire_all()
+    cluster_ids = {item.cluster_id for item in session.exec(select(RawData).where(RawData.account_id == account.id)).all()}
+    # Le premier lot rattache aussi son voisin, au-delà de la taille du lot
+    assert len(cluster_ids) == 1 and None not in cluster_ids
+    assert session.exec(select(RawDataCluster.size)).one() == 3
@@ -0,0 +1,44 @@
+import hashlib
+import io
+import os
+import pytest
+from fastapi import HTTPException, UploadFile
+from app.uploads import save_upload, UPLOAD_CHUNK_SIZE
+from app.crud.crud_media import blob_path, is_blob_path
+
+def make_upload(content: bytes, known_size: bool = True) -> UploadFile:
+    return UploadFile(file=io.BytesIO(content), filename="photo.jpg", size=len(content) if known_size else None)
+
+def test_save_upload_writes_in_chunks_and_hashes(tmp_path):
+    content = os.urandom(2 * UPLOAD_CHUNK_SIZE + 123)
+    destination = tmp_path / "images" / "photo.jpg"
+    saved = save_upload(make_upload(content), str(destination), max_bytes=len(content))
+
+    assert destination.read_bytes() == content
+    assert saved.size == len(content)
+    assert saved.sha256 == hashlib.sha256(content).hexdigest()
+    assert os.listdir(destination.parent) == ["photo.jpg"]
+
+def test_save_upload_rejects_known_size_before_writing(tmp_path):
+    with pytest.raises(HTTPException) as error:
+        save_upload(make_upload(b"x" * 10), str(tmp_path / "photo.jpg"), max_bytes=5)
+    assert error.value.status_code == 413
+    assert os.listdir(tmp_path) == []
+
+def test_save_upload_rejects_oversized_stream_and_keeps_previous_file(tmp_path):
+    destination = tmp_path / "photo.jpg"
+    destination.write_bytes(b"previous")
+    # Taille annoncée absente : la limite est vérifiée pendant l'écriture
+    with pytest.raises(HTTPException) as error:
+        save_upload(make_upload(b"x" * (UPLOAD_CHUNK_SIZE + 1), known_size=False), str(destination), max_bytes=UPLOAD_CHUNK_SIZE)
+    assert error.value.status_code == 413
+    assert destination.read_bytes() == b"previous"
+    assert os.listdir(tmp_path) == ["photo.jpg"]
+
+def test_blob_paths_are_sharded_by_hash():
+    sha256 = hashlib.sha256(b"photo").hexdigest()
+    path = blob_path(sha256, ".JPG")
+    assert path == os.path.join("media", "blobs", sha256[:2], sha256[2:4], f"{sha256}.jpg")
+    assert is_blob_path(path)
+    assert not is_blob_path("media/pp/manager_1.png")
+    assert not is_blob_path(None)
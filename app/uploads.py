@@ -0,0 +1,54 @@
+import hashlib
+import os
+import uuid
+from dataclasses import dataclass
+from fastapi import HTTPException, UploadFile, status
+from starlette.concurrency import run_in_threadpool
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+@dataclass(frozen=True)
+class SavedUpload:
+    path: str
+    size: int
+    sha256: str
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"File too large (max {max_bytes // (1024 * 1024)} MB)")
+
+def check_upload_size(file: UploadFile, max_bytes: int) -> None:
+    """Rejects an upload whose size is already known to exceed `max_bytes`, before anything is written."""
+    if file.size is not None and file.size > max_bytes:
+        raise _too_large(max_bytes)
+
+def save_upload(file: UploadFile, destination: str, max_bytes: int) -> SavedUpload:
+    """Streams an upload to `destination` in fixed-size chunks, hashing it on the way.
+
+    The file is written to a temporary name next to the destination and renamed once complete,
+    so readers never see a partial file and a failed upload leaves the previous one in place.
+    """
+    check_upload_size(file, max_bytes)
+
+    os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+    temp_path = f"{destination}.{uuid.uuid4().hex}.part"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        file.file.seek(0)
+        with open(temp_path, "wb") as f:
+            while chunk := file.file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise _too_large(max_bytes)
+                digest.update(chunk)
+                f.write(chunk)
+        os.replace(temp_path, destination)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return SavedUpload(path=destination, size=size, sha256=digest.hexdigest())
+
+async def save_upload_async(file: UploadFile, destination: str, max_bytes: int) -> SavedUpload:
+    """save_upload for async routes: the disk writes run in the thread pool, off the event loop."""
+    return await run_in_threadpool(save_upload, file, destination, max_bytes)
@@ -0,0 +1,90 @@
+"""Compares full-precision and compact (halfvec + binary re-ranking) embedding storage.
+
+Needs a PostgreSQL database with pgvector >= 0.7 configured through the usual .env settings.
+Run from the repository root:
+
+    python -m benchmarks.bench_embedding_storage --rows 20000 --queries 200
+"""
+import argparse
+import statistics
+import time
+import numpy as np
+from sqlalchemy import create_engine, text
+from app.database import database
+from app.crud.crud_embeddings import binary_quantize
+
+def synthetic_embeddings(rows: int, dimensions: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    # Des données regroupées ressemblent davantage à de vrais embeddings que du bruit uniforme
+    centers = rng.normal(size=(clusters, dimensions))
+    embeddings = centers[rng.integers(0, clusters, rows)] + 0.6 * rng.normal(size=(rows, dimensions))
+    return (embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)).astype(np.float32)
+
+def to_literal(vector: np.ndarray) -> str:
+    return "[" + ",".join(f"{value:.6f}" for value in vector) + "]"
+
+def percentile(values: list[float], q: float) -> float:
+    return float(np.percentile(values, q))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dimensions", type=int, default=768)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--candidates", type=int, default=40)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    embeddings = synthetic_embeddings(args.rows, args.dimensions, max(10, args.rows // 50), rng)
+    queries = synthetic_embeddings(args.queries, args.dimensions, 10, rng)
+    dim = args.dimensions
+
+    engine = create_engine(database.DATABASE_URL)
+    with engine.begin() as connection:
+        connection.execute(text("DROP TABLE IF EXISTS bench_vector, bench_compact"))
+        connection.execute(text(f"CREATE TABLE bench_vector (id int PRIMARY KEY, embedding vector({dim}))"))
+        connection.execute(text(f"CREATE TABLE bench_compact (id int PRIMARY KEY, embedding halfvec({dim}), embedding_binary bit({dim}))"))
+        for start in range(0, args.rows, 1000):
+            batch = [{"id": i, "e": to_literal(embeddings[i]), "b": binary_quantize(embeddings[i])} for i in range(start, min(start + 1000, args.rows))]
+            connection.execute(text("INSERT INTO bench_vector VALUES (:id, CAST(:e AS vector))"), batch)
+            connection.execute(text(f"INSERT INTO bench_compact VALUES (:id, CAST(:e AS halfvec), CAST(:b AS bit({dim})))"), batch)
+        connection.execute(text("CREATE INDEX ON bench_compact USING hnsw (embedding_binary bit_hamming_ops)"))
+        connection.execute(text("ANALYZE bench_vector"))
+        connection.execute(text("ANALYZE bench_compact"))
+
+    exact_sql = text("SELECT id FROM bench_vector ORDER BY embedding <-> CAST(:e AS vector) LIMIT :k")
+    compact_sql = text(f"""
+        SELECT id FROM (
+            SELECT id, embedding FROM bench_compact
+            ORDER BY embedding_binary <~> CAST(:b AS bit({dim})) LIMIT :candidates
+        ) candidates
+        ORDER BY embedding <-> CAST(:e AS halfvec) LIMIT :k
+    """)
+
+    exact_times, compact_times, recalls = [], [], []
+    with engine.connect() as connection:
+        for query in queries:
+            params = {"e": to_literal(query), "b": binary_quantize(query), "k": args.k, "candidates": args.candidates}
+            start = time.perf_counter()
+            exact = {row.id for row in connection.execute(exact_sql, params)}
+            exact_times.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            compact = {row.id for row in connection.execute(compact_sql, params)}
+            compact_times.append((time.perf_counter() - start) * 1000)
+            recalls.append(len(exact & compact) / args.k)
+
+        sizes = {
+            table: connection.execute(text(f"SELECT pg_total_relation_size('{table}')")).scalar()
+            for table in ("bench_vector", "bench_compact")
+        }
+
+    with engine.begin() as connection:
+        connection.execute(text("DROP TABLE IF EXISTS bench_vector, bench_compact"))
+
+    print(f"rows={args.rows} queries={args.queries} k={args.k} candidates={args.candidates}")
+    print(f"{'storage':<10}{'size (MB)':>12}{'p50 (ms)':>12}{'p95 (ms)':>12}{'recall@k':>12}")
+    print(f"{'vector':<10}{sizes['bench_vector'] / 1e6:>12.1f}{statistics.median(exact_times):>12.2f}{percentile(exact_times, 95):>12.2f}{1.0:>12.3f}")
+    print(f"{'compact':<10}{sizes['bench_compact'] / 1e6:>12.1f}{statistics.median(compact_times):>12.2f}{percentile(compact_times, 95):>12.2f}{statistics.mean(recalls):>12.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Measures answer grading over a large synthetic set of questions and answers, without any database:
+
+    python -m benchmarks.bench_grading --questions 2000 --answers 200000
+
+Compares compiling each exercise for every answer with the per-question grader cache used by the API.
+"""
+import argparse
+import random
+import time
+from types import SimpleNamespace
+from app.grading import GraderCache, compile_grader, grade_answer
+
+WORDS = ["Pacifique", "Révolution", "Élysée", "château", "Marseille", "boulangerie", "Méditerranée", "Louvre", "été", "forêt"]
+
+def synthetic_question(question_id: int, rng: random.Random) -> SimpleNamespace:
+    words = rng.sample(WORDS, 4)
+    question_type = rng.choice(["question", "mcq", "missing_words", "match_elements", "chronological_order"])
+    exercise = {
+        "question": {"question": "?", "answer": f"{words[0]} {words[1]}"},
+        "mcq": {"question": "?", "choices": words, "answer": words[0]},
+        "missing_words": {"question": "|a| et |b|", "answers": words[:2]},
+        "match_elements": {words[0]: words[1], words[2]: words[3]},
+        "chronological_order": {"ordered": words},
+    }[question_type]
+    return SimpleNamespace(id=question_id, updated_at=None, type=question_type, exercise=exercise)
+
+def synthetic_answer(question: SimpleNamespace, rng: random.Random) -> dict:
+    exercise = question.exercise
+    # Une réponse sur deux avec casse et espaces modifiés, une sur quatre fausse
+    vary = (lambda text: f"  {text.upper()} ") if rng.random() < 0.5 else (lambda text: text)
+    wrong = rng.random() < 0.25
+    if question.type == "question":
+        return {"answer": "faux" if wrong else vary(exercise["answer"])}
+    if question.type == "mcq":
+        return {"choices": [exercise["choices"][1 if wrong else 0]]}
+    if question.type == "missing_words":
+        return {"answers": [vary(word) for word in reversed(exercise["answers"])] if wrong else [vary(word) for word in exercise["answers"]]}
+    if question.type == "match_elements":
+        values = list(exercise.values())
+        return dict(zip(exercise.keys(), reversed(values) if wrong else values))
+    return {"answer": list(reversed(exercise["ordered"])) if wrong else [vary(element) for element in exercise["ordered"]]}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=2000)
+    parser.add_argument("--answers", type=int, default=200_000)
+    parser.add_argument("--fuzzy-threshold", type=float, default=None)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    questions = [synthetic_question(question_id, rng) for question_id in range(1, args.questions + 1)]
+    answers = [(question, synthetic_answer(question, rng)) for question in (rng.choice(questions) for _ in range(args.answers))]
+
+    start = time.perf_counter()
+    uncached = sum(compile_grader(question.type, question.exercise, args.fuzzy_threshold)(data) for question, data in answers)
+    uncached_seconds = time.perf_counter() - start
+
+    cache = GraderCache(fuzzy_threshold=args.fuzzy_threshold)
+    start = time.perf_counter()
+    cached = sum(grade_answer(question, data, cache) for question, data in answers)
+    cached_seconds = time.perf_counter() - start
+
+    assert cached == uncached
+    print(f"{args.answers} answers to {args.questions} questions, {cached} correct")
+    print(f"{'compiled per answer':<24}{uncached_seconds:>10.3f} s{uncached_seconds / args.answers * 1e6:>10.2f} µs/answer")
+    print(f"{'cached graders':<24}{cached_seconds:>10.3f} s{cached_seconds / args.answers * 1e6:>10.2f} µs/answer")
+
+if __name__ == "__main__":
+    main()
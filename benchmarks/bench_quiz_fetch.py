@@ -0,0 +1,81 @@
+"""Latency of GET /api/quiz/{n} once the previous quiz is answered: composed inside the request (before)
+or composed in advance after the last answer and only activated by the request (after).
+
+Needs the configured PostgreSQL database. Run from the repository root:
+
+    python -m benchmarks.bench_quiz_fetch --questions 5000 --iterations 200
+
+A throwaway account, patient and questions are created, and removed at the end.
+"""
+import argparse
+import statistics
+import time
+import numpy as np
+from sqlalchemy import delete, func, select, update
+from sqlmodel import Session
+from app.dependencies import engine
+from app.models.model_tables import Account, LeitnerParameters, Patient, Question, Quiz, QuizQuestion, Result
+from app.crud.crud_quiz import activate_pending_quiz, compose_pending_quiz, create_leitner_quiz, get_latest_quiz_remaining_questions
+
+def answer_quiz(session: Session, quiz_id: int, result_id: int) -> None:
+    session.execute(update(QuizQuestion).where(QuizQuestion.quiz_id == quiz_id).values(result_id=result_id, box_number=2))
+    session.commit()
+
+def fetch(session: Session, account: Account, number_of_questions: int, pending: bool) -> tuple[int, float]:
+    start = time.perf_counter()
+    # Même enchaînement que read_leitner_quiz_route
+    quiz = get_latest_quiz_remaining_questions(account, session, "http://bench/")
+    if quiz is None and pending:
+        quiz = activate_pending_quiz(number_of_questions, account, session, "http://bench/")
+    if quiz is None:
+        quiz = create_leitner_quiz(number_of_questions, account, session, "http://bench/")
+    return quiz.id, (time.perf_counter() - start) * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=5000)
+    parser.add_argument("--quiz-size", type=int, default=10)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    with Session(engine, expire_on_commit=False) as session:
+        if not session.exec(select(func.count(LeitnerParameters.box_number))).scalar():
+            session.add_all(LeitnerParameters(box_number=box_number, leitner_delay="0 seconds") for box_number in range(1, 8))
+        patient = Patient(firstname="Bench", lastname="Quiz", birthday="1940-01-01")
+        session.add(patient)
+        session.flush()
+        # Délais nuls : les questions déjà posées restent candidates, comme une base en usage depuis longtemps
+        account = Account(username=f"bench_quiz_{time.time_ns()}", password_hash="-", patient_id=patient.id, leitner_delays=[0] * 7)
+        session.add(account)
+        session.flush()
+        session.add_all(Question(type="question", category="bench", exercise={"question": f"Question {i} ?", "answer": "Oui"}, account_id=account.id) for i in range(args.questions))
+        result = Result(data={"answer": "Oui"}, is_correct=True)
+        session.add(result)
+        session.commit()
+
+        try:
+            timings = {}
+            for label, pending in (("composed in the GET", False), ("pre-built, activated", True)):
+                timings[label] = []
+                for _ in range(args.iterations):
+                    if pending:
+                        # Travail fait en tâche de fond après la dernière réponse, hors mesure
+                        compose_pending_quiz(account.id, patient.id, args.quiz_size)
+                    quiz_id, milliseconds = fetch(session, account, args.quiz_size, pending)
+                    timings[label].append(milliseconds)
+                    answer_quiz(session, quiz_id, result.id)
+        finally:
+            session.rollback()
+            session.execute(delete(Quiz).where(Quiz.patient_id == patient.id))
+            session.execute(delete(Account).where(Account.id == account.id))
+            session.execute(delete(Patient).where(Patient.id == patient.id))
+            session.execute(delete(Result).where(Result.id == result.id))
+            session.commit()
+
+    print(f"{args.questions} questions, quizzes of {args.quiz_size}, {args.iterations} fetches each")
+    print(f"{'GET /api/quiz/{n}':<24}{'p50 (ms)':>10}{'p99 (ms)':>10}{'max (ms)':>10}")
+    for label, values in timings.items():
+        print(f"{label:<24}{statistics.median(values):>10.2f}{float(np.percentile(values, 99)):>10.2f}{max(values):>10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Compares the NumPy clustering engine with the SQL all-pairs query at several data sizes.
+
+The NumPy engine alone runs without any database:
+
+    python -m benchmarks.bench_raw_data_clustering --sizes 500 1000 2000 5000
+
+With --sql, both backends run end to end against the configured PostgreSQL database
+(LLM_ENABLED=True, pgvector installed). The rows are inserted for a throwaway account
+inside a transaction that is rolled back afterwards.
+"""
+import argparse
+import time
+import numpy as np
+from app.crud.crud_clustering import find_disjoint_clusters
+
+def synthetic_embeddings(rows: int, dimensions: int, rng: np.random.Generator) -> np.ndarray:
+    centers = rng.normal(size=(max(1, rows // 10), dimensions))
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    embeddings = centers[rng.integers(0, len(centers), rows)] + 0.02 * rng.normal(size=(rows, dimensions))
+    return (embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)).astype(np.float32)
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def bench_sql(embeddings: np.ndarray):
+    from sqlmodel import Session
+    from app.dependencies import engine
+    from app.models.model_tables import Account, RawData
+    from app.crud.crud_questions import get_raw_data_cluster_sql
+    from app.crud.crud_clustering import get_raw_data_clusters_numpy
+
+    with Session(engine) as session:
+        account = Account(username=f"bench_clustering_{time.time_ns()}", password_hash="-")
+        session.add(account)
+        session.flush()
+        session.add_all([RawData(account_id=account.id, text="bench", embedding=embedding) for embedding in embeddings])
+        session.flush()
+        sql_cluster, sql_seconds = timed(get_raw_data_cluster_sql, session, account)
+        numpy_clusters, numpy_seconds = timed(get_raw_data_clusters_numpy, session, account)
+        session.rollback()
+    return sql_seconds, len(sql_cluster) > 0, numpy_seconds, len(numpy_clusters)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 1000, 2000, 5000])
+    parser.add_argument("--dimensions", type=int, default=768)
+    parser.add_argument("--sql", action="store_true", help="also run both backends against the database")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    if args.sql:
+        print(f"{'rows':>8}{'sql, 1 cluster (s)':>22}{'numpy, all clusters (s)':>26}{'clusters':>10}")
+    else:
+        print(f"{'rows':>8}{'numpy engine, all clusters (s)':>32}{'clusters':>10}")
+    for size in args.sizes:
+        embeddings = synthetic_embeddings(size, args.dimensions, rng)
+        if args.sql:
+            sql_seconds, _, numpy_seconds, clusters = bench_sql(embeddings)
+            print(f"{size:>8}{sql_seconds:>22.3f}{numpy_seconds:>26.3f}{clusters:>10}")
+        else:
+            clusters, seconds = timed(find_disjoint_clusters, embeddings)
+            print(f"{size:>8}{seconds:>32.3f}{len(clusters):>10}")
+
+if __name__ == "__main__":
+    main()
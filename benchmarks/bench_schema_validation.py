@@ -0,0 +1,52 @@
+"""Per-request JSON Schema validation cost, before (jsonschema.validate) and after (validators compiled once):
+
+    python -m benchmarks.bench_schema_validation --iterations 20000
+"""
+import argparse
+import json
+import os
+import time
+from jsonschema import validate
+from app.config import json_schema_dir
+from app.json_schemas import compile_validator, check_instance
+
+INSTANCES = {
+    "questions": {
+        "question": {"question": "Quel est le plus grand océan du monde ?", "answer": "Pacifique"},
+        "mcq": {"question": "Capitale de la France ?", "choices": ["Paris", "Lyon", "Nice"], "answer": "Paris"},
+        "missing_words": {"question": "Le |Sahara| est en |Afrique|.", "answers": ["Sahara", "Afrique"]},
+        "match_elements": {"Chien": "Animal de compagnie", "Paris": "Capitale de la France"},
+        "chronological_order": {"ordered": ["Révolution", "Empire", "Restauration"]},
+    },
+    "answers": {
+        "question": {"answer": "Pacifique"},
+        "mcq": {"choices": ["Paris"]},
+        "missing_words": {"answers": ["Sahara", "Afrique"]},
+        "match_elements": {"Chien": "Animal de compagnie", "Paris": "Capitale de la France"},
+        "chronological_order": {"answer": ["Révolution", "Empire", "Restauration"]},
+    },
+}
+
+def per_call(func, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'schema':<32}{'validate (µs)':>16}{'compiled (µs)':>16}{'speedup':>10}")
+    for kind, instances in INSTANCES.items():
+        for schema_name, instance in instances.items():
+            with open(os.path.join(json_schema_dir, kind, f"{schema_name}.json")) as file:
+                schema = json.load(file)
+            validator = compile_validator(schema)
+            before = per_call(lambda: validate(instance=instance, schema=schema), args.iterations)
+            after = per_call(lambda: check_instance(validator, instance), args.iterations)
+            print(f"{kind + '/' + schema_name:<32}{before * 1e6:>16.2f}{after * 1e6:>16.2f}{before / after:>9.1f}x")
+
+if __name__ == "__main__":
+    main()